@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+"""
+Interchangeable caches with the same interface as google.appengine.api.memcache
+- get(key), set(key, value, time=0), add(key, value, time=0) and delete(key) -
+so that the front ends (main.py on Python 2/GAE, py3_main.py on Flask) and
+page_cache.PageCache can use whichever suits where they're running:
+
+* LRUCache - bounded, in-process.  Fine for a single worker.
+* SharedFileCache - one file per key in a directory, read via mmap, so that
+  multiple worker processes on the same machine share a cache.
+* MemcachedClient - talks the memcached text protocol, to a real memcached
+  or memcache_test_server.py.
+* GAEMemcache - wraps the App Engine memcache API.
+
+As with memcache, time is an expiry - 0 meaning never, values up to 30 days
+being relative and anything bigger an absolute epoch - values are pickled
+(so callers always get a copy, not the object they stored), add() only sets
+a key if it's not already there (so can be used as a lock), and delete()
+returns 2 if the key was deleted, 1 if it wasn't there and 0 on failure.
+Failures to talk to the cache are logged rather than raised, as a cache
+being unavailable shouldn't break a page.
+
+get_cache() picks a backend based on the CACHE_BACKEND environment
+variable.
+
+Has to be usable under Python 2.
+"""
+
+from collections import OrderedDict
+import hashlib
+import logging
+import math
+import mmap
+import os
+import pickle
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError: # e.g. Windows
+    fcntl = None
+
+DEFAULT_MAX_ITEMS = 1000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SHARED_DIR = os.path.join(os.path.dirname(__file__), 'intermediate_data',
+                                  'shared_cache')
+DEFAULT_MEMCACHED_HOST = '127.0.0.1'
+DEFAULT_MEMCACHED_PORT = 11211
+
+# Same cut-off as memcached uses to decide if an expiry is relative
+MAX_RELATIVE_TIME = 60 * 60 * 24 * 30
+
+PICKLE_PROTOCOL = 2 # Highest that Python 2 understands
+
+DELETE_FAILED, DELETE_MISSING, DELETE_SUCCESSFUL = 0, 1, 2
+
+
+def expiry_epoch(expire_time, now=None):
+    """
+    Convert a memcache-style expiry time to an epoch, or None for never
+    """
+    if not expire_time:
+        return None
+    if expire_time > MAX_RELATIVE_TIME:
+        return expire_time
+    return (now or time.time()) + expire_time
+
+
+def _pickle(value):
+    return pickle.dumps(value, PICKLE_PROTOCOL)
+
+
+class LRUCache(object):
+    """
+    Evicts the least recently used entries once there are more than
+    max_items of them, or their pickled size exceeds max_bytes
+    """
+    def __init__(self, max_items=DEFAULT_MAX_ITEMS, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # key -> (expiry epoch or None, pickled value)
+        self._size = 0
+
+    def _live_entry(self, key):
+        # Caller must hold self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.time():
+            self._remove(key)
+            return None
+        # Mark as most recently used
+        del self._entries[key]
+        self._entries[key] = entry
+        return entry
+
+    def _remove(self, key):
+        self._size -= len(self._entries.pop(key)[1])
+
+    def _store(self, key, expire_time, pickled):
+        # Caller must hold self._lock
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expiry_epoch(expire_time), pickled)
+        self._size += len(pickled)
+        while self._entries and (len(self._entries) > self.max_items or
+                                 self._size > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live_entry(key)
+        if entry is None:
+            return None
+        return pickle.loads(entry[1])
+
+    def set(self, key, value, time=0):
+        pickled = _pickle(value)
+        with self._lock:
+            self._store(key, time, pickled)
+        return True
+
+    def add(self, key, value, time=0):
+        pickled = _pickle(value)
+        with self._lock:
+            if self._live_entry(key) is not None:
+                return False
+            self._store(key, time, pickled)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            if self._live_entry(key) is None:
+                return DELETE_MISSING
+            self._remove(key)
+        return DELETE_SUCCESSFUL
+
+    def flush_all(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        return True
+
+
+class SharedFileCache(object):
+    """
+    Each key is stored in its own file - named after a hash of the key - as
+    an 8 byte expiry epoch (0 for never) followed by the pickled value.
+    Files are written to a temporary name and renamed into place, so readers
+    never see a partly written value, and add() holds an flock() on a lock
+    file so that only one process can succeed.
+    """
+    HEADER = struct.Struct('!d')
+
+    def __init__(self, directory=DEFAULT_SHARED_DIR):
+        self.directory = directory
+        self._thread_lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _filename(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _read(self, key):
+        """
+        Return the pickled value for key, or None if it's missing or expired
+        """
+        try:
+            with open(self._filename(key), 'rb') as inputstream:
+                mapped = mmap.mmap(inputstream.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            # ValueError is mmap's complaint about empty files
+            return None
+        try:
+            if len(mapped) < self.HEADER.size:
+                return None
+            expiry = self.HEADER.unpack_from(mapped)[0]
+            if expiry and expiry <= time.time():
+                return None
+            return mapped[self.HEADER.size:]
+        finally:
+            mapped.close()
+
+    def _write(self, key, value, expire_time):
+        fd, tmp_filename = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as outputstream:
+            outputstream.write(self.HEADER.pack(expiry_epoch(expire_time) or 0))
+            outputstream.write(_pickle(value))
+        # Not os.replace() as that doesn't exist in Python 2
+        os.rename(tmp_filename, self._filename(key))
+
+    def get(self, key):
+        pickled = self._read(key)
+        if pickled is None:
+            return None
+        return pickle.loads(pickled)
+
+    def set(self, key, value, time=0):
+        try:
+            self._write(key, value, time)
+        except (IOError, OSError) as err:
+            logging.warning('Unable to write %s to %s: %s' % (key, self.directory, err))
+            return False
+        return True
+
+    def add(self, key, value, time=0):
+        with self._thread_lock:
+            with open(os.path.join(self.directory, '.lock'), 'a') as lockfile:
+                if fcntl:
+                    fcntl.flock(lockfile, fcntl.LOCK_EX)
+                try:
+                    if self._read(key) is not None:
+                        return False
+                    return self.set(key, value, time)
+                finally:
+                    if fcntl:
+                        fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+    def delete(self, key):
+        # An expired value counts as missing, as with memcache, but its file
+        # is still removed
+        live = self._read(key) is not None
+        try:
+            os.unlink(self._filename(key))
+        except (IOError, OSError):
+            return DELETE_MISSING
+        return DELETE_SUCCESSFUL if live else DELETE_MISSING
+
+    def flush_all(self):
+        for fn in os.listdir(self.directory):
+            if fn != '.lock':
+                try:
+                    os.unlink(os.path.join(self.directory, fn))
+                except (IOError, OSError):
+                    pass
+        return True
+
+
+class MemcachedError(Exception):
+    pass
+
+
+class MemcachedClient(object):
+    """
+    Minimal client for the memcached text protocol, using a single persistent
+    connection (shared between threads, one request at a time)
+    """
+    # Values we store are always pickled - this flag is so that anything else
+    # using the same memcached can tell
+    PICKLED_FLAG = 1
+    MAX_KEY_LENGTH = 250
+
+    def __init__(self, host=DEFAULT_MEMCACHED_HOST, port=DEFAULT_MEMCACHED_PORT,
+                 timeout=3):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.create_connection((self.host, self.port),
+                                                  self.timeout)
+            self._reader = self._sock.makefile('rb')
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except (IOError, OSError):
+                pass
+        self._sock = None
+        self._reader = None
+
+    def _encode_key(self, key):
+        encoded = key.encode('utf-8')
+        if len(encoded) > self.MAX_KEY_LENGTH or \
+           any(c in encoded for c in (b' ', b'\r', b'\n', b'\t', b'\0')):
+            encoded = b'sha1:' + hashlib.sha1(encoded).hexdigest().encode('ascii')
+        return encoded
+
+    def _readline(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise MemcachedError('Connection closed')
+        return line[:-2]
+
+    def _request(self, command, handle_response):
+        """
+        Send command (bytes), returning handle_response(), or None if
+        something went wrong
+        """
+        with self._lock:
+            try:
+                self._connect()
+                self._sock.sendall(command)
+                return handle_response()
+            except (socket.error, IOError, MemcachedError) as err:
+                logging.warning('memcached %s:%s failed: %s' % (self.host, self.port, err))
+                self.close()
+                return None
+
+    def _read_get_response(self):
+        value = None
+        while True:
+            line = self._readline()
+            if line == b'END':
+                return value
+            parts = line.split()
+            if len(parts) < 4 or parts[0] != b'VALUE':
+                raise MemcachedError('Unexpected response %r' % (line))
+            data = self._reader.read(int(parts[3]) + 2)[:-2]
+            if int(parts[2]) & self.PICKLED_FLAG:
+                value = pickle.loads(data)
+            else:
+                value = data
+
+    def _storage_command(self, verb, key, value, expire_time):
+        data = _pickle(value)
+        # memcached only does whole seconds - round up so we don't expire
+        # something immediately
+        exptime = int(math.ceil(expire_time or 0))
+        command = b' '.join([verb, self._encode_key(key),
+                             str(self.PICKLED_FLAG).encode('ascii'),
+                             str(exptime).encode('ascii'),
+                             str(len(data)).encode('ascii')]) + b'\r\n' + data + b'\r\n'
+        return self._request(command, self._readline)
+
+    def get(self, key):
+        return self._request(b'get ' + self._encode_key(key) + b'\r\n',
+                             self._read_get_response)
+
+    def set(self, key, value, time=0):
+        return self._storage_command(b'set', key, value, time) == b'STORED'
+
+    def add(self, key, value, time=0):
+        return self._storage_command(b'add', key, value, time) == b'STORED'
+
+    def delete(self, key):
+        response = self._request(b'delete ' + self._encode_key(key) + b'\r\n',
+                                 self._readline)
+        if response == b'DELETED':
+            return DELETE_SUCCESSFUL
+        elif response == b'NOT_FOUND':
+            return DELETE_MISSING
+        return DELETE_FAILED
+
+    def flush_all(self):
+        return self._request(b'flush_all\r\n', self._readline) == b'OK'
+
+
+class GAEMemcache(object):
+    """
+    Adaptor for google.appengine.api.memcache, which already has the right
+    interface, but isn't importable away from GAE
+    """
+    def __init__(self):
+        from google.appengine.api import memcache
+        self.memcache = memcache
+
+    def get(self, key):
+        return self.memcache.get(key)
+
+    def set(self, key, value, time=0):
+        return self.memcache.set(key, value, time=time)
+
+    def add(self, key, value, time=0):
+        return self.memcache.add(key, value, time=time)
+
+    def delete(self, key):
+        return self.memcache.delete(key)
+
+    def flush_all(self):
+        return self.memcache.flush_all()
+
+
+def make_cache(spec):
+    """
+    Return a new cache from a spec string, one of:
+    * gae
+    * lru
+    * file or file:<directory>
+    * memcached or memcached:<host>[:<port>]
+    """
+    name, _, args = spec.partition(':')
+    if name == 'gae':
+        return GAEMemcache()
+    elif name == 'lru':
+        return LRUCache()
+    elif name == 'file':
+        return SharedFileCache(args or DEFAULT_SHARED_DIR)
+    elif name == 'memcached':
+        host, _, port = args.partition(':')
+        return MemcachedClient(host or DEFAULT_MEMCACHED_HOST,
+                               int(port or DEFAULT_MEMCACHED_PORT))
+    raise ValueError('Unknown cache backend "%s"' % (spec))
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(spec=None):
+    """
+    Return the cache for spec - see make_cache() - defaulting to the
+    CACHE_BACKEND environment variable, or if that isn't set, GAE memcache
+    when running on GAE, and an LRUCache otherwise.  The same object is
+    returned for the same spec, so that e.g. main.py and offline.py share
+    an LRUCache.
+    """
+    if spec is None:
+        spec = os.environ.get('CACHE_BACKEND')
+    if spec is None:
+        try:
+            from google.appengine.api import memcache
+            spec = 'gae'
+        except ImportError:
+            spec = 'lru'
+    with _caches_lock:
+        if spec not in _caches:
+            _caches[spec] = make_cache(spec)
+        return _caches[spec]
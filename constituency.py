@@ -3,13 +3,14 @@
 Originally extracted from ec_data_reader.py
 """
 
+import codecs
 import csv
 import logging
 import pdb
-import re
 import sys
 
 from misc import intify, slugify, CSV_ENCODING
+from normalisation import clean_constituency_name
 
 # ONS Code prefixes - https://en.wikipedia.org/wiki/ONS_coding_system#Current_GSS_coding_system
 COUNTRY_CODE_PREFIXES = {
@@ -29,25 +30,34 @@ else:
 
 
 
-def clean_constituency_name(s):
-    """
-    # Clean up the following (why are they like this???):
-    # ['Brecon and Radnorshire 5', 'Cardiff North 5',
-    # 'Cardiff South and Penarth 5', 'Merthyr Tydfil and Rhymney 5',
-    # 'Ogmore 5', 'Pontypridd 5', 'Vale of Glamorgan 5']
-    # Plus Swansea East6...
-    """
-    name = re.sub('\s*\d+$', '', s.strip())
-
-    # GE-2019-results.csv uses ampersands, turn these into "and" to (a) match
-    # the Electoral Commission data, and (b) make life easier for HTML/SVG/XML
-    name = name.replace('&', 'and')
-
-    return name
-
 class MissingColumnError(Exception):
     pass
 
+# The possible column headings for each field, in order of preference.
+# Note the extraneous spaces, typos and capitalization inconsistencies -
+# the CSV format is not consistent between elections :-(
+ONS_CODE_COLUMNS = ['ONS Code', 'Constituency ID', 'code']
+# Note space at end of second element, also lower case "Association"
+PA_NUMBER_COLUMNS = ['Press association number', 'Press association number ', 'PANO']
+CONSTITUENCY_NAME_COLUMNS = ['Constituency', 'Constituency Name', 'constituency']
+ELECTORATE_COLUMNS = ['Electorate', 'Electorate ', 'electorate'] # Extraneous space is in 2017 data
+# Q: Does "turnout" (in 2019 file) include invalid votes?
+VALID_VOTES_COLUMNS = ['Total number of valid votes counted', 'Valid Votes', 'turnout']
+REGION_COLUMNS = ['Region']
+
+# (field, possible column headings, is the column required?) - the order of
+# these is the order of the values returned by ColumnSchema.row_extractor()
+CONSTITUENCY_FIELDS = [
+    ('ons_code', ONS_CODE_COLUMNS, True),
+    # We don't *currently* use pa_number, so don't blow up if it's not there
+    ('pa_number', PA_NUMBER_COLUMNS, False),
+    ('name', CONSTITUENCY_NAME_COLUMNS, True),
+    ('electorate', ELECTORATE_COLUMNS, True),
+    ('valid_votes', VALID_VOTES_COLUMNS, True),
+    # 2015 CSV has a Region column, 2017 does not.
+    ('region', REGION_COLUMNS, False)
+]
+
 def get_value_from_multiple_possible_keys(dict_from_csv_row, possible_keys,
                                           label='value'):
     for cn in possible_keys:
@@ -60,6 +70,61 @@ def get_value_from_multiple_possible_keys(dict_from_csv_row, possible_keys,
                                  (label, possible_keys))
 
 
+class ColumnSchema(object):
+    """
+    Work out which column each of the fields we are interested in lives in,
+    given the header row of a CSV.  This is the csv.reader equivalent of
+    get_value_from_multiple_possible_keys(), but done once per file rather
+    than once per cell.
+
+    fields is a list of (field name, possible column headings, required)
+    tuples, such as CONSTITUENCY_FIELDS.
+    """
+    def __init__(self, header_row, fields):
+        # If a heading is duplicated, the last one wins, same as csv.DictReader
+        heading_to_index = dict((heading, i) for i, heading in enumerate(header_row))
+        self.fields = [z[0] for z in fields]
+        self.indexes = []
+        for field, possible_keys, required in fields:
+            for cn in possible_keys:
+                if cn in heading_to_index:
+                    self.indexes.append(heading_to_index[cn])
+                    break
+            else:
+                if required:
+                    raise MissingColumnError('Could not find %s, tried %s' %
+                                             (field, possible_keys))
+                self.indexes.append(None)
+
+    def position(self, field):
+        """
+        Return the position of field in the tuples returned by the
+        row_extractor() function
+        """
+        return self.fields.index(field)
+
+    def has_column(self, field):
+        return self.indexes[self.position(field)] is not None
+
+    def row_extractor(self):
+        """
+        Return a function that turns a csv.reader row (a list) into a tuple of
+        stripped values, one per field, with None for any optional fields that
+        don't have a column.
+        """
+        indexes = self.indexes
+        row_length = max(z for z in indexes if z is not None) + 1
+        padding = [''] * row_length
+
+        def extract(row):
+            if len(row) < row_length:
+                # Short rows are treated as having empty trailing cells
+                row = row + padding[len(row):]
+            return tuple([row[i].strip() if i is not None else None
+                          for i in indexes])
+        return extract
+
+
 class Constituency(object):
     """
     Given a CSVReader row for an "ADMINISTRATIVE DATA" or CONSTITUENCY.CSV row,
@@ -69,40 +134,45 @@ class Constituency(object):
     """
 
     def __init__(self, dict_from_csv_row, euref_data=None):
-        self.ons_code = get_value_from_multiple_possible_keys(
-            dict_from_csv_row,
-            ['ONS Code', 'Constituency ID', 'code'],
-            'ONS Code')
+        ons_code = get_value_from_multiple_possible_keys(
+            dict_from_csv_row, ONS_CODE_COLUMNS, 'ONS Code')
         # We don't *currently* use pa_number, so don't blow up if it's not there
         try:
-            self.pa_number = int(get_value_from_multiple_possible_keys(
-                dict_from_csv_row,
-                # Note space at end of second element, also lower case "Association"
-                ['Press association number', 'Press association number ', 'PANO'],
-                'PA Number'))
+            pa_number = get_value_from_multiple_possible_keys(
+                dict_from_csv_row, PA_NUMBER_COLUMNS, 'PA Number')
         except MissingColumnError:
-            self.pa_number = None
-
+            pa_number = None
         name = get_value_from_multiple_possible_keys(
-            dict_from_csv_row,
-            ['Constituency', 'Constituency Name', 'constituency'],
-            'Constituency Name')
+            dict_from_csv_row, CONSTITUENCY_NAME_COLUMNS, 'Constituency Name')
+        electorate = get_value_from_multiple_possible_keys(
+            dict_from_csv_row, ELECTORATE_COLUMNS, 'Electorate')
+        valid_votes = get_value_from_multiple_possible_keys(
+            dict_from_csv_row, VALID_VOTES_COLUMNS, 'Valid Votes')
+        self._setup(ons_code, pa_number, name, electorate, valid_votes,
+                    dict_from_csv_row.get('Region', None), euref_data)
+
+    @classmethod
+    def from_csv_values(cls, values, euref_data=None):
+        """
+        Alternative constructor, taking a tuple of values in the order of
+        CONSTITUENCY_FIELDS, as returned by a ColumnSchema.row_extractor()
+        """
+        con = cls.__new__(cls)
+        con._setup(*values, euref_data=euref_data)
+        return con
+
+    def _setup(self, ons_code, pa_number, name, electorate, valid_votes,
+               region, euref_data=None):
+        self.ons_code = ons_code
+        self.pa_number = int(pa_number) if pa_number is not None else None
         self.name = clean_constituency_name(name)
-
-        self.electorate = intify(get_value_from_multiple_possible_keys(
-            dict_from_csv_row,
-            ['Electorate', 'Electorate ', 'electorate'], # Extraneous space is in 2017 data
-            'Electorate'))
-        self.valid_votes = intify(get_value_from_multiple_possible_keys(
-            dict_from_csv_row,
-            # Q: Does "turnout" (in 2019 file) include invalid votes?
-            ['Total number of valid votes counted', 'Valid Votes', 'turnout'],
-            'Valid Votes'))
+        self.electorate = intify(electorate)
+        self.valid_votes = intify(valid_votes)
 
         # 2015 CSV has a Region column, 2017 does not.
         # However we have to watch out for minor inconsistencies e.g.
         # "Yorkshire and [Th]he Humber"
-        self._region = dict_from_csv_row.get('Region', None)
+        self._region = region
 
         # self.euref = euref_data[self.ons_code]
         self.euref = euref_data or None
@@ -133,20 +203,75 @@ class Constituency(object):
 
 
 
+def looks_like_header_row(row):
+    """
+    Return True if the supplied csv.reader row looks like the header row of
+    an admin or results CSV, which are often preceded by some title lines
+    """
+    row_bits = set([z.strip().lower() for z in row])
+    return 'constituency' in row_bits or 'constituency name' in row_bits
+
+
+class HeaderSniffingReader(object):
+    """
+    Wrapper around csv.reader that skips over any lines before the header row,
+    which is then available as .header - iterating over this object then
+    gives the rows after the header.
+
+    source can be a filename, or a file-like object, which doesn't have to
+    be seekable e.g. sys.stdin or an HTTP response.  (In Python 3, binary
+    streams are decoded using CSV_ENCODING.)  Use this as a context manager
+    to ensure any file that was opened is closed - streams that were passed
+    in are left for the caller to close.
+    """
+    def __init__(self, source, is_header=looks_like_header_row):
+        if hasattr(source, 'read'):
+            self.name = getattr(source, 'name', repr(source))
+            self.stream = source
+            self._owns_stream = False
+            if PYTHON_MAJOR_VERSION > 2 and isinstance(source.read(0), bytes):
+                self.stream = codecs.getreader(CSV_ENCODING)(source)
+        else:
+            self.name = source
+            self.stream = open(source, 'r', **csv_reader_kwargs)
+            self._owns_stream = True
+
+        self.reader = csv.reader(self.stream)
+        self.skipped_lines = 0
+        for row in self.reader:
+            if is_header(row):
+                self.header = row
+                break
+            self.skipped_lines += 1
+        else:
+            self.close()
+            raise IOError('Could not determine skippable lines in %s' % (self.name))
+
+    def __iter__(self):
+        return self.reader
+
+    def close(self):
+        if self._owns_stream:
+            self.stream.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 def sniff_admin_csv_for_ignorable_lines(admin_csv):
     """
     Given an admin CSV, read through the first few lines to work out how
     many are ignorable for the csv.DictReader, and return that number of lines
     (which may well be zero)
-    """
 
-    for skippable_lines, line in enumerate(open(admin_csv, 'r', **csv_reader_kwargs)):
-        line_bits = set([z.strip().lower() for z in line.split(',')])
-        if 'constituency' in line_bits or 'constituency name' in line_bits:
-            # Q: is the file properly closed?  It doesn't seem to matter...
-            return skippable_lines
-        # print(line_bits)
-    raise IOError('Could not determine skippable lines in %s' % (admin_csv))
+    NB: HeaderSniffingReader is preferable if you are going to read the rest
+    of the file, as it avoids opening and reading the start of the file twice.
+    """
+    with HeaderSniffingReader(admin_csv) as reader:
+        return reader.skipped_lines
 
 def is_blank_row(row_dict):
     """
@@ -157,13 +282,13 @@ def is_blank_row(row_dict):
     NB: This (ab)uses the fact that both constituency and results CSVs have
     "Constituency"/"Constituency Name" columns, which might not be the case
     for future files.
+
+    See is_blank_values() for the ColumnSchema equivalent.
     """
 
     try:
         name = get_value_from_multiple_possible_keys(
-            row_dict,
-            ['Constituency', 'Constituency Name', 'constituency'],
-            'Constituency Name')
+            row_dict, CONSTITUENCY_NAME_COLUMNS, 'Constituency Name')
         if name and name != '':
             return False
         else:
@@ -171,25 +296,29 @@ def is_blank_row(row_dict):
     except MissingColumnError:
         return True
 
-    ORIG_CODE = """
-    try:
-        con_name = row_dict['Constituency']
-    except KeyError:
-        con_name = row_dict['Constituency Name']
-    if con_name and con_name != '':
-        return False
-    else:
-        return True
+def is_blank_values(values, name_position):
+    """
+    Equivalent of is_blank_row() for a tuple from a ColumnSchema.row_extractor(),
+    name_position being where the constituency name lives in that tuple (and
+    which will be None if the file has no such column)
     """
+    return not values[name_position]
 
-def get_region_for_constituency(con, con_to_region_map, quiet=False):
+def get_region_for_constituency(con, con_to_region_map, quiet=False,
+                                identity_index=None):
     """
     Given a Constituency object, use any of the various unique IDs to get a
-    region from the provided dictionary.
+    region from the provided dictionary - or from identity_index, if a
+    regions.ConstituencyIdentityIndex is provided.
     """
     if con.country and con.country != 'England':
         return con.country
     poss_keys = [str(getattr(con, prop)) for prop in ('name', 'ons_code', 'pa_number')]
+    if identity_index is not None:
+        for val in poss_keys:
+            ident = identity_index.get(val)
+            if ident is not None and ident.region:
+                return ident.region
     for val in poss_keys:
         try:
             return con_to_region_map[val]
@@ -200,41 +329,57 @@ def get_region_for_constituency(con, con_to_region_map, quiet=False):
     slug = slugify(con.name)
     return con_to_region_map[slug]
 
+def set_constituency_region(con, con_to_region_map, slug_to_canonical_region_map,
+                            quiet=False, identity_index=None):
+    """
+    Populate con.region - either using con_to_region_map (and/or
+    identity_index) if it wasn't in the CSV, or tidying up the region name
+    that was in the CSV.
+    """
+    if not con.region:
+        con.region = get_region_for_constituency(con, con_to_region_map, quiet,
+                                                 identity_index)
+        ORIG = """
+        if con.country == 'England':
+            slug_con = slugify(con.name)
+            try:
+                con.region = con_to_region_map[slug_con]
+            except KeyError as err:
+                logging.error('No region found for %s/%s' % (con.name, slug_con))
+        """
+    else:
+        con.region = slug_to_canonical_region_map[slugify(con.region)]
+
+def canonical_region_map(con_to_region_map):
+    """
+    Return a dict mapping slugified region names to the region names used in
+    con_to_region_map, for tidying up region names that appear in CSVs
+    """
+    regions = set(con_to_region_map.values())
+    return dict((slugify(r), r) for r in regions)
+
 def load_constituencies_from_admin_csv(admin_csv, con_to_region_map, quiet=False):
     """
-    Return a list of Constituency objects
+    Return a list of Constituency objects.
+
+    admin_csv can be a filename or file-like object - see HeaderSniffingReader
     """
     # ons_to_con_map = {}
 
-    regions = set(con_to_region_map.values())
-    slug_to_canonical_region_map = dict((slugify(r), r) for r in regions)
+    slug_to_canonical_region_map = canonical_region_map(con_to_region_map)
 
     ret = []
-    skippable_lines = sniff_admin_csv_for_ignorable_lines(admin_csv)
-
-    with open(admin_csv, 'r', **csv_reader_kwargs) as inputstream:
-        # Ignore the first two rows, the useful headings are on the third row
-        for _ in range(skippable_lines):
-            xxx = inputstream.readline()
-        reader = csv.DictReader(inputstream)
+    # The 2017 file has a couple of lines before the useful headings
+    with HeaderSniffingReader(admin_csv) as reader:
+        schema = ColumnSchema(reader.header, CONSTITUENCY_FIELDS)
+        extract = schema.row_extractor()
+        name_position = schema.position('name')
         for i, row in enumerate(reader):
-            # pdb.set_trace()
-            # Note extraneous trailing space on 'Electorate ' :-(
-            # print("%d %s %s" % (i, row['Constituency'], row['Electorate ']))
-            if not is_blank_row(row):
-                con = Constituency(row)
-                if not con.region:
-                    con.region = get_region_for_constituency(con, con_to_region_map, quiet)
-                    ORIG = """
-                    if con.country == 'England':
-                        slug_con = slugify(con.name)
-                        try:
-                            con.region = con_to_region_map[slug_con]
-                        except KeyError as err:
-                            logging.error('No region found for %s/%s' % (con.name, slug_con))
-                    """
-                else:
-                    con.region = slug_to_canonical_region_map[slugify(con.region)]
+            values = extract(row)
+            if not is_blank_values(values, name_position):
+                con = Constituency.from_csv_values(values)
+                set_constituency_region(con, con_to_region_map,
+                                        slug_to_canonical_region_map, quiet)
                 ret.append(con)
     # return ons_to_con_map
     return ret
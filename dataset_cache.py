@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Persistent on-disk cache of fully built datasets (e.g. the list of
+ConstituencyResult objects - plus their Constituency, CandidateResult and
+EUReferendumResult objects - that ec_data_reader creates from the CSVs).
+
+Each snapshot is a pickle, keyed by a hash of the contents of every source
+file that went into it, so if any of them change, the next load will miss
+the cache and quietly rebuild the snapshot.
+
+Note that on the (Python 2) GAE runtime the filesystem is read-only, so
+snapshots can't be written there - but if you build them locally before
+deploying, they will be picked up from intermediate_data/cache/ as long as
+the source files are the same.
+"""
+
+from glob import glob
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'intermediate_data', 'cache')
+
+# Bump this whenever the pickled classes change in a way that would make
+# old snapshots incompatible, or the parsers change what they produce
+SNAPSHOT_VERSION = 4
+
+PYTHON_MAJOR_VERSION = sys.version_info[0]
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_inputs(filenames, extra=None):
+    """
+    Return a hex digest covering the contents of all the named files, plus
+    any extra (string) values that affect how they are processed.
+    """
+    hasher = hashlib.sha1()
+    hasher.update(('v%d/py%d' % (SNAPSHOT_VERSION, PYTHON_MAJOR_VERSION)).encode('ascii'))
+    for val in (extra or []):
+        hasher.update(('|%s' % (val)).encode('utf-8'))
+    for fn in filenames:
+        hasher.update(('|%s|' % (os.path.basename(fn))).encode('utf-8'))
+        with open(fn, 'rb') as inputstream:
+            while True:
+                block = inputstream.read(HASH_BLOCK_SIZE)
+                if not block:
+                    break
+                hasher.update(block)
+    return hasher.hexdigest()
+
+
+def snapshot_filename(label, key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, '%s-%s.pickle' % (label, key))
+
+
+def load_snapshot(filename):
+    """
+    Return the unpickled contents of filename, or None if it doesn't exist or
+    is unreadable (e.g. truncated, or from an incompatible version of a class)
+    """
+    try:
+        with open(filename, 'rb') as inputstream:
+            return pickle.load(inputstream)
+    except (IOError, OSError):
+        return None
+    except Exception as err:
+        logging.warning('Ignoring unreadable snapshot %s: %s' % (filename, err))
+        return None
+
+
+def save_snapshot(filename, data):
+    """
+    Atomically write data to filename - returns True on success.  Failure
+    (e.g. due to a read-only filesystem) is logged but otherwise ignored, as
+    the snapshot is only an optimization.
+    """
+    dirname = os.path.dirname(filename)
+    try:
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        fd, tmp_filename = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as outputstream:
+            pickle.dump(data, outputstream, pickle.HIGHEST_PROTOCOL)
+        # Not os.replace() as that doesn't exist in Python 2
+        os.rename(tmp_filename, filename)
+        return True
+    except (IOError, OSError) as err:
+        logging.warning('Unable to save snapshot %s: %s' % (filename, err))
+        return False
+
+
+def find_snapshot(label, input_files, extra=None, cache_dir=CACHE_DIR):
+    """
+    Return a tuple of (snapshot filename, data), data being None if there is
+    no usable snapshot for the current contents of input_files
+    """
+    filename = snapshot_filename(label, hash_inputs(input_files, extra), cache_dir)
+    return filename, load_snapshot(filename)
+
+
+def store_snapshot(label, filename, data, cache_dir=CACHE_DIR):
+    """
+    Save data to filename - as returned by find_snapshot() - and remove any
+    older snapshots with the same label.  Returns True if it was saved.
+    """
+    if not save_snapshot(filename, data):
+        return False
+    # Tidy up any snapshots made from earlier versions of the inputs
+    for old_filename in glob(snapshot_filename(label, '*', cache_dir)):
+        if old_filename != filename:
+            try:
+                os.remove(old_filename)
+            except OSError:
+                pass
+    return True
+
+
+def cached(label, input_files, builder, extra=None, cache_dir=CACHE_DIR):
+    """
+    Return the result of calling builder() - or an earlier pickled result of
+    doing so, provided none of input_files have changed since.
+
+    label is just to make the snapshot filenames a bit more meaningful, but
+    it must be unique for each different builder.
+    """
+    filename, data = find_snapshot(label, input_files, extra, cache_dir)
+    if data is not None:
+        return data
+    logging.info('No snapshot for %s, rebuilding' % (label))
+    data = builder()
+    store_snapshot(label, filename, data, cache_dir)
+    return data
@@ -6,7 +6,7 @@ This is for the 2017 CSV data, the 2015 version is a slightly different format.
 TODO: support 2015, ideally having as much common code as possible
 """
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import csv
 from decimal import Decimal
 import json
@@ -18,13 +18,20 @@ import sys
 
 PYTHON_MAJOR_VERSION = sys.version_info[0]
 
-from misc import slugify, intify, percentify, CSV_ENCODING
-from canonical_party_names import CANONICAL_PARTY_NAMES
-from regions import (COUNTRY_CODE_PREFIXES, load_region_data,
-                     constituency_name_to_region, constituency_id_mappings)
+from misc import (slugify, intify, percentify, basis_points, lazy_property,
+                  CSV_ENCODING)
+from party_registry import PARTY_REGISTRY
+from regions import (COUNTRY_CODE_PREFIXES, load_region_data, region_service,
+                     constituency_name_to_region, constituency_id_mappings,
+                     load_identity_index)
 from constituency import (Constituency, get_value_from_multiple_possible_keys,
-                          MissingColumnError, is_blank_row,
+                          MissingColumnError, is_blank_row, is_blank_values,
+                          ColumnSchema, CONSTITUENCY_NAME_COLUMNS,
+                          CONSTITUENCY_FIELDS, HeaderSniffingReader,
+                          sniff_admin_csv_for_ignorable_lines,
+                          set_constituency_region, canonical_region_map,
                           load_constituencies_from_admin_csv)
+from euref_data_reader import load_and_process_euref_data
 
 if PYTHON_MAJOR_VERSION == 2:
     # appengine/py2 doesn't like encoding argument
@@ -41,54 +48,102 @@ ADMIN_CSV = os.path.join('source_data', '2017 UKPGE electoral data 3.csv')
 RESULTS_CSV = os.path.join('source_data', '2017 UKPGE electoral data 4.csv')
 
 
+# See constituency.CONSTITUENCY_FIELDS for the background to these
+CANDIDATE_ONS_CODE_COLUMNS = ['ONS Code', 'Constituency ID', 'Constituency ID ', 'code']
+PARTY_COLUMNS = ['Party Identifier', 'Party Identifer', 'Party name identifier', 'party']
+VOTES_COLUMNS = ['Valid votes', 'Votes']
 
+CANDIDATE_FIELDS = [
+    ('ons_code', CANDIDATE_ONS_CODE_COLUMNS, True),
+    # Only used by is_blank_values()
+    ('name', CONSTITUENCY_NAME_COLUMNS, False),
+    ('party', PARTY_COLUMNS, True),
+    ('votes', VOTES_COLUMNS, True)
+]
 
-        return COUNTRY_CODE_PREFIXES[prefix]
+class CandidateResult(object):
+    def __init__(self, dict_from_csv_row, ons_to_con_map):
+        ons_code = get_value_from_multiple_possible_keys(
+            dict_from_csv_row, CANDIDATE_ONS_CODE_COLUMNS, 'ONS Code')
+        raw_party = get_value_from_multiple_possible_keys(
+            dict_from_csv_row, PARTY_COLUMNS, 'Party ID')
+        votes = get_value_from_multiple_possible_keys(
+            dict_from_csv_row, VOTES_COLUMNS, 'Votes')
+        self._setup(ons_to_con_map[ons_code], raw_party, votes)
+        # TODO (maybe?): Candidate name
 
-    @property
-    def country_and_region(self):
-        if self.region:
-            return '%s - %s' % (self.country, self.region)
-        else:
-            return self.country
+    @classmethod
+    def from_csv_values(cls, values, ons_to_con_map):
+        """
+        Alternative constructor, taking a tuple of values in the order of
+        CANDIDATE_FIELDS, as returned by a ColumnSchema.row_extractor()
+        """
+        ons_code, _, raw_party, votes = values
+        can_res = cls.__new__(cls)
+        can_res._setup(ons_to_con_map[ons_code], raw_party, votes)
+        return can_res
+
+    @classmethod
+    def from_values(cls, constituency, party_id, valid_votes):
+        """
+        Alternative constructor for when the party is already a
+        PARTY_REGISTRY ID and the votes are already an int
+        """
+        can_res = cls.__new__(cls)
+        can_res.constituency = constituency
+        can_res.party_id = party_id
+        can_res.valid_votes = valid_votes
+        return can_res
+
+    def _setup(self, constituency, raw_party, votes):
+        self.constituency = constituency
+        self.party_id = PARTY_REGISTRY.intern(raw_party)
+        self.valid_votes = intify(votes)
 
-    def __repr__(self):
-        return '%s (Electorate=%d)' % (self.name, self.electorate)
+    @property
+    def party(self):
+        """
+        Canonical party name
+        """
+        return PARTY_REGISTRY.name(self.party_id)
 
+    @property
+    def party_slug(self):
+        return PARTY_REGISTRY.slug(self.party_id)
 
+    # Party IDs are only valid for the current process, so pickle the name
+    # and re-intern it when unpickling
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['party'] = self.party
+        del state['party_id']
+        return state
 
-class CandidateResult(object):
-    def __init__(self, dict_from_csv_row, ons_to_con_map):
-        ons_code = get_value_from_multiple_possible_keys(
-            dict_from_csv_row,
-            ['ONS Code', 'Constituency ID', 'Constituency ID ', 'code'],
-            'ONS Code')
-        self.constituency = ons_to_con_map[ons_code]
-        raw_party = get_value_from_multiple_possible_keys(
-            dict_from_csv_row,
-            ['Party Identifier', 'Party Identifer', 'Party name identifier', 'party'],
-            'Party ID')
-        self.party = CANONICAL_PARTY_NAMES.get(raw_party, raw_party)
-        self.valid_votes = intify(get_value_from_multiple_possible_keys(
-            dict_from_csv_row,
-            ['Valid votes', 'Votes'],
-            'Votes'))
-        # TODO (maybe?): Candidate name
+    def __setstate__(self, state):
+        state = state.copy()
+        state['party_id'] = PARTY_REGISTRY.intern(state.pop('party'))
+        self.__dict__.update(state)
 
     def __repr__(self):
         return '%s got %d votes in %s' % (self.party, self.valid_votes,
                                           self.constituency)
 
 class ConstituencyResult(object):
-    def __init__(self, results):
-        self.results = sorted(results, key=lambda z: z.valid_votes,
-                              reverse=True)
+    def __init__(self, results, presorted=False):
+        """
+        Set presorted if results is a list that is already in descending
+        order of votes
+        """
+        if presorted:
+            self.results = results
+        else:
+            self.results = sorted(results, key=lambda z: z.valid_votes,
+                                  reverse=True)
         # Q: How is the winner indicated if there was a tie?  Does the
         # returning officer add 1 to the winner?
         self.winning_result = self.results[0]
         self.constituency = self.winning_result.constituency
-        self.winning_party = self.winning_result.party
 
         if len(self.results) > 1:
             self.winning_margin = self.winning_result.valid_votes - \
@@ -97,15 +152,37 @@ class ConstituencyResult(object):
             # Highly unlikely to happen, but you never know...
             self.winning_margin = self.winning_result.valid_votes
 
+    @property
+    def winning_party_id(self):
+        return self.winning_result.party_id
+
+    @property
+    def winning_party(self):
+        return self.winning_result.party
+
+    # The percentages below are only calculated if and when they are first
+    # read, as most users only need a few of them, if any.  The *_bp versions
+    # are integer basis points, for when you don't need a Decimal.
+
+    @lazy_property
+    def turnout_pc(self):
         # Q: Technically turnout includes invalid votes?
-        self.turnout_pc = Decimal(100 * self.constituency.valid_votes / self.constituency.electorate)
+        return Decimal(100 * self.constituency.valid_votes / self.constituency.electorate)
+
+    @lazy_property
+    def turnout_bp(self):
+        return basis_points(self.constituency.valid_votes, self.constituency.electorate)
 
+    @lazy_property
+    def margin_pc(self):
         # Q: should this be divided by valid_votes, not electorate?
         #    That seems to be what Wikipedia are using e.g. Tottenham 2017
         #    has 70.1% majority on Wikipedia, but only ~47% using electorate
-        self.margin_pc = Decimal(100 * self.winning_margin / self.constituency.electorate)
-        self.margin_pc = Decimal(100 * self.winning_margin / self.constituency.valid_votes)
+        return Decimal(100 * self.winning_margin / self.constituency.valid_votes)
 
+    @lazy_property
+    def margin_bp(self):
+        return basis_points(self.winning_margin, self.constituency.valid_votes)
 
     def __repr__(self):
         return '%s won %s by %d votes' % (self.winning_party, self.constituency,
@@ -123,19 +200,89 @@ def sniff_results_csv_for_ignorable_lines(results_csv):
     Note this is currently functionally identical to sniff_admin_csv_for_ignorable_lines()
     due to both files having Constituency/Constituency Name columns.
     """
+    return sniff_admin_csv_for_ignorable_lines(results_csv)
 
-    for skippable_lines, line in enumerate(open(results_csv, 'r', **csv_reader_kwargs)):
-        line_bits = set([z.strip().lower() for z in line.split(',')])
-        if 'constituency' in line_bits or 'constituency name' in line_bits:
-            # Q: is the file properly closed?  It doesn't seem to matter...
-            return skippable_lines
-        # print(line_bits)
-    raise IOError('Could not determine skippable lines in %s' % (results_csv))
 
+class OutOfOrderResultsError(ValueError):
+    pass
+
+def iter_candidate_results(results_csv, ons_to_con_map):
+    """
+    Generator of CandidateResult objects, one for each (non-blank) row of
+    results_csv, which can be a filename or file-like object - see
+    constituency.HeaderSniffingReader
+    """
+    with HeaderSniffingReader(results_csv) as reader:
+        schema = ColumnSchema(reader.header, CANDIDATE_FIELDS)
+        extract = schema.row_extractor()
+        name_position = schema.position('name')
+        for row in reader:
+            values = extract(row)
+            if not is_blank_values(values, name_position):
+                yield CandidateResult.from_csv_values(values, ons_to_con_map)
+
+# How many of the most recently completed constituencies
+# iter_constituency_results() remembers, to check for out of order rows
+COMPLETED_HISTORY = 100
+
+def iter_constituency_results(results_csv, ons_to_con_map, buffer_size=1):
+    """
+    Generator of ConstituencyResult objects, each of which is yielded as soon
+    as all of its candidates' rows have been read.
+
+    The Electoral Commission results CSVs are grouped by constituency, so by
+    default (buffer_size=1) a constituency is complete as soon as a row for a
+    different constituency is read.  For files that aren't grouped, buffer_size
+    is how many constituencies can be "in progress" at once - when that is
+    exceeded, whichever one least recently had a row read is considered
+    complete.  buffer_size=None means no limit, in which case nothing is
+    yielded until the whole file has been read.
+
+    Raises OutOfOrderResultsError if a row turns up for a constituency that
+    has already been yielded - at least for the most recent COMPLETED_HISTORY
+    (or buffer_size, if bigger) of them, so that memory use stays bounded.
+    """
+    if buffer_size is not None and buffer_size < 1:
+        raise ValueError('buffer_size must be at least 1, not %s' % (buffer_size))
+    return _iter_constituency_results(results_csv, ons_to_con_map, buffer_size)
+
+def _iter_constituency_results(results_csv, ons_to_con_map, buffer_size):
+    pending = OrderedDict() # ONS code -> list of CandidateResult
+    completed = OrderedDict() # ONS code -> None, oldest first
+    max_completed = max(COMPLETED_HISTORY, buffer_size or 0)
+    latest_ons = None
+    for can_res in iter_candidate_results(results_csv, ons_to_con_map):
+        ons = can_res.constituency.ons_code
+        if ons == latest_ons:
+            pending[ons].append(can_res)
+            continue
+        if ons in pending:
+            # Move to the end, so it's not the next to be considered complete
+            pending[ons] = pending.pop(ons)
+            pending[ons].append(can_res)
+        elif ons in completed:
+            raise OutOfOrderResultsError(
+                'Results for %s found after it was considered complete - try a '
+                'bigger buffer_size than %s' % (can_res.constituency, buffer_size))
+        else:
+            pending[ons] = [can_res]
+            if buffer_size is not None and len(pending) > buffer_size:
+                done_ons, done_results = pending.popitem(last=False)
+                completed[done_ons] = None
+                if len(completed) > max_completed:
+                    completed.popitem(last=False)
+                yield ConstituencyResult(done_results)
+        latest_ons = ons
+
+    for done_results in pending.values():
+        yield ConstituencyResult(done_results)
 
 def load_and_process_data(admin_csv, results_csv, regions, euref_data=None):
     """
     Return a list of ConstituencyResult objects
+
+    admin_csv and results_csv can be filenames or file-like objects - see
+    constituency.HeaderSniffingReader
     """
     con_to_region = constituency_name_to_region(regions)
 
@@ -148,22 +295,10 @@ def load_and_process_data(admin_csv, results_csv, regions, euref_data=None):
         if euref_data:
             con.euref = euref_data[con.ons_code]
 
-    raw_results = defaultdict(list)
-    skippable_lines = sniff_results_csv_for_ignorable_lines(results_csv)
-    with open(results_csv, 'r', **csv_reader_kwargs) as inputstream:
-        for _ in range(skippable_lines):
-            xxx = inputstream.readline()
-        reader = csv.DictReader(inputstream)
-        for i, row in enumerate(reader):
-            if not is_blank_row(row):
-                can_res = CandidateResult(row, ons_to_con_map)
-                raw_results[can_res.constituency.ons_code].append(can_res)
-
-
-    processed_results = []
-    # Not sure whether this sort gives better results than the one below
-    for _, raw_res in raw_results.items():
-        processed_results.append(ConstituencyResult(raw_res))
+    # No buffer limit, as we don't know for sure that every file is grouped
+    # by constituency
+    processed_results = iter_constituency_results(results_csv, ons_to_con_map,
+                                                  buffer_size=None)
 
     # Python 3 IIRC honours the insert order of a dict, so we didn't need to sort
     # Python 2 doesn't, hence the sorted() here to ensure some consistency
@@ -172,60 +307,69 @@ def load_and_process_data(admin_csv, results_csv, regions, euref_data=None):
     return sorted(processed_results, key=lambda z: z.constituency.name)
     # return processed_results
 
-def load_and_process_data_2019(data_csv, regions, euref_data=None):
-    """
-    Return a list of ConstituencyResult objects.
+# The per-party vote columns in GE-2019-results.csv
+WIDE_FORMAT_PARTY_COLUMNS = 'all,brx,con,dup,grn,ind,lab,lib,oth,plc,sdl,snf,snp,spk,ukp,uup'.split(',')
 
-    TODO: this is a dirty hack of the above function, properly refactor
+def iter_wide_format_results(data_csv, euref_data=None):
     """
-    regions = load_region_data() # NOTE WE GET RID OF THE COUNTRY HACKS!!!!!
-    con_name_to_ids = constituency_id_mappings()
-    con_to_region = constituency_name_to_region(regions, key_mappings=con_name_to_ids)
+    Generator of ConstituencyResult objects from a "wide" CSV that has a row
+    per constituency, with the votes for each party in its own column.
+    Parties that got no votes in a constituency are omitted from its results.
 
-    constituency_list = load_constituencies_from_admin_csv(data_csv, con_to_region)
-
-    ons_to_con_map = {}
-    for con in constituency_list:
-        ons = con.ons_code
-        ons_to_con_map[ons] = con
-        if euref_data:
-            con.euref = euref_data[con.ons_code]
-
-    raw_results = defaultdict(list)
-    # skippable_lines = sniff_results_csv_for_ignorable_lines(results_csv)
-    skippable_lines = 0
-    with open(data_csv, 'r', **csv_reader_kwargs) as inputstream:
-        for _ in range(skippable_lines):
-            xxx = inputstream.readline()
-        reader = csv.DictReader(inputstream)
-        for i, row in enumerate(reader):
-            if not is_blank_row(row):
-                unsorted_results = []
-                for party in 'all,brx,con,dup,grn,ind,lab,lib,oth,plc,sdl,snf,snp,spk,ukp,uup'.split(','):
-                    fake_row_dict = {
-                        'code': row['code'],
-                        'constituency': row['constituency'],
-                        'party': party,
-                        'Valid votes': row[party]
-                        }
-                    can_res = CandidateResult(fake_row_dict, ons_to_con_map)
-                    unsorted_results.append(can_res)
-                raw_results[can_res.constituency.ons_code] = sorted(
-                    unsorted_results,
-                    key=lambda z:-z.valid_votes)
-
-
-    processed_results = []
-    # Not sure whether this sort gives better results than the one below
-    for _, raw_res in raw_results.items():
-        processed_results.append(ConstituencyResult(raw_res))
+    data_csv can be a filename or file-like object - see
+    constituency.HeaderSniffingReader
+    """
+    # This has all the constituency IDs and regions, so we don't need any
+    # other region data
+    identity_index = load_identity_index()
+    con_to_region = identity_index.region_map()
+    slug_to_canonical_region_map = canonical_region_map(con_to_region)
+
+    with HeaderSniffingReader(data_csv) as reader:
+        schema = ColumnSchema(reader.header, CONSTITUENCY_FIELDS)
+        extract = schema.row_extractor()
+        name_position = schema.position('name')
+        party_columns = [(i, PARTY_REGISTRY.intern(heading))
+                         for i, heading in enumerate(reader.header)
+                         if heading in WIDE_FORMAT_PARTY_COLUMNS]
+        vote_indexes = [z[0] for z in party_columns]
+        parties = [z[1] for z in party_columns]
+        row_length = len(reader.header)
+        padding = [''] * row_length
+
+        for row in reader:
+            if len(row) < row_length:
+                # As per ColumnSchema.row_extractor(), short rows are treated
+                # as having empty trailing cells
+                row = row + padding[len(row):]
+            values = extract(row)
+            if is_blank_values(values, name_position):
+                continue
+            con = Constituency.from_csv_values(values)
+            set_constituency_region(con, con_to_region,
+                                    slug_to_canonical_region_map,
+                                    identity_index=identity_index)
+            if euref_data:
+                con.euref = euref_data[con.ons_code]
+
+            # Empty vote cells are no votes, so that party gets omitted
+            party_votes = [(party, intify(row[i]) if row[i].strip() else 0)
+                           for party, i in zip(parties, vote_indexes)]
+            # sort() is stable, so any ties remain in column order
+            party_votes.sort(key=lambda z: z[1], reverse=True)
+            results = [CandidateResult.from_values(con, party, votes)
+                       for party, votes in party_votes if votes]
+            yield ConstituencyResult(results, presorted=True)
 
-    # Python 3 IIRC honours the insert order of a dict, so we didn't need to sort
-    # Python 2 doesn't, hence the sorted() here to ensure some consistency
-    # Note that this ordering differs from the one that was inherited from the
-    # CSV (which I think was region, then constituency name)
-    return sorted(processed_results, key=lambda z: z.constituency.name)
-    # return processed_results
+def load_and_process_data_2019(data_csv, regions, euref_data=None):
+    """
+    Return a list of ConstituencyResult objects, from a "wide" CSV - see
+    iter_wide_format_results().  regions is not used, but is kept for
+    consistency with load_and_process_data()
+    """
+    # Consistent with load_and_process_data()
+    return sorted(iter_wide_format_results(data_csv, euref_data),
+                  key=lambda z: z.constituency.name)
 
 
 if __name__ == '__main__':
@@ -236,14 +380,16 @@ if __name__ == '__main__':
     if len(sys.argv) > 2:
         results_csv = sys.argv[2]
 
-    region_data = load_region_data(add_on_countries=True)
+    region_data = region_service().region_data(add_on_countries=True)
 
-    from euref_data_reader import load_and_process_euref_data
     euref_data = load_and_process_euref_data()
 
     if admin_csv == results_csv:
         results = load_and_process_data_2019(admin_csv, region_data, euref_data)
     else:
+        if results_csv == '-':
+            # e.g. curl ... | ./ec_data_reader.py admin.csv -
+            results_csv = sys.stdin
         results = load_and_process_data(admin_csv, results_csv, region_data, euref_data)
     print(results[0])
     print(results[0].constituency)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Registry of the parsers for the various General Election data formats, so
+that callers can just do load_election(2019) rather than having to know which
+files and which ec_data_reader function to use for a particular year.
+
+Each year in ge_config.GENERAL_ELECTIONS declares its 'format', which is the
+name a parser was registered under via register_format().  Adding a new
+election should then just be a case of adding its config, plus registering a
+new parser if the data is in yet another format.
+
+Nothing is loaded until load_election() is called, and each election is only
+loaded once per process (and is also cached on disk - see dataset_cache.py).
+load_all_elections() does the same for several years at once, parsing any that
+aren't cached on disk in parallel worker processes.
+"""
+
+import pickle
+import sys
+import threading
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError: # Python 2, where years are just parsed one at a time
+    ProcessPoolExecutor = None
+
+from ge_config import GENERAL_ELECTIONS
+from dataset_cache import cached, find_snapshot, store_snapshot, load_snapshot
+from ec_data_reader import load_and_process_data, load_and_process_data_2019
+from euref_data_reader import load_and_process_euref_data, EUREF_CSV
+from regions import region_service, DEFAULT_REGION_FILE, DEFAULT_CONSTITUENCY_CSV
+
+
+class UnknownElectionError(KeyError):
+    pass
+
+
+# format name -> (parser, input files function)
+ELECTION_FORMATS = {}
+
+
+def register_format(name, input_files):
+    """
+    Decorator to register a parser function for a data format.
+
+    The parser is called as parser(ge_cfg, regions, euref_data) - where ge_cfg
+    is the relevant GENERAL_ELECTIONS dict - and should return a list of
+    ConstituencyResult objects.  input_files is a function that takes ge_cfg
+    and returns a list of the source files the parser reads (other than the
+    region and EU Referendum data), which is used to invalidate cached data.
+    """
+    def decorator(parser):
+        ELECTION_FORMATS[name] = (parser, input_files)
+        return parser
+    return decorator
+
+
+@register_format('admin_and_results',
+                 input_files=lambda cfg: [cfg['constituencies_csv'], cfg['results_csv']])
+def parse_admin_and_results_format(ge_cfg, regions, euref_data):
+    """
+    Electoral Commission format (2015, 2017), with separate constituency and
+    per-candidate results CSVs
+    """
+    return load_and_process_data(ge_cfg['constituencies_csv'],
+                                 ge_cfg['results_csv'], regions, euref_data)
+
+
+@register_format('wide_2019',
+                 # The 2017 constituency data is used to map names to regions
+                 input_files=lambda cfg: [cfg['results_csv'], DEFAULT_CONSTITUENCY_CSV])
+def parse_wide_2019_format(ge_cfg, regions, euref_data):
+    """
+    2019 format, with one row per constituency and a column for each party
+    """
+    return load_and_process_data_2019(ge_cfg['results_csv'], regions, euref_data)
+
+
+_loaded_elections = {}
+_load_lock = threading.Lock()
+
+
+def election_config(year):
+    try:
+        return GENERAL_ELECTIONS[year]
+    except KeyError:
+        raise UnknownElectionError('No configuration for a %s General Election' % (year))
+
+
+def election_format(year):
+    """
+    Return the (parser, input files function) tuple for the given year
+    """
+    ge_cfg = election_config(year)
+    try:
+        return ELECTION_FORMATS[ge_cfg['format']]
+    except KeyError:
+        raise UnknownElectionError('No parser registered for format "%s" (%s)' %
+                                   (ge_cfg.get('format'), year))
+
+
+def election_input_files(year, include_euref=True):
+    """
+    Return a list of all the files that the data for year is derived from
+    """
+    _, input_files = election_format(year)
+    files = input_files(election_config(year)) + [DEFAULT_REGION_FILE]
+    if include_euref:
+        files.append(EUREF_CSV)
+    return files
+
+
+def parse_election(year, include_euref=True):
+    """
+    Parse the source data for year, bypassing all caches
+    """
+    parser, _ = election_format(year)
+    regions = region_service().region_data(add_on_countries=True)
+    euref_data = load_and_process_euref_data() if include_euref else None
+    return parser(election_config(year), regions, euref_data)
+
+
+def snapshot_label(year, include_euref=True):
+    return 'ge%s-%s' % (year, 'euref' if include_euref else 'no-euref')
+
+
+def load_election(year, include_euref=True):
+    """
+    Return a list of ConstituencyResult objects for the General Election in
+    year.  The result is shared by all callers in this process, so don't
+    modify it.
+    """
+    key = (year, include_euref)
+    try:
+        return _loaded_elections[key]
+    except KeyError:
+        pass
+    with _load_lock:
+        if key not in _loaded_elections:
+            _loaded_elections[key] = cached(
+                snapshot_label(year, include_euref),
+                election_input_files(year, include_euref),
+                lambda: parse_election(year, include_euref),
+                extra=[election_config(year)['format']])
+        return _loaded_elections[key]
+
+
+def _parse_and_store(year, include_euref, filename, regions, euref_data):
+    """
+    Parse the data for year and save it as the snapshot filename, returning
+    a tuple of (list of ConstituencyResult objects, whether it was saved)
+    """
+    parser, _ = election_format(year)
+    data = parser(election_config(year), regions, euref_data)
+    stored = store_snapshot(snapshot_label(year, include_euref), filename, data)
+    return data, stored
+
+
+def _parse_election_in_worker(year, include_euref, filename, regions, euref_data):
+    """
+    Run in a worker process by load_all_elections().  Rather than sending the
+    parsed objects back to the parent, the worker saves them as the on-disk
+    snapshot and just returns a tuple of (filename, None) - only if that
+    can't be saved (e.g. read-only filesystem) is it (None, pickled data).
+    """
+    data, stored = _parse_and_store(year, include_euref, filename, regions,
+                                    euref_data)
+    if stored:
+        return filename, None
+    return None, pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+
+def load_all_elections(years=None, include_euref=True, workers=None):
+    """
+    Return a dict of year->list of ConstituencyResult objects, as per
+    load_election(), for each of years (default: all configured elections).
+
+    Years that aren't already loaded or cached on disk are parsed in up to
+    workers (default: one per CPU) processes, which write the on-disk
+    snapshots that this process then loads.  The region and EU Referendum
+    data are only loaded once, by this process.
+    """
+    if years is None:
+        years = sorted(GENERAL_ELECTIONS.keys())
+    ret = {}
+    to_parse = []
+    with _load_lock:
+        for year in years:
+            key = (year, include_euref)
+            if key not in _loaded_elections:
+                filename, data = find_snapshot(
+                    snapshot_label(year, include_euref),
+                    election_input_files(year, include_euref),
+                    extra=[election_config(year)['format']])
+                if data is None:
+                    to_parse.append((year, filename))
+                    continue
+                _loaded_elections[key] = data
+            ret[year] = _loaded_elections[key]
+
+    if not to_parse:
+        return ret
+
+    # The lock isn't held while parsing, so as not to hold up load_election()
+    # callers for other years - at worst a year is parsed twice
+    regions = region_service().region_data(add_on_countries=True)
+    euref_data = load_and_process_euref_data() if include_euref else None
+    parsed = {}
+    if len(to_parse) == 1 or workers == 1 or ProcessPoolExecutor is None:
+        for year, filename in to_parse:
+            parsed[year], _ = _parse_and_store(year, include_euref, filename,
+                                               regions, euref_data)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [(year, filename,
+                        executor.submit(_parse_election_in_worker, year,
+                                        include_euref, filename, regions,
+                                        euref_data))
+                       for year, filename in to_parse]
+            for year, filename, future in futures:
+                stored_filename, pickled_data = future.result()
+                if stored_filename:
+                    data = load_snapshot(stored_filename)
+                else:
+                    data = pickle.loads(pickled_data)
+                if data is None:
+                    # Snapshot was removed or spoilt before we could read it
+                    data, _ = _parse_and_store(year, include_euref, filename,
+                                               regions, euref_data)
+                parsed[year] = data
+
+    with _load_lock:
+        for year, data in parsed.items():
+            # Keep whatever a concurrent load_election() came up with, so that
+            # every caller shares the same objects
+            ret[year] = _loaded_elections.setdefault((year, include_euref), data)
+    return ret
+
+
+def forget_loaded_elections():
+    """
+    Drop the per-process copies of any elections loaded so far
+    """
+    with _load_lock:
+        _loaded_elections.clear()
+
+
+if __name__ == '__main__':
+    years = [int(z) for z in sys.argv[1:]] or sorted(GENERAL_ELECTIONS.keys())
+    all_data = load_all_elections(years)
+    for year in years:
+        data = all_data[year]
+        print('%d: %d constituencies, first is %s' % (year, len(data), data[0]))
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Columnar (NumPy array based) view of the results of a General Election, for
+analyses that would otherwise have to loop over lots of ConstituencyResult
+objects in Python.
+
+Each constituency has a row index - the same as its position in the list of
+ConstituencyResult objects the table was built from, which remain available
+via table[i] or table.result_for(ons_code).  Parties are referred to by
+their party_registry IDs, which index into table.parties.
+
+NumPy is an optional dependency for this repo as a whole, but obviously not
+for this module.
+"""
+
+import sys
+
+from party_registry import PARTY_REGISTRY
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ElectionTable(object):
+    """
+    Given a list of ConstituencyResult objects - as returned by
+    ec_data_reader.load_and_process_data() or similar - store their data as
+    typed arrays.
+
+    Constituency level arrays (one element per constituency):
+    * electorate, valid_votes, winner (party ID), runner_up (party ID),
+      winner_votes, margin (winning margin in votes), turnout_pc, margin_pc,
+      leave_pc (NaN if there is no EU Referendum data), leave_known_result
+
+    Candidate level arrays (one element per candidate, each constituency's
+    candidates being contiguous and in descending order of votes):
+    * candidate_constituency (row index), candidate_party (party ID),
+      candidate_votes
+    Constituency i's candidates are at candidate_offsets[i]:candidate_offsets[i+1]
+    """
+
+    def __init__(self, election_data):
+        if np is None:
+            raise ImportError('ElectionTable requires numpy')
+
+        self.results = list(election_data)
+        self.ons_codes = [z.constituency.ons_code for z in self.results]
+        self.ons_index = dict((ons, i) for i, ons in enumerate(self.ons_codes))
+
+        # Every party in the results is already in the registry, so this covers
+        # all the IDs we'll see
+        self.parties = PARTY_REGISTRY.names()
+        self.party_index = dict((p, i) for i, p in enumerate(self.parties))
+
+        cons = [z.constituency for z in self.results]
+        self.electorate = np.array([z.electorate for z in cons], dtype=np.int64)
+        self.valid_votes = np.array([z.valid_votes for z in cons], dtype=np.int64)
+
+        self.leave_pc = np.array([float(z.euref.leave_pc) if z.euref else np.nan
+                                  for z in cons], dtype=np.float64)
+        self.leave_known_result = np.array([bool(z.euref and z.euref.known_result)
+                                            for z in cons], dtype=bool)
+
+        num_candidates = [len(z.results) for z in self.results]
+        self.candidate_offsets = np.zeros(len(self.results) + 1, dtype=np.int64)
+        np.cumsum(num_candidates, out=self.candidate_offsets[1:])
+        self.candidate_constituency = np.repeat(
+            np.arange(len(self.results), dtype=np.int32), num_candidates)
+        self.candidate_party = np.array([res.party_id
+                                         for conres in self.results
+                                         for res in conres.results],
+                                        dtype=np.int16)
+        self.candidate_votes = np.array([res.valid_votes
+                                         for conres in self.results
+                                         for res in conres.results],
+                                        dtype=np.int64)
+
+        self._derive_constituency_columns()
+
+    def _derive_constituency_columns(self):
+        starts = self.candidate_offsets[:-1]
+        # Every constituency has at least one candidate; some (in theory) don't
+        # have a runner-up, in which case the margin is the winner's votes
+        has_runner_up = (self.candidate_offsets[1:] - starts) > 1
+        runner_up_pos = np.where(has_runner_up, starts + 1, starts)
+
+        self.winner = self.candidate_party[starts]
+        self.winner_votes = self.candidate_votes[starts]
+        self.runner_up = np.where(has_runner_up,
+                                  self.candidate_party[runner_up_pos], -1)
+        self.runner_up_votes = np.where(has_runner_up,
+                                        self.candidate_votes[runner_up_pos], 0)
+        self.margin = self.winner_votes - self.runner_up_votes
+
+        # These match ConstituencyResult.turnout_pc and .margin_pc
+        self.turnout_pc = 100.0 * self.valid_votes / self.electorate
+        self.margin_pc = 100.0 * self.margin / self.valid_votes
+
+    ### Adapters back to the object model
+
+    def __len__(self):
+        return len(self.results)
+
+    def __getitem__(self, i):
+        return self.results[i]
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def result_for(self, ons_code):
+        return self.results[self.ons_index[ons_code]]
+
+    def select(self, mask_or_indexes):
+        """
+        Return the ConstituencyResult objects for a boolean mask or array of
+        row indexes, such as those returned by np.nonzero()
+        """
+        indexes = np.asarray(mask_or_indexes)
+        if indexes.dtype == bool:
+            indexes = np.nonzero(indexes)[0]
+        return [self.results[i] for i in indexes]
+
+    ### Vectorized accessors
+
+    def indexes_of(self, ons_codes):
+        return np.array([self.ons_index[z] for z in ons_codes], dtype=np.int64)
+
+    def party_id(self, party):
+        return self.party_index[party]
+
+    def party_votes(self, party):
+        """
+        Return an array of the votes for party in each constituency, zero
+        where they didn't stand
+        """
+        pid = self.party_index.get(party)
+        if pid is None:
+            return np.zeros(len(self.results), dtype=np.int64)
+        mask = self.candidate_party == pid
+        return np.bincount(self.candidate_constituency[mask],
+                           weights=self.candidate_votes[mask],
+                           minlength=len(self.results)).astype(np.int64)
+
+    def vote_matrix(self):
+        """
+        Return a (constituencies x parties) array of votes, which can be
+        modified and passed to winners_from_votes() for what-if scenarios
+        """
+        matrix = np.zeros((len(self.results), len(self.parties)), dtype=np.int64)
+        np.add.at(matrix, (self.candidate_constituency, self.candidate_party),
+                  self.candidate_votes)
+        return matrix
+
+    def seats_by_party(self, winner=None):
+        """
+        Return a dict of party->number of seats won, either for the actual
+        result or for an array of winning party IDs from winners_from_votes()
+        """
+        if winner is None:
+            winner = self.winner
+        counts = np.bincount(winner, minlength=len(self.parties))
+        return dict((self.parties[pid], int(n)) for pid, n in enumerate(counts) if n)
+
+    def winners_from_votes(self, vote_matrix):
+        """
+        Given a (constituencies x parties) array of votes, return a tuple of
+        (winning party IDs, winning margins in votes) arrays.
+
+        Ties go to the party with the lowest ID, which is no worse than any
+        other arbitrary choice.
+        """
+        if vote_matrix.shape[1] < 2:
+            return (np.zeros(vote_matrix.shape[0], dtype=np.int64),
+                    vote_matrix[:, 0].copy())
+        winner = np.argmax(vote_matrix, axis=1)
+        top_two = -np.partition(-vote_matrix, 1, axis=1)[:, :2]
+        return winner, top_two[:, 0] - top_two[:, 1]
+
+
+def load_election_table(year):
+    """
+    Convenience function to return an ElectionTable for the General Election
+    in year - see election_loaders.load_election()
+    """
+    from election_loaders import load_election
+    return ElectionTable(load_election(year))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        table = load_election_table(int(sys.argv[1]))
+    else:
+        table = load_election_table(2017)
+    for party, seats in sorted(table.seats_by_party().items(),
+                               key=lambda z: z[1], reverse=True):
+        print('%-30s %3d' % (party, seats))
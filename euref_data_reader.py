@@ -14,7 +14,8 @@ import sys
 
 PYTHON_MAJOR_VERSION = sys.version_info[0]
 
-from misc import intify, percentify, CSV_ENCODING # CSV_ENCODING perhaps not needed here?
+from misc import (intify, percentify, basis_pointify, lazy_property,
+                  CSV_ENCODING) # CSV_ENCODING perhaps not needed here?
 
 if PYTHON_MAJOR_VERSION == 2:
     # appengine/py2 doesn't like encoding argument
@@ -30,7 +31,16 @@ class EUReferendumResult(object):
         self.ons_code = row_dict['ONS ID']
         self.name = row_dict['Constituency']
         self.known_result = (row_dict['result'].strip() == 'Yes')
-        self.leave_pc = percentify(row_dict['TO USE'])
+        # Converted to a Decimal and/or basis points only when needed
+        self.leave_pc_text = row_dict['TO USE']
+
+    @lazy_property
+    def leave_pc(self):
+        return percentify(self.leave_pc_text)
+
+    @lazy_property
+    def leave_bp(self):
+        return basis_pointify(self.leave_pc_text)
 
     @property
     def voted_to_leave(self):
@@ -17,8 +17,10 @@ import sys
 from ec_data_reader import (load_and_process_data, load_and_process_data_2019,
                             ADMIN_CSV, RESULTS_CSV,
                             load_region_data)
+from election_loaders import load_election
 from euref_data_reader import load_and_process_euref_data
-from misc import slugify, output_file
+from misc import slugify, output_file, lazy_property
+from party_registry import PARTY_REGISTRY
 from helpers import short_region
 
 from settings import (INCLUDES_DIR, OUTPUT_DIR, STATIC_DIR)
@@ -60,27 +62,45 @@ class EnhancedConstituencyResult(object):
     def __init__(self, conres, ruling_parties=RULING_PARTIES):
         self.conres = conres
         self.con = conres.constituency
-        self.winner_slug = slugify(conres.winning_party)
-        self.runner_up_slug = slugify(conres.results[1].party)
+        self.winner_slug = PARTY_REGISTRY.slug(conres.winning_party_id)
+        self.runner_up_slug = conres.results[1].party_slug
         self.full_region = self.con.country_and_region
         self.region_slug = slugify(self.full_region)
 
         # Ensures this is populated for W, S, NI
         self.region = self.con.region or self.con.country
 
-        self.winning_margin = conres.margin_pc
-        if not ABSOLUTE_MARGIN_PC and conres.winning_party not in ruling_parties:
-            self.winning_margin = -conres.margin_pc
-
+        self.ruling_parties = ruling_parties
         self.winner_votes = conres.results[0].valid_votes
         self.runner_up_votes = conres.results[1].valid_votes
-        # Do all the percentage calculations in Python using Decimal to avoid
-        # horrible rounding/floating-point issues in JS
-        self.turnout = '%.1f' % (conres.turnout_pc)
-        self.winner_pc = '%.1f' % (100 * self.winner_votes / self.con.valid_votes)
-        self.runner_up_pc = '%.1f' % (100 * self.runner_up_votes / self.con.valid_votes)
-        self.won_by_pc = '%.1f' % (100 * (self.winner_votes - self.runner_up_votes)
-                              / self.con.valid_votes)
+
+    # Do all the percentage calculations in Python to avoid horrible
+    # rounding/floating-point issues in JS.  These are only done if and when
+    # they are needed.
+
+    @lazy_property
+    def winning_margin(self):
+        if not ABSOLUTE_MARGIN_PC and self.conres.winning_party not in self.ruling_parties:
+            return -self.conres.margin_pc
+        return self.conres.margin_pc
+
+    @lazy_property
+    def turnout(self):
+        # Same as '%.1f' % (conres.turnout_pc), without creating a Decimal
+        return '%.1f' % (100 * self.con.valid_votes / self.con.electorate)
+
+    @lazy_property
+    def winner_pc(self):
+        return '%.1f' % (100 * self.winner_votes / self.con.valid_votes)
+
+    @lazy_property
+    def runner_up_pc(self):
+        return '%.1f' % (100 * self.runner_up_votes / self.con.valid_votes)
+
+    @lazy_property
+    def won_by_pc(self):
+        return '%.1f' % (100 * (self.winner_votes - self.runner_up_votes)
+                         / self.con.valid_votes)
 
     def data_attributes_string(self):
         """
@@ -203,9 +223,9 @@ def output_svg(out, data, year, ruling_parties=RULING_PARTIES, value_map=None):
         ecr = EnhancedConstituencyResult(conres, ruling_parties=ruling_parties)
 
         con = conres.constituency
-        winner = slugify(conres.winning_party)
-        runner_up = slugify(conres.results[1].party)
-        relevant_parties.update([conres.winning_party, conres.results[1].party])
+        winner = ecr.winner_slug
+        runner_up = ecr.runner_up_slug
+        relevant_parties.update([conres.winning_party_id, conres.results[1].party_id])
 
         full_region = con.country_and_region
         regions.add(full_region)
@@ -221,10 +241,7 @@ def output_svg(out, data, year, ruling_parties=RULING_PARTIES, value_map=None):
 
         y_offset = calculate_leave_pc_offset(con.euref.leave_pc)
 
-        winning_margin = conres.margin_pc
-        if not ABSOLUTE_MARGIN_PC and conres.winning_party not in ruling_parties:
-            winning_margin = -conres.margin_pc
-        x_offset = Decimal('%.1f' % (calculate_fptp_margin_offset(winning_margin)))
+        x_offset = Decimal('%.1f' % (calculate_fptp_margin_offset(ecr.winning_margin)))
 
         if con.euref.known_result:
             x_offset -= DOT_RADIUS
@@ -310,8 +327,9 @@ def output_svg(out, data, year, ruling_parties=RULING_PARTIES, value_map=None):
                                                     width, is_selected)
 
     # y_pos += line_spacing
-    for p in sorted(relevant_parties):
-        p_slug = slugify(p)
+    for party_id in sorted(relevant_parties, key=PARTY_REGISTRY.name):
+        p = PARTY_REGISTRY.name(party_id)
+        p_slug = PARTY_REGISTRY.slug(party_id)
         y_pos += line_spacing * 1.5
         circle_svg = f'''<circle cx="{x_pos+15}" cy="{y_pos+9}" r="4"
         class="constituency winner party-{p_slug}" />\n'''
@@ -382,22 +400,9 @@ if __name__ == '__main__':
     else:
         output_filename = os.path.join(OUTPUT_DIR, '%s.svg' % (PROJECT))
 
-    regions = load_region_data(add_on_countries=True)
-    euref_data = load_and_process_euref_data()
-
     GE_YEAR = year or 2017
     ge_cfg = GENERAL_ELECTIONS[GE_YEAR]
-    if year == 2019:
-        election_data = load_and_process_data_2019(
-            GENERAL_ELECTIONS[GE_YEAR]['constituencies_csv'],
-            regions,
-            euref_data)
-    else:
-        election_data = load_and_process_data(
-            GENERAL_ELECTIONS[GE_YEAR]['constituencies_csv'],
-            GENERAL_ELECTIONS[GE_YEAR]['results_csv'],
-            regions,
-            euref_data)
+    election_data = load_election(GE_YEAR)
 
 
     value_map = {'ge_year': year,
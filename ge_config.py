@@ -7,18 +7,22 @@ import os
 
 SOURCE_DIR = os.path.join(os.path.dirname(__file__), 'source_data')
 
+# 'format' is the name of the parser registered in election_loaders.py
 GENERAL_ELECTIONS = {
     2015: {
+        'format': 'admin_and_results',
         'constituencies_csv': os.path.join(SOURCE_DIR, '_2015_ge_', 'CONSTITUENCY.csv'),
         'results_csv': os.path.join(SOURCE_DIR, '_2015_ge_', 'RESULTS.csv'),
         'ruling_parties': ('Conservative', 'Speaker')
     },
     2017: {
+        'format': 'admin_and_results',
         'constituencies_csv': os.path.join(SOURCE_DIR, '2017 UKPGE electoral data 3.csv'),
         'results_csv': os.path.join(SOURCE_DIR, '2017 UKPGE electoral data 4.csv'),
         'ruling_parties': ('Conservative', 'DUP', 'Speaker')
     },
     2019: {
+        'format': 'wide_2019',
         # There's no separate constituency file, but electorate is included in
         # the results.  With a bit of code tweaking I was able to get the
         # constituency data parsed with my existing code, but will need to
@@ -11,6 +11,7 @@ import re
 import sys
 
 from ec_data_reader import load_and_process_data, ADMIN_CSV, RESULTS_CSV
+from election_loaders import load_election
 from euref_data_reader import load_and_process_euref_data
 from misc import slugify, output_file
 from settings import (INCLUDES_DIR, OUTPUT_DIR, STATIC_DIR)
@@ -111,7 +112,7 @@ def output_svg(out, data, sort_method='by_region'):
 
         party_y_offset = CONSTITUENCY_Y_OFFSET
         for res_num, res in enumerate(conres.results):
-            slugified_party = slugify(res.party)
+            slugified_party = res.party_slug
             if res_num > 1:
                 slugified_party = 'loser'
             party_height = int(res.valid_votes / Y_FACTOR)
@@ -139,12 +140,7 @@ def output_svg(out, data, sort_method='by_region'):
 
 
 if __name__ == '__main__':
-    with open(os.path.join('intermediate_data', 'regions.json')) as regionstream:
-        regions = json.load(regionstream)
-    euref_data = load_and_process_euref_data()
-
-    election_data = load_and_process_data(ADMIN_CSV, RESULTS_CSV, regions,
-                                          euref_data)
+    election_data = load_election(2017)
 
     for sort_method in SORT_OPTIONS.keys():
         output_filename = os.path.join('output', '%s_%s.svg' % (PROJECT, sort_method))
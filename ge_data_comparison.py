@@ -1,8 +1,11 @@
 #!/usr/bin/env python3
 """
-Report on any issues detected between 2 sets of GE data - currently this is
-just at the constituency level.  (Not sure what I might be able to useful
-compare on results)
+Report on any issues detected between 2 or more sets of GE data - currently
+this is just at the constituency level.  (Not sure what I might be able to
+useful compare on results)
+
+Constituencies are matched up by ONS code (with fallbacks) rather than by
+position, so years with different numbers of constituencies can be compared.
 
 This is mainly to pick up any issues that might affect the visualizations and/or
 issues with the source data.
@@ -13,29 +16,34 @@ import pdb
 import sys
 
 from ge_config import GENERAL_ELECTIONS
+from election_loaders import load_all_elections
+from misc import slugify
 
 
 from ec_data_reader import (load_and_process_data, ADMIN_CSV, RESULTS_CSV,
                             load_region_data)
 from constituency import load_constituencies_from_admin_csv
-from regions import constituency_name_to_region
 
-def compare_constituency_data(c1, c2, label=None):
+def compare_constituency_data(c1, c2, label=None, years=None):
     """
     Compare data for the same constituency in 2 different general elections.
     It is assumed that c1 will be prior to c2 - this only makes any difference
     in terms of correctly logging if a change is positive vs negative.
+
+    years is a (c1 year, c2 year) tuple, if c1.year and c2.year aren't set.
     """
+    if not years:
+        years = (c1.year, c2.year)
     # These should all be the same unless boundaries have changed.
     # It's possible names might have minor inconsistencies, but hopefully all
     # the important code uses ons_code or (less likely) pa_number
     for field in ('ons_code', 'pa_number', 'name'):
         f1 = getattr(c1, field)
-        f2 = getattr(c1, field)
+        f2 = getattr(c2, field)
         if f1 != f2:
             logging.warning('%s: %s "%s" (%d) !- "%s" (%d)' % (label, field,
-                                                               f1, c1.year,
-                                                               f2, c2.year))
+                                                               f1, years[0],
+                                                               f2, years[1]))
     electorate_diff = c2.electorate - c1.electorate
     electorate_pc_change = 100 * electorate_diff / c1.electorate
     print('%-50s: Electorate changed by %5d (%5.1f%%) : %-5d to %-5d' %
@@ -43,77 +51,182 @@ def compare_constituency_data(c1, c2, label=None):
            electorate_pc_change,
            c1.electorate, c2.electorate))
 
-def compare_constituencies(years, regions):
-    ge_data = {}
-    num_constituencies = None
-    for year in years:
-        data = sorted(load_constituencies_from_admin_csv(
-            GENERAL_ELECTIONS[year]['constituencies_csv'],
-            regions), key=lambda z: z.ons_code)
-        ge_data[year] = data
-        if num_constituencies is None:
-            num_constituencies = len(data)
-        elif num_constituencies != len(data):
-            logging.warning('Number of constituencies in %d is %d, expected %d' %
-                            (year, len(data), num_constituencies))
-        print('%d : %d constituencies' % (year, len(data)))
-
-    # Assumption that the constituency data is sorted in a consistent manner e.g.
-    # name, PA code, not electorate, winning marging, etc etc
-    for i in range(num_constituencies):
-        c1 = ge_data[years[0]][i]
-        c2 = ge_data[years[1]][i]
+# Functions to get the keys that constituencies can be joined on.  ONS code
+# is the primary key, the others are fallbacks for when that doesn't match
+# e.g. if the ONS codes changed without the constituency changing.  PA
+# numbers aren't a default fallback, as they get reassigned when the
+# boundaries change.
+JOIN_KEY_FUNCTIONS = {
+    'ons_code': lambda con: con.ons_code,
+    'pa_number': lambda con: con.pa_number,
+    'slug': lambda con: slugify(con.name)
+}
+DEFAULT_ALIAS_KEYS = ('slug',)
 
-        # Might be a good idea to set the year when the object is created?
-        c1.year = years[0]
-        c2.year = years[1]
-        compare_constituency_data(c1, c2, label=f'Constituency#{i}')
 
+class JoinedElections(object):
+    """
+    The result of join_elections() - a table with a row for every
+    constituency that appears in any of the years, and a column per year,
+    the cells being whatever objects were passed in, or None if that
+    constituency didn't exist that year.
+    """
+    def __init__(self, years):
+        self.years = list(years)
+        self.rows = [] # Each row is a list of objects, one per year
+
+    def add_row(self):
+        row = [None] * len(self.years)
+        self.rows.append(row)
+        return row
+
+    def column(self, year):
+        return self.years.index(year)
+
+    def matched(self, year1, year2):
+        """
+        Return a list of (year1 object, year2 object) tuples for the
+        constituencies that exist in both years
+        """
+        i1, i2 = self.column(year1), self.column(year2)
+        return [(row[i1], row[i2]) for row in self.rows
+                if row[i1] is not None and row[i2] is not None]
+
+    def inserted(self, year1, year2):
+        """
+        Return a list of the year2 objects that have no year1 equivalent
+        """
+        i1, i2 = self.column(year1), self.column(year2)
+        return [row[i2] for row in self.rows
+                if row[i1] is None and row[i2] is not None]
+
+    def removed(self, year1, year2):
+        """
+        Return a list of the year1 objects that have no year2 equivalent
+        """
+        return self.inserted(year2, year1)
+
+
+def join_elections(data_by_year, key='ons_code', aliases=DEFAULT_ALIAS_KEYS,
+                   get_constituency=None):
+    """
+    Hash join N years of data on constituency.  data_by_year is a dict of
+    year->list of objects, those objects being Constituency objects, or
+    anything that get_constituency can turn into one e.g.
+    lambda z: z.constituency for ConstituencyResult objects.
+
+    Each year's objects are first all matched using the key function named
+    by key (see JOIN_KEY_FUNCTIONS), and only those left over are then
+    matched using the functions named in aliases, in that order - so an
+    alias can't take a row that something else matches exactly.  A row is
+    never matched twice for the same year.
+    """
+    if not get_constituency:
+        get_constituency = lambda z: z
+    key_names = [key] + [z for z in aliases if z != key]
+    key_functions = [JOIN_KEY_FUNCTIONS[z] for z in key_names]
+
+    years = sorted(data_by_year.keys())
+    joined = JoinedElections(years)
+    # One hash table per key function, mapping key values to rows
+    indexes = [{} for _ in key_functions]
+
+    def match(index, val, col):
+        if val is None:
+            return None
+        row = index.get(val)
+        if row is not None and row[col] is None:
+            return row
+        return None
+
+    for col, year in enumerate(years):
+        matches = [] # (row, keys) for every item in this year
+        leftovers = []
+        for item in data_by_year[year]:
+            keys = [func(get_constituency(item)) for func in key_functions]
+            row = match(indexes[0], keys[0], col)
+            if row is None:
+                leftovers.append((item, keys))
+            else:
+                row[col] = item
+                matches.append((row, keys))
+        for item, keys in leftovers:
+            row = None
+            for index, val in zip(indexes[1:], keys[1:]):
+                row = match(index, val, col)
+                if row is not None:
+                    break
+            if row is None:
+                row = joined.add_row()
+            row[col] = item
+            matches.append((row, keys))
+        # Only indexed once the whole year has been matched, so that later
+        # years are matched against the latest key values
+        for row, keys in matches:
+            for index, val in zip(indexes, keys):
+                if val is not None:
+                    index[val] = row
+    return joined
+
+def report_changes(joined, describe=str):
+    for year1, year2 in zip(joined.years, joined.years[1:]):
+        matched = joined.matched(year1, year2)
+        inserted = joined.inserted(year1, year2)
+        removed = joined.removed(year1, year2)
+        print('%d -> %d : %d matched, %d new, %d removed constituencies' %
+              (year1, year2, len(matched), len(inserted), len(removed)))
+        for item in inserted:
+            print('  New in %d: %s' % (year2, describe(item)))
+        for item in removed:
+            print('  Not in %d: %s' % (year2, describe(item)))
 
 
-def compare_everything(years, regions):
+def compare_constituencies(years, regions):
     ge_data = {}
-    num_constituencies = None
     for year in years:
-        data = load_and_process_data(
-            GENERAL_ELECTIONS[year]['constituencies_csv'],
-            GENERAL_ELECTIONS[year]['results_csv'],
-            regions)
+        data = load_constituencies_from_admin_csv(
+            GENERAL_ELECTIONS[year]['constituencies_csv'], regions)
+        # Might be a good idea to set the year when the object is created?
+        for con in data:
+            con.year = year
         ge_data[year] = data
-        if num_constituencies is None:
-            num_constituencies = len(data)
-        elif num_constituencies != len(data):
-            logging.warning('Number of constituencies in %d is %d, expected %d' %
-                            (year, len(data), num_constituencies))
         print('%d : %d constituencies' % (year, len(data)))
 
-    # Assumption that the constituency data is sorted in a consistent manner e.g.
-    # name, PA code, not electorate, winning marging, etc etc
-    for i in range(num_constituencies):
-        cr1 = ge_data[years[0]][i]
-        cr2 = ge_data[years[1]][i]
+    joined = join_elections(ge_data)
+    report_changes(joined, describe=lambda z: z.name)
+    for year1, year2 in zip(joined.years, joined.years[1:]):
+        for c1, c2 in joined.matched(year1, year2):
+            compare_constituency_data(c1, c2, label=c1.ons_code)
 
 
-        # Might be a good idea to set the year when the object is created?
-        cr1.year = years[0]
-        cr2.year = years[1]
+def compare_everything(years, workers=None):
+    """
+    Compare the constituencies of all the given years, which are loaded in
+    parallel - see election_loaders.load_all_elections()
+    """
+    ge_data = load_all_elections(years, workers=workers)
+    for year, data in ge_data.items():
+        print('%d : %d constituencies' % (year, len(data)))
 
-        compare_constituency_data(cr1.constituency, cr2.constituency,
-                                  label=f'Constituency#{i}')
+    joined = join_elections(ge_data, get_constituency=lambda z: z.constituency)
+    report_changes(joined, describe=lambda z: z.constituency.name)
+    for year1, year2 in zip(joined.years, joined.years[1:]):
+        for cr1, cr2 in joined.matched(year1, year2):
+            # Note that these are objects shared with any other users of
+            # load_election(), hence we don't set .year on them
+            compare_constituency_data(cr1.constituency, cr2.constituency,
+                                      label=cr1.constituency.ons_code,
+                                      years=(year1, year2))
 
 
 
 if __name__ == '__main__':
-    if len(sys.argv) > 2:
+    if len(sys.argv) > 1:
         years = [int(z) for z in sys.argv[1:]]
     else:
-        years = [2015, 2017] # Default to the only years we currently support
-
-    regions_to_con_lists = load_region_data(add_on_countries=True)
-    con_to_region = constituency_name_to_region(regions_to_con_lists)
-
-    # This is currently broken for the 2019 data (due to different format)
-    # compare_everything(years, regions_to_con_lists)
-
+        years = sorted(GENERAL_ELECTIONS.keys())
 
-    compare_constituencies(years, con_to_region)
+    # As the years are joined on ONS code etc rather than by position, this
+    # works for all of them, not just those with an admin CSV like
+    # compare_constituencies() needs
+    compare_everything(years)
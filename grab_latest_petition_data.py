@@ -1,24 +1,27 @@
 #!/usr/bin/env python3
 
 from glob import glob
-import json
 import logging
 import os
 import pdb
 import sys
-from datetime import datetime
 import time
 
-try:
-    import requests
-except ImportError:
-    pass # Temp hack for GAE
+from petition_stream import extract_fields
+import petition_manifest
+from petition_poller import PetitionPoller, DEFAULT_URL, NEW
 
 DOWNLOAD_DIR = os.path.join(os.path.dirname(__file__), 'source_data')
 MIN_FRESHNESS = 10 * 60 # i.e 10 minutes
 FILE_PATTERN = '241584*.json'
 
-DOWNLOAD_URL = 'https://petition.parliament.uk/petitions/241584.json'
+# Can be overridden with the PETITION_URL environment variable e.g. to use
+# petition_test_server.py
+DOWNLOAD_URL = DEFAULT_URL
+
+# Where the front ends cache the latest download, and for how long
+DOWNLOAD_KEY = '241584'
+DOWNLOAD_CACHE_TIME = 60 * 5
 
 
 
@@ -27,17 +30,12 @@ def extract_epoch(json_file, rogue_value=None):
     Extract the updated_at value from petition JSON and convert to epoch
     time.
     """
+    # Only reads as far as updated_at, rather than parsing the whole file
     try:
-        with open(json_file) as inputstream:
-            petition_data = json.load(inputstream)
-            main_attributes = petition_data['data']['attributes']
-            ts = main_attributes['updated_at']
-            dt = datetime.strptime(ts, '%Y-%m-%dT%H:%M:%S.%fZ')
-            # Python 3 supports .timestamp() - although beware it returns float -
-            # but we have to support Python 2
-            return int((dt - datetime(1970,1,1)).total_seconds())
+        ts = extract_fields(json_file, ['updated_at'])['updated_at']
     except KeyError:
         return rogue_value
+    return petition_manifest.timestamp_to_epoch(ts)
 
 def check_latest_petition_data(use_file_timestamps=True):
     """
@@ -52,6 +50,27 @@ def check_latest_petition_data(use_file_timestamps=True):
     single time if the data stops updating.  The JSON-extraction variant is
     intended for use when determining what is the freshest data of the files
     you've already downloaded.
+
+    This now just reads the last entry in the manifest (see
+    petition_manifest.py), only falling back to looking at the files if the
+    manifest doesn't exist yet.
+    """
+    entry = petition_manifest.latest_or_rebuild(DOWNLOAD_DIR)
+    if entry is None:
+        return scan_latest_petition_data(use_file_timestamps)
+
+    if use_file_timestamps:
+        freshest = (os.path.join(DOWNLOAD_DIR, entry['filename']), entry['epoch'])
+    else:
+        freshest = (os.path.join(DOWNLOAD_DIR, entry['freshest_filename']),
+                    entry['freshest_updated_epoch'])
+    logging.warning('%s is the freshest file, timestamp=%d' % (freshest))
+    return freshest
+
+def scan_latest_petition_data(use_file_timestamps=True):
+    """
+    Original implementation of check_latest_petition_data(), which looks at
+    every file in DOWNLOAD_DIR
     """
     extant_files = glob(os.path.join(DOWNLOAD_DIR, FILE_PATTERN))
     logging.warning('%d petition data files found' % (len(extant_files)))
@@ -73,6 +92,39 @@ def die_horribly(txt):
             errorstream.write('%s\n' % (txt))
     sys.exit(1)
 
+def save_new_snapshot(content, epoch):
+    """
+    Write content (bytes of petition JSON, fetched at epoch) to a new file in
+    DOWNLOAD_DIR, and record it in the manifest, signature store and archive -
+    deleting any older files that are safely in the archive.  Returns the new
+    filename.
+    """
+    new_name = os.path.join(DOWNLOAD_DIR, '241584_AsAt%d.json' % (epoch))
+    with open(new_name, 'wb') as outputstream:
+        outputstream.write(content)
+    petition_manifest.add_file(new_name, epoch)
+    try:
+        # Imported here as it's Python 3 only, unlike the rest of this file
+        from signature_store import SignatureStore
+        SignatureStore().append_petition(new_name)
+    except Exception as err:
+        # The JSON file is the master copy, so this isn't fatal
+        logging.warning('Unable to add %s to signature store: %s' %
+                        (new_name, err))
+    try:
+        from petition_archive import PetitionArchive
+        archive = PetitionArchive()
+        archive.append_file(new_name)
+        # The older files are only needed as the archive's source, other
+        # than whatever check_latest_petition_data() might return
+        entry = petition_manifest.latest_entry()
+        keep = [new_name] + ([entry['filename'], entry['freshest_filename']]
+                             if entry else [])
+        archive.prune(DOWNLOAD_DIR, keep=keep)
+    except Exception as err:
+        logging.warning('Unable to add %s to archive: %s' % (new_name, err))
+    return new_name
+
 if __name__ == '__main__':
 
     newest_file, newest_timestamp = check_latest_petition_data()
@@ -84,16 +136,18 @@ if __name__ == '__main__':
         print('Not yet time to grab a new file (%d)' % (newest_timestamp))
         sys.exit(1) # This shouldn't uploaded the failure file
     try:
-        req = requests.get(DOWNLOAD_URL)
-        # pdb.set_trace()
-        if req.status_code < 300:
-            new_name = os.path.join(DOWNLOAD_DIR, '241584_AsAt%d.json' % (epoch))
-            with open(new_name, 'w') as outputstream:
-                outputstream.write(req.text)
-                print('Success! (%d bytes saved)' % (len(req.text)))
-        else:
-            die_horribly('Failed to get latest file at %d -  HTTP response %s' %
-                         (epoch, req.status_code))
+        # Only downloads the data if it has changed since last time
+        poller = PetitionPoller(DOWNLOAD_URL)
+        result = poller.poll()
+        if result.status != NEW:
+            poller.commit(result)
+            print('No new data (%s)' % (result.status))
+            sys.exit(1) # Nor should this
+        save_new_snapshot(result.content, epoch)
+        # Only now that it's safely saved, so that if that fails, the next
+        # run fetches it again rather than getting a 304
+        poller.commit(result)
+        print('Success! (%d bytes saved)' % (len(result.content)))
 
     except Exception as err:
         die_horribly('Failed to get latest file at %d - Error: %s' %
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Stand-in for memcached, for trying out cache_backends.MemcachedClient (e.g.
+with several worker processes sharing it) without installing the real
+thing.  It only understands the commands the client uses - get, set, add,
+delete and flush_all - and keeps everything in a cache_backends.LRUCache.
+
+  ./memcache_test_server.py [port]
+
+then run the front end with CACHE_BACKEND=memcached:127.0.0.1:<port>
+"""
+
+import sys
+import threading
+
+try:
+    from socketserver import StreamRequestHandler, ThreadingTCPServer
+except ImportError: # Python 2
+    from SocketServer import StreamRequestHandler, ThreadingTCPServer
+
+from cache_backends import LRUCache, DEFAULT_MEMCACHED_PORT
+
+DEFAULT_MAX_ITEMS = 10000
+
+
+class MemcacheRequestHandler(StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line + b'\r\n')
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.split()
+            if not parts:
+                continue
+            command = parts[0]
+            if command == b'get':
+                for key in parts[1:]:
+                    entry = store.get(key)
+                    if entry is not None:
+                        flags, data = entry
+                        self.reply(b'VALUE ' + key + b' ' + flags + b' ' +
+                                   str(len(data)).encode('ascii'))
+                        self.reply(data)
+                self.reply(b'END')
+            elif command in (b'set', b'add') and len(parts) >= 5:
+                key, flags, exptime, length = parts[1:5]
+                data = self.rfile.read(int(length) + 2)[:-2]
+                if command == b'set':
+                    stored = store.set(key, (flags, data), time=int(exptime))
+                else:
+                    stored = store.add(key, (flags, data), time=int(exptime))
+                self.reply(b'STORED' if stored else b'NOT_STORED')
+            elif command == b'delete' and len(parts) >= 2:
+                deleted = store.delete(parts[1]) == 2
+                self.reply(b'DELETED' if deleted else b'NOT_FOUND')
+            elif command == b'flush_all':
+                store.flush_all()
+                self.reply(b'OK')
+            elif command == b'quit':
+                return
+            else:
+                self.reply(b'ERROR')
+
+
+class MemcacheServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def make_server(port=DEFAULT_MEMCACHED_PORT, max_items=DEFAULT_MAX_ITEMS):
+    """
+    Return a server (port 0 picks a free port - see server.server_address)
+    """
+    server = MemcacheServer(('127.0.0.1', port), MemcacheRequestHandler)
+    server.store = LRUCache(max_items=max_items)
+    return server
+
+
+def start_in_thread(port=0, max_items=DEFAULT_MAX_ITEMS):
+    """
+    Start a server in a daemon thread, returning the server - call
+    server.shutdown() when done
+    """
+    server = make_server(port, max_items)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_MEMCACHED_PORT
+    print('memcached stand-in listening on 127.0.0.1:%d' % (port))
+    make_server(port).serve_forever()
@@ -4,20 +4,15 @@ Generic helper functions
 """
 
 from decimal import Decimal
-import re
+
+# slugify used to be defined here, but now lives in normalisation.py where it
+# is memoized
+from normalisation import slugify, slugify_many
 
 # utf-8 blows up on the 0x96 (m-dash?) in the Electoral Commission CSVs
 CSV_ENCODING = 'iso-8859-15'
 
 
-def slugify(str):
-    # The .replace() is for 'sinn-fein'
-    # Python2 doesn't like the accent  in the above line - hacky workaround for now
-    lc = str.lower()
-    intermediate = re.sub('sinn f.in', 'sinn fein', lc)
-    return re.sub('\W+', '-', intermediate)
-
-
 def intify(s):
     """
     Convert a string (which may have commas in) to an int.
@@ -33,6 +28,50 @@ def percentify(s):
     """
     return Decimal(s.replace('%', ''))
 
+def basis_pointify(s):
+    """
+    Convert a string (which may have a trailing %) to an int number of basis
+    points (hundredths of a percent) e.g. "52.34%" -> 5234, without going via
+    Decimal or float.  Any further decimal places are rounded, with halves
+    rounded away from zero.
+    """
+    txt = s.replace('%', '').strip()
+    sign = 1
+    if txt.startswith('-'):
+        sign = -1
+        txt = txt[1:]
+    whole, _, fraction = txt.partition('.')
+    fraction = fraction + '000'
+    bp = int(whole or '0') * 100 + int(fraction[:2])
+    if int(fraction[2]) >= 5:
+        bp += 1
+    return sign * bp
+
+def basis_points(numerator, denominator):
+    """
+    Return 100 * numerator / denominator as an int number of basis points
+    (hundredths of a percent), rounded half up, using only integer arithmetic
+    """
+    return (20000 * numerator + denominator) // (2 * denominator)
+
+
+class lazy_property(object):
+    """
+    Decorator for a read-only property that is only calculated when it is
+    first read, after which the value is stored on the instance (so the
+    calculation isn't repeated, and the value gets pickled)
+    """
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.__name__] = self.func(obj)
+        return value
+
 
 def output_file(output, filename, value_map=None):
     output.flush()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Slugification and constituency name clean-up, with the regexes compiled once
+and the results memoized - there are only ~650 constituencies and a handful
+of parties and regions, but these functions get called many thousands of
+times when rendering (row IDs, CSS classes, region lookups, etc).
+
+misc.slugify() and constituency.clean_constituency_name() are the same
+functions as the ones here.
+
+Run this file to get a quick benchmark of the memoized versions against the
+old uncompiled/unmemoized implementations.
+"""
+
+import re
+import sys
+
+# Stop the memos growing without limit if something calls these functions on
+# arbitrary input.  This is far more than the number of distinct names we
+# actually have.
+DEFAULT_MEMO_SIZE = 4096
+
+# The first of these is for 'sinn-fein'
+# Python2 doesn't like the accent - hence the '.' - hacky workaround for now
+SINN_FEIN_REGEX = re.compile('sinn f.in')
+NON_WORD_REGEX = re.compile(r'\W+')
+TRAILING_NUMBER_REGEX = re.compile(r'\s*\d+$')
+
+
+def memoized(maxsize=DEFAULT_MEMO_SIZE):
+    """
+    Decorator for caching the results of a single argument function.  If the
+    cache reaches maxsize entries it is just emptied - this isn't expected to
+    happen in practice, so there's no point in doing anything cleverer.
+
+    (functools.lru_cache would do, except that it doesn't exist in Python 2.)
+    """
+    def decorator(func):
+        cache = {}
+        def wrapper(arg):
+            try:
+                return cache[arg]
+            except KeyError:
+                pass
+            if len(cache) >= maxsize:
+                cache.clear()
+            val = cache[arg] = func(arg)
+            return val
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+@memoized()
+def slugify(s):
+    """
+    Convert s to lower-case, with runs of non-alphanumeric characters turned
+    into hyphens e.g. 'Sinn Fein' (with an acute e) -> 'sinn-fein'
+    """
+    intermediate = SINN_FEIN_REGEX.sub('sinn fein', s.lower())
+    return NON_WORD_REGEX.sub('-', intermediate)
+
+
+def slugify_many(strings):
+    """
+    Return a list of the slugified versions of strings e.g. for a whole
+    column of values
+    """
+    return [slugify(s) for s in strings]
+
+
+@memoized()
+def clean_constituency_name(s):
+    """
+    # Clean up the following (why are they like this???):
+    # ['Brecon and Radnorshire 5', 'Cardiff North 5',
+    # 'Cardiff South and Penarth 5', 'Merthyr Tydfil and Rhymney 5',
+    # 'Ogmore 5', 'Pontypridd 5', 'Vale of Glamorgan 5']
+    # Plus Swansea East6...
+    """
+    name = TRAILING_NUMBER_REGEX.sub('', s.strip())
+
+    # GE-2019-results.csv uses ampersands, turn these into "and" to (a) match
+    # the Electoral Commission data, and (b) make life easier for HTML/SVG/XML
+    name = name.replace('&', 'and')
+
+    return name
+
+
+def _old_slugify(s):
+    # As was in misc.py, for benchmarking
+    intermediate = re.sub('sinn f.in', 'sinn fein', s.lower())
+    return re.sub(r'\W+', '-', intermediate)
+
+
+def _old_clean_constituency_name(s):
+    # As was in constituency.py, for benchmarking
+    return re.sub(r'\s*\d+$', '', s.strip()).replace('&', 'and')
+
+
+def benchmark(names, repeat=5, number=20):
+    import timeit
+    timings = [
+        ('slugify (old)', lambda: [_old_slugify(z) for z in names]),
+        ('slugify (uncached)', lambda: [slugify.uncached(z) for z in names]),
+        ('slugify', lambda: [slugify(z) for z in names]),
+        ('clean_constituency_name (old)',
+         lambda: [_old_clean_constituency_name(z) for z in names]),
+        ('clean_constituency_name',
+         lambda: [clean_constituency_name(z) for z in names])
+    ]
+    for label, func in timings:
+        best = min(timeit.repeat(func, repeat=repeat, number=number))
+        print('%-32s %8.2f us per name' % (label, 1e6 * best / (number * len(names))))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as inputstream:
+            distinct_names = [z.strip() for z in inputstream if z.strip()]
+    else:
+        distinct_names = ['Constituency Number %d & Somewhere %d' % (i, i % 7)
+                          for i in range(650)]
+    # Typical usage hits the same names over and over
+    benchmark(distinct_names * 10)
@@ -1,27 +1,57 @@
+import logging
+
 import webapp2
 
 
 # from google.appengine.api import taskqueue
 # from google.appengine.ext import db
-from google.appengine.api import memcache
 from google.appengine.api import urlfetch
 
-from grab_latest_petition_data import DOWNLOAD_URL
+from cache_backends import get_cache
+from grab_latest_petition_data import DOWNLOAD_URL, DOWNLOAD_KEY, DOWNLOAD_CACHE_TIME
+
+memcache = get_cache()
 
-DOWNLOAD_KEY = '241584'
-DOWNLOAD_CACHE_TIME = 60 * 5
+# The last download along with its ETag and Last-Modified, so that requests
+# can be made conditional on them.  This has to outlive the cron interval
+# (see cron.yaml) - DOWNLOAD_KEY doesn't - otherwise every cron fetch would
+# be a full download.
+LAST_DOWNLOAD_KEY = DOWNLOAD_KEY + '-last'
+LAST_DOWNLOAD_CACHE_TIME = 60 * 60
 
 
 def get_latest():
+    """
+    Return the latest petition JSON, only downloading it if it has changed
+    since we last got it
+    """
+    last = memcache.get(LAST_DOWNLOAD_KEY) or {}
+    headers = {}
+    if last.get('content'):
+        if last.get('etag'):
+            headers['If-None-Match'] = last['etag']
+        if last.get('last_modified'):
+            headers['If-Modified-Since'] = last['last_modified']
+
     # Do we need to set deadline?
-    result = urlfetch.fetch(DOWNLOAD_URL)
-    if result.status_code == 200:
-        memcache.set(DOWNLOAD_KEY, result.content, time=DOWNLOAD_CACHE_TIME)
-        return result.content
+    result = urlfetch.fetch(DOWNLOAD_URL, headers=headers)
+    if result.status_code == 304 and last.get('content'):
+        # Nothing new, just keep what we've got for a bit longer
+        content = last['content']
+    elif result.status_code == 200:
+        content = result.content
+        last = {
+            'etag': result.headers.get('ETag'),
+            'last_modified': result.headers.get('Last-Modified'),
+            'content': content
+        }
     else:
         logging.error('Received %s response when getting %s' %
                       (result.status_code, DOWNLOAD_URL))
-    return False
+        return False
+    memcache.set(LAST_DOWNLOAD_KEY, last, time=LAST_DOWNLOAD_CACHE_TIME)
+    memcache.set(DOWNLOAD_KEY, content, time=DOWNLOAD_CACHE_TIME)
+    return content
 
 class GetLatestJSON(webapp2.RequestHandler):
     def get(self):
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Cache of a generated page, for pages that are expensive to render and that
+only depend on one piece of source data - i.e. the revoke comparison page,
+which only changes when the petition JSON does.
+
+Rather than just expiring the page after a fixed time (at which point every
+request that arrives before it is regenerated would render it again), the
+cached page records a hash of the data it was rendered from, and:
+
+* For max_age seconds after it was (re)validated, it's returned as is.
+* After that, the first request to acquire a lock - via cache.add() -
+  fetches the data, and only re-renders the page if the data's hash has
+  changed.  Meanwhile other requests are given the cached page, for up to
+  stale_time seconds beyond max_age.
+* Beyond that, requests wait (up to lock_time) for the request holding the
+  lock to finish, only falling back to the old page if it doesn't.
+
+cache is anything with get(), set(), add() and delete() functions/methods
+along the lines of google.appengine.api.memcache - see cache_backends.py.
+
+iter_get() is the streaming equivalent of get(): when the page has to be
+re-rendered, each chunk is passed on to the caller as soon as it's
+produced, and the complete page is only stored once the last one has been.
+Note that this is to get the start of the page to the browser sooner, not
+to save memory - the chunks are still all held until then, as the complete
+page is what gets cached (and what a cache hit returns anyway).  As the
+chunks are only rendered as fast as the caller consumes them, a slow client
+also slows down the render, so the lock is released as soon as the last
+chunk has been rendered and the page stored, rather than when the caller
+has finished with it.  Other requests still wait for a slow client up to
+that point, but only beyond stale_time and for at most lock_time.
+
+Has to be usable under Python 2.
+"""
+
+import hashlib
+import logging
+import time
+
+DEFAULT_MAX_AGE = 60
+DEFAULT_STALE_TIME = 5 * 60
+# Long enough to fetch the data and render the page, which has to happen
+# within GAE's 60 second request deadline anyway
+DEFAULT_LOCK_TIME = 60
+WAIT_INTERVAL = 0.1
+
+_END = object()
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+class PageCache(object):
+    def __init__(self, cache, key, max_age=DEFAULT_MAX_AGE,
+                 stale_time=DEFAULT_STALE_TIME, lock_time=DEFAULT_LOCK_TIME):
+        self.cache = cache
+        self.key = key
+        self.lock_key = key + '-lock'
+        self.max_age = max_age
+        self.stale_time = stale_time
+        self.lock_time = lock_time
+        # For monitoring/testing - how many times this instance has rendered
+        self.renders = 0
+
+    def _store(self, data_key, content):
+        record = {'data_key': data_key, 'content': content,
+                  'validated': time.time()}
+        # The record itself never expires, so there's always a last good
+        # page to fall back on (unless memcache evicts it)
+        self.cache.set(self.key, record)
+        return record
+
+    def _wait_for_record(self, previous):
+        """
+        Wait for whoever holds the lock to store a newer record than
+        previous, returning it - or None if the lock is released or times
+        out without that happening
+        """
+        previous_validated = previous['validated'] if previous else None
+        deadline = time.time() + self.lock_time
+        while time.time() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            record = self.cache.get(self.key)
+            if record and record['validated'] != previous_validated:
+                return record
+            if self.cache.get(self.lock_key) is None:
+                return None
+        return None
+
+    def _iter_revalidate(self, record, get_data, iter_render, release):
+        """
+        Called with the lock held - generator of the content for the current
+        data, re-rendering only if the data has changed.  release() is called
+        as soon as the lock is no longer needed.
+        """
+        data = get_data()
+        if not data:
+            if record:
+                logging.warning('No data for %s - keeping the existing page' %
+                                (self.key))
+                release()
+                yield record['content']
+                return
+            raise ValueError('No data to render %s from' % (self.key))
+        data_key = content_hash(data)
+        if record and record['data_key'] == data_key:
+            logging.info('Data for %s unchanged - not re-rendering' % (self.key))
+            content = self._store(data_key, record['content'])['content']
+            release()
+            yield content
+            return
+        chunks = []
+        rendered = iter(iter_render(data))
+        chunk = next(rendered, _END)
+        while chunk is not _END:
+            chunks.append(chunk)
+            # Rendered one ahead, so that we know when the last chunk is the
+            # last before passing it on
+            next_chunk = next(rendered, _END)
+            if next_chunk is _END:
+                # If the caller gave up part way through, we never get here,
+                # so an incomplete page is never stored
+                self.renders += 1
+                self._store(data_key, ''.join(chunks))
+                release()
+            yield chunk
+            chunk = next_chunk
+
+    def iter_get(self, get_data, iter_render):
+        """
+        Generator of the page content.  get_data() should return the (bytes
+        of) data the page is rendered from, and iter_render(data) should be a
+        generator of the chunks of the page, which are concatenated when
+        stored.
+        """
+        record = self.cache.get(self.key)
+        age = time.time() - record['validated'] if record else None
+        if record and age < self.max_age:
+            yield record['content']
+            return
+
+        if not self.cache.add(self.lock_key, 1, time=self.lock_time):
+            # Someone else is already revalidating
+            if record and age < self.max_age + self.stale_time:
+                yield record['content']
+                return
+            newer = self._wait_for_record(record)
+            if newer:
+                yield newer['content']
+                return
+            if record:
+                yield record['content']
+                return
+            logging.warning('Timed out waiting for %s - rendering it anyway' %
+                            (self.key))
+            for chunk in self._iter_revalidate(None, get_data, iter_render,
+                                               lambda: None):
+                yield chunk
+            return
+
+        released = []
+        def release():
+            if not released:
+                released.append(True)
+                self.cache.delete(self.lock_key)
+        try:
+            for chunk in self._iter_revalidate(record, get_data, iter_render,
+                                               release):
+                yield chunk
+        finally:
+            release()
+
+    def get(self, get_data, render):
+        """
+        Return the page content.  get_data() should return the (bytes of)
+        data the page is rendered from, and render(data) the page content.
+        """
+        return ''.join(self.iter_get(get_data, lambda data: [render(data)]))
+
+    def invalidate(self):
+        self.cache.delete(self.key)
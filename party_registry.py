@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Registry of parties, so that each party can be referred to by a small integer
+ID rather than by name, with the things that are derived from the name - slug,
+CSS class, colour - only worked out once per party, rather than every time
+something is rendered.
+
+The raw identifiers that appear in the CSVs are mapped to canonical names via
+canonical_party_names.py, so e.g. 'Labour and Co-operative', 'lab' and
+'Labour' all get the same ID.
+
+IDs are only meaningful within the current process - anything that is
+persisted (e.g. pickled CandidateResult objects) should store the name.
+"""
+
+from collections import namedtuple
+import os
+import re
+import sys
+import threading
+
+from canonical_party_names import CANONICAL_PARTY_NAMES
+from misc import slugify
+from settings import STATIC_DIR
+
+PARTY_COLOURS_CSS = os.path.join(STATIC_DIR, 'party_and_region_colours.css')
+
+# Matches the custom properties e.g. "--conservative: #0087dc;" in the
+# :root {...} block
+ROOT_BLOCK_REGEX = re.compile(r':root\s*\{(.*?)\}', re.DOTALL)
+CSS_PROPERTY_REGEX = re.compile(r'--([\w-]+)\s*:\s*([^;]+);')
+
+
+Party = namedtuple('Party', ['id', 'name', 'slug', 'css_class'])
+
+
+def load_party_colours(css_file=PARTY_COLOURS_CSS):
+    """
+    Return a dict of party slug->colour, from the custom properties defined
+    in css_file
+    """
+    with open(css_file) as cssstream:
+        css = cssstream.read()
+    colours = {}
+    for block in ROOT_BLOCK_REGEX.findall(css):
+        for slug, colour in CSS_PROPERTY_REGEX.findall(block):
+            colours[slug] = colour.strip()
+    return colours
+
+
+class PartyRegistry(object):
+    """
+    Map party names - raw or canonical - to integer IDs, which are allocated
+    as new parties are encountered.  The canonical names in
+    canonical_name_map are registered up front, so the main parties always
+    have the same (low) IDs.
+    """
+    def __init__(self, canonical_name_map=None, css_file=PARTY_COLOURS_CSS):
+        if canonical_name_map is None:
+            canonical_name_map = CANONICAL_PARTY_NAMES
+        self.canonical_name_map = canonical_name_map
+        self.css_file = css_file
+        self._parties = []
+        self._ids = {} # raw or canonical name -> ID
+        self._lock = threading.Lock()
+        self._colours = None
+        for name in sorted(set(canonical_name_map.values())):
+            self.intern(name)
+
+    def intern(self, raw_name):
+        """
+        Return the ID for raw_name, registering it if it's not already known
+        """
+        try:
+            return self._ids[raw_name]
+        except KeyError:
+            pass
+        name = self.canonical_name_map.get(raw_name, raw_name)
+        with self._lock:
+            party_id = self._ids.get(name)
+            if party_id is None:
+                party_id = len(self._parties)
+                slug = slugify(name)
+                self._parties.append(Party(party_id, name, slug, 'party-' + slug))
+                self._ids[name] = party_id
+            self._ids[raw_name] = party_id
+        return party_id
+
+    def __len__(self):
+        return len(self._parties)
+
+    def __getitem__(self, party_id):
+        return self._parties[party_id]
+
+    def __iter__(self):
+        return iter(list(self._parties))
+
+    def name(self, party_id):
+        return self._parties[party_id].name
+
+    def slug(self, party_id):
+        return self._parties[party_id].slug
+
+    def css_class(self, party_id):
+        return self._parties[party_id].css_class
+
+    def names(self):
+        """
+        Return a list of all the canonical names, indexed by ID
+        """
+        return [z.name for z in self._parties]
+
+    def colour(self, party_id, default=None):
+        """
+        Return the CSS colour for party_id, or default if it doesn't have one
+        """
+        if self._colours is None:
+            try:
+                self._colours = load_party_colours(self.css_file)
+            except (IOError, OSError):
+                self._colours = {}
+        return self._colours.get(self._parties[party_id].slug, default)
+
+
+PARTY_REGISTRY = PartyRegistry()
+
+
+def party_id(raw_name):
+    """
+    Return the ID for raw_name in the default registry
+    """
+    return PARTY_REGISTRY.intern(raw_name)
+
+
+if __name__ == '__main__':
+    for name in sys.argv[1:]:
+        party = PARTY_REGISTRY[party_id(name)]
+        print('%s -> %s (%s)' % (name, party, PARTY_REGISTRY.colour(party.id)))
+    if len(sys.argv) < 2:
+        for party in PARTY_REGISTRY:
+            print('%3d %-30s %s' % (party.id, party.name, PARTY_REGISTRY.colour(party.id)))
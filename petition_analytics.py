@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Vectorized analysis of petition signatures against a General Election, built
+on election_table.ElectionTable - e.g. how many constituencies have more
+signatures than their winning margin, broken down by region or winning
+party, over a sweep of thresholds, and over every snapshot in a
+signature_store.SignatureStore rather than just the latest.
+
+Signatures are compared against one of these measures (MEASURES) of each
+constituency, as a percentage - i.e. the same ratios as the columns of the
+revoke comparison table:
+* electorate
+* turnout - valid votes cast
+* winner - the winning candidate's votes
+* margin - the winning margin in votes
+
+A constituency is past a threshold if its signatures are more than
+threshold percent of the measure, so the headline "more signatures than the
+winning margin" figure is a threshold of 100 against margin.
+
+NumPy is required - see election_table.py.
+"""
+
+import sys
+
+from election_table import ElectionTable, np
+
+MEASURES = ('electorate', 'turnout', 'winner', 'margin')
+GROUPINGS = ('region', 'party')
+
+DEFAULT_THRESHOLDS = (25, 50, 75, 100, 150, 200)
+
+
+class PetitionAnalytics(object):
+    def __init__(self, table):
+        """
+        table is an ElectionTable - or a list of ConstituencyResult objects to
+        make one from
+        """
+        if not isinstance(table, ElectionTable):
+            table = ElectionTable(table)
+        self.table = table
+
+        self.denominators = {
+            'electorate': table.electorate,
+            'turnout': table.valid_votes,
+            'winner': table.winner_votes,
+            'margin': table.margin
+        }
+
+        regions = [z.constituency.country_and_region for z in table]
+        self.regions = sorted(set(regions))
+        region_index = dict((r, i) for i, r in enumerate(self.regions))
+        self.region = np.array([region_index[z] for z in regions], dtype=np.int64)
+        self.group_labels = {'region': self.regions, 'party': table.parties}
+        self.group_ids = {'region': self.region,
+                          'party': table.winner.astype(np.int64)}
+
+        # Column mapping for each SignatureStore we've been given, keyed by
+        # its tuple of ONS codes
+        self._store_columns = {}
+
+    ### Signature arrays
+
+    def signatures(self, ons2signatures):
+        """
+        Return an array of signatures aligned with the table's rows, from a
+        dict of ONS code->signatures (as returned by
+        petition_stream.extract_petition_data()).  Missing constituencies
+        are zero.
+        """
+        return np.array([ons2signatures.get(z, 0) for z in self.table.ons_codes],
+                        dtype=np.int64)
+
+    def _columns_for(self, ons_codes):
+        key = tuple(ons_codes)
+        columns = self._store_columns.get(key)
+        if columns is None:
+            column_index = dict((ons, i) for i, ons in enumerate(ons_codes))
+            columns = np.array([column_index.get(z, -1) for z in self.table.ons_codes],
+                               dtype=np.int64)
+            self._store_columns[key] = columns
+        return columns
+
+    def snapshot_signatures(self, store):
+        """
+        Return a tuple of (array of snapshot times in ms, (snapshots x
+        constituencies) array of signatures aligned with the table's rows)
+        for every snapshot in a SignatureStore
+        """
+        num_rows = len(store)
+        if not num_rows:
+            return (np.zeros(0, dtype=np.int64),
+                    np.zeros((0, len(self.table)), dtype=np.int64))
+        columns = self._columns_for(store.ons_codes)
+        counts = np.asarray(store.counts()).reshape(num_rows, len(store.ons_codes))
+        # Constituencies the store doesn't know about get zero
+        sigs = np.where(columns >= 0, counts[:, np.maximum(columns, 0)], 0)
+        return np.array(store.times(), dtype=np.int64), sigs.astype(np.int64)
+
+    ### Ratios and thresholds
+
+    def ratio(self, sigs, measure='margin'):
+        """
+        Return an array of signatures as a percentage of measure.  sigs can be
+        a 1-D array (one snapshot) or 2-D (snapshots x constituencies).
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 100.0 * sigs / self.denominators[measure]
+
+    def ratios(self, sigs):
+        """
+        Return a dict of measure->ratio() array for all MEASURES
+        """
+        return dict((m, self.ratio(sigs, m)) for m in MEASURES)
+
+    def past_threshold(self, sigs, threshold=100, measure='margin'):
+        """
+        Return a boolean array of whether signatures are more than threshold
+        percent of measure
+        """
+        # Compared in integers where we can, so that e.g. signatures equal
+        # to the margin are exactly not past 100%
+        if float(threshold).is_integer():
+            return 100 * sigs > int(threshold) * self.denominators[measure]
+        return self.ratio(sigs, measure) > threshold
+
+    def summary(self, sigs):
+        """
+        Return a tuple of (number of constituencies with more signatures than
+        their winning margin, how many of those voted leave) - the headline
+        figures of the revoke comparison page
+        """
+        above = sigs > self.table.margin
+        # NaN (no EU Referendum data) compares as False
+        with np.errstate(invalid='ignore'):
+            leave = self.table.leave_pc > 50.0
+        return int(np.count_nonzero(above)), int(np.count_nonzero(above & leave))
+
+    def count_by(self, sigs, by, threshold=100, measure='margin'):
+        """
+        Return a dict of region or winning party (as per by) -> number of
+        constituencies past threshold, omitting those with none
+        """
+        mask = self.past_threshold(sigs, threshold, measure)
+        counts = np.bincount(self.group_ids[by][mask],
+                             minlength=len(self.group_labels[by]))
+        labels = self.group_labels[by]
+        return dict((labels[i], int(n)) for i, n in enumerate(counts) if n)
+
+    def sweep(self, sigs, thresholds=DEFAULT_THRESHOLDS, measure='margin', by=None):
+        """
+        Return the number of constituencies past each of thresholds, for one
+        snapshot (1-D sigs) or many (2-D sigs, snapshots x constituencies).
+        The result has shape ([snapshots,] thresholds), or if by is 'region'
+        or 'party', ([snapshots,] thresholds, groups) - see
+        self.group_labels[by] for what the groups are.
+        """
+        sigs = np.asarray(sigs)
+        single = sigs.ndim == 1
+        sigs = np.atleast_2d(sigs)
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        order = np.argsort(thresholds)
+        sorted_thresholds = thresholds[order]
+        num_snapshots, num_thresholds = sigs.shape[0], len(thresholds)
+
+        # For each snapshot and constituency, the number of thresholds it is
+        # past - as thresholds are sorted, those are the first k of them
+        ratio = self.ratio(sigs, measure)
+        k = np.searchsorted(sorted_thresholds, np.nan_to_num(ratio), side='left')
+        if by is None:
+            num_groups = 1
+            bins = np.arange(num_snapshots)[:, None] * (num_thresholds + 1) + k
+        else:
+            num_groups = len(self.group_labels[by])
+            groups = self.group_ids[by][None, :]
+            bins = ((np.arange(num_snapshots)[:, None] * num_groups + groups) *
+                    (num_thresholds + 1) + k)
+        hist = np.bincount(bins.ravel(),
+                           minlength=num_snapshots * num_groups * (num_thresholds + 1))
+        hist = hist.reshape(num_snapshots, num_groups, num_thresholds + 1)
+        # Past threshold j <=> k > j, so count from the top down
+        past = np.cumsum(hist[:, :, ::-1], axis=2)[:, :, ::-1][:, :, 1:]
+
+        # Back to the caller's order of thresholds, as (snapshots, thresholds,
+        # groups)
+        ret = np.empty_like(past)
+        ret[:, :, order] = past
+        ret = ret.transpose(0, 2, 1)
+        if by is None:
+            ret = ret[:, :, 0]
+        return ret[0] if single else ret
+
+    def snapshot_sweep(self, store, thresholds=DEFAULT_THRESHOLDS, measure='margin',
+                       by=None):
+        """
+        sweep() over every snapshot in a SignatureStore, returning a tuple of
+        (array of snapshot times in ms, result of sweep())
+        """
+        times, sigs = self.snapshot_signatures(store)
+        return times, self.sweep(sigs, thresholds, measure, by)
+
+
+def load_petition_analytics(year=2017):
+    """
+    Convenience function to return PetitionAnalytics for the General Election
+    in year
+    """
+    from election_table import load_election_table
+    return PetitionAnalytics(load_election_table(year))
+
+
+if __name__ == '__main__':
+    from petition_stream import extract_petition_data
+    from grab_latest_petition_data import check_latest_petition_data
+
+    analytics = load_petition_analytics()
+    petition_file = sys.argv[1] if len(sys.argv) > 1 else check_latest_petition_data()[0]
+    _, updated_at, ons2signatures = extract_petition_data(petition_file)
+    sigs = analytics.signatures(ons2signatures)
+    print('%s: %d above margin, %d of which voted leave' %
+          ((updated_at,) + analytics.summary(sigs)))
+    print('%-35s %s' % ('% of margin', ' '.join('%5d' % z for z in DEFAULT_THRESHOLDS)))
+    by_region = analytics.sweep(sigs, by='region')
+    for i, region in enumerate(analytics.regions):
+        print('%-35s %s' % (region, ' '.join('%5d' % z for z in by_region[:, i])))
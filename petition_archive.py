@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Compact archive of petition JSON snapshots.  Successive snapshots only differ
+in a few signature counts, so rather than storing each one in full, the
+archive stores a keyframe (the complete original file) every
+KEYFRAME_INTERVAL snapshots, and in between just the differences from the
+preceding keyframe - mostly per-constituency and per-country counts.
+
+Any snapshot can be read back - as the exact bytes of the original file -
+by decoding at most one keyframe and one delta.  Each delta is checked when
+it is added, and if the original can't be exactly reproduced from it (e.g.
+the JSON was formatted in some way that json.dumps() can't recreate) the
+snapshot is stored as a keyframe instead.
+
+The archive is a directory containing:
+* snapshots.dat - the zlib-compressed records, appended one after another
+* snapshots.idx - JSON-lines index of the records (name, offset, length,
+  keyframe index)
+
+Once a snapshot is archived, the original file can be deleted with prune()
+- or ./petition_archive.py prune <directory> - and recreated if need be
+with export().
+
+Python 3 only.
+"""
+
+import json
+import logging
+import os
+import sys
+import zlib
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(__file__), 'source_data',
+                                   'archive')
+DATA_FILE = 'snapshots.dat'
+INDEX_FILE = 'snapshots.idx'
+
+KEYFRAME_INTERVAL = 50
+
+# A delta bigger than this fraction of its keyframe isn't worth having
+MAX_DELTA_RATIO = 0.5
+
+# Lists of objects with one of these fields are diffed by that field, so
+# that e.g. a country being inserted into signatures_by_country doesn't
+# make every subsequent entry look different
+LIST_KEY_FIELDS = ('ons_code', 'code')
+
+# json.dumps() arguments that might reproduce the original formatting - the
+# petitions site uses the first
+SERIALIZATION_STYLES = [
+    {'separators': (',', ':'), 'ensure_ascii': False},
+    {'separators': (',', ':'), 'ensure_ascii': True},
+    {'ensure_ascii': False},
+    {'ensure_ascii': True}
+]
+
+
+class ArchiveError(Exception):
+    pass
+
+
+### Structural diff of decoded JSON
+# A diff is a dict with one of these keys:
+# * 'v' - replacement value
+# * 'd' - dict of key->diff for the changed keys of an object
+# * 'l' - dict of str(index)->diff for the changed items of a list
+# * '+' - amount to add to an integer
+# * 'k' - for lists of objects with a key field: the field name, plus
+#   either:
+#   * 'c' - if the keys are unchanged and only integer fields have changed
+#     (i.e. signature counts, which is the usual case): dict of field
+#     name->list of the amounts to add, one per item.  This is much smaller
+#     than diffing each item, especially once compressed.
+#   * 'i' - dict of key->diff for changed/new items, and if the set or order
+#     of keys changed, 'o' (list of keys in order)
+
+def _list_key_field(old, new):
+    for field in LIST_KEY_FIELDS:
+        if all(isinstance(z, dict) and field in z for z in old) and \
+           all(isinstance(z, dict) and field in z for z in new):
+            old_keys = [z[field] for z in old]
+            new_keys = [z[field] for z in new]
+            if len(set(old_keys)) == len(old_keys) and \
+               len(set(new_keys)) == len(new_keys):
+                return field
+    return None
+
+
+def diff(old, new):
+    """
+    Return a diff that turns old into new, or None if they are the same
+    """
+    if type(old) is not type(new):
+        return {'v': new}
+    if isinstance(new, dict):
+        # Key order matters, as we need to reproduce the original bytes
+        if list(old.keys()) != list(new.keys()):
+            return {'v': new}
+        changes = {}
+        for k in new:
+            d = diff(old[k], new[k])
+            if d is not None:
+                changes[k] = d
+        return {'d': changes} if changes else None
+    if isinstance(new, list):
+        if old == new:
+            return None
+        field = _list_key_field(old, new) if old and new else None
+        if field:
+            old_map = dict((z[field], z) for z in old)
+            new_keys = [z[field] for z in new]
+            changes = {}
+            for item in new:
+                key = item[field]
+                if key in old_map:
+                    d = diff(old_map[key], item)
+                else:
+                    d = {'v': item}
+                if d is not None:
+                    changes[key] = d
+            if new_keys != [z[field] for z in old]:
+                return {'k': field, 'i': changes, 'o': new_keys}
+            columns = _column_diff(changes, new_keys)
+            if columns is not None:
+                return {'k': field, 'c': columns}
+            return {'k': field, 'i': changes}
+        if len(old) == len(new):
+            changes = {}
+            for i, (o, n) in enumerate(zip(old, new)):
+                d = diff(o, n)
+                if d is not None:
+                    changes[str(i)] = d
+            return {'l': changes}
+        return {'v': new}
+    if old == new:
+        return None
+    if isinstance(new, int) and not isinstance(new, bool):
+        return {'+': new - old}
+    return {'v': new}
+
+
+def _column_diff(changes, keys):
+    """
+    Return the 'c' form of a keyed list diff, given the per-item changes and
+    the (unchanged) keys in order, or None if there are changes other than
+    to integers
+    """
+    columns = {}
+    for i, key in enumerate(keys):
+        d = changes.get(key)
+        if d is None:
+            continue
+        if 'd' not in d:
+            return None
+        for field, field_diff in d['d'].items():
+            if '+' not in field_diff:
+                return None
+            if field not in columns:
+                columns[field] = [0] * len(keys)
+            columns[field][i] = field_diff['+']
+    return columns
+
+
+def apply_diff(old, d):
+    """
+    Return a new value from old and a diff as returned by diff(old, new).
+    old is not modified.
+    """
+    if d is None:
+        return old
+    if 'v' in d:
+        return d['v']
+    if '+' in d:
+        return old + d['+']
+    if 'd' in d:
+        changes = d['d']
+        return dict((k, apply_diff(v, changes.get(k))) for k, v in old.items())
+    if 'l' in d:
+        changes = d['l']
+        return [apply_diff(v, changes.get(str(i))) for i, v in enumerate(old)]
+    if 'c' in d:
+        columns = d['c']
+        return [dict((k, v + columns[k][i] if k in columns else v)
+                     for k, v in item.items())
+                for i, item in enumerate(old)]
+    if 'k' in d:
+        field = d['k']
+        changes = d['i']
+        old_map = dict((z[field], z) for z in old)
+        keys = d.get('o') or [z[field] for z in old]
+        ret = []
+        for key in keys:
+            if key in old_map:
+                ret.append(apply_diff(old_map[key], changes.get(key)))
+            else:
+                ret.append(changes[key]['v'])
+        return ret
+    raise ArchiveError('Unknown diff %s' % (list(d.keys())))
+
+
+def serialize(data, style, suffix=''):
+    return (json.dumps(data, **SERIALIZATION_STYLES[style]) + suffix).encode('utf-8')
+
+
+def find_style(data, raw):
+    """
+    Return a tuple of (style index, suffix) such that serialize(data, style,
+    suffix) == raw, or None if there isn't one
+    """
+    for style in range(len(SERIALIZATION_STYLES)):
+        text = serialize(data, style)
+        if raw.startswith(text):
+            suffix = raw[len(text):]
+            if not suffix.strip():
+                return style, suffix.decode('utf-8')
+    return None
+
+
+class PetitionArchive(object):
+    def __init__(self, directory=DEFAULT_ARCHIVE_DIR,
+                 keyframe_interval=KEYFRAME_INTERVAL):
+        self.directory = directory
+        self.keyframe_interval = keyframe_interval
+        self.entries = []
+        self._name_index = {}
+        self._index_size = 0 # Bytes of the index file that are valid
+        # (keyframe index, decoded keyframe) of the last keyframe we decoded
+        self._keyframe_cache = (None, None)
+        self._load_index()
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _load_index(self):
+        try:
+            data_size = os.path.getsize(self._path(DATA_FILE))
+            with open(self._path(INDEX_FILE), 'rb') as inputstream:
+                for line in inputstream:
+                    try:
+                        entry = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        break # Partially written last line
+                    if entry['offset'] + entry['length'] > data_size:
+                        break # Record wasn't completely written
+                    self._add_entry(entry)
+                    self._index_size += len(line)
+        except (IOError, OSError):
+            pass
+
+    def _add_entry(self, entry):
+        self._name_index[entry['name']] = len(self.entries)
+        self.entries.append(entry)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, name):
+        return name in self._name_index
+
+    def names(self):
+        return [z['name'] for z in self.entries]
+
+    def index_of(self, name):
+        return self._name_index[name]
+
+    ### Reading
+
+    def _read_record(self, entry):
+        with open(self._path(DATA_FILE), 'rb') as inputstream:
+            inputstream.seek(entry['offset'])
+            return zlib.decompress(inputstream.read(entry['length']))
+
+    def _decoded_keyframe(self, keyframe_index):
+        cached_index, decoded = self._keyframe_cache
+        if cached_index != keyframe_index:
+            raw = self._read_record(self.entries[keyframe_index])
+            decoded = json.loads(raw.decode('utf-8'))
+            self._keyframe_cache = (keyframe_index, decoded)
+        return decoded
+
+    def get(self, i):
+        """
+        Return the original bytes of snapshot i
+        """
+        entry = self.entries[i]
+        record = self._read_record(entry)
+        if entry['keyframe'] == i:
+            return record
+        delta = json.loads(record.decode('utf-8'))
+        data = apply_diff(self._decoded_keyframe(entry['keyframe']), delta['diff'])
+        return serialize(data, delta['style'], delta['suffix'])
+
+    def get_by_name(self, name):
+        return self.get(self.index_of(name))
+
+    def export(self, i, output_directory):
+        """
+        Write snapshot i to output_directory, with its original filename
+        """
+        filename = os.path.join(output_directory, self.entries[i]['name'])
+        with open(filename, 'wb') as outputstream:
+            outputstream.write(self.get(i))
+        return filename
+
+    ### Writing
+
+    def _latest_keyframe(self):
+        if not self.entries:
+            return None
+        return self.entries[-1]['keyframe']
+
+    def _make_delta(self, raw):
+        """
+        Return a compressed delta record for raw, or None if it should be
+        stored as a keyframe
+        """
+        keyframe_index = self._latest_keyframe()
+        if keyframe_index is None or \
+           len(self.entries) - keyframe_index >= self.keyframe_interval:
+            return None
+        try:
+            data = json.loads(raw.decode('utf-8'))
+        except ValueError:
+            return None
+        style = find_style(data, raw)
+        if style is None:
+            return None
+        try:
+            keyframe = self._decoded_keyframe(keyframe_index)
+        except ValueError:
+            # Keyframe isn't JSON, so can't be a base for deltas
+            return None
+        delta = {'style': style[0], 'suffix': style[1], 'diff': diff(keyframe, data)}
+        # Make sure we really can recreate the original
+        if serialize(apply_diff(keyframe, delta['diff']), *style) != raw:
+            return None
+        record = zlib.compress(json.dumps(delta, separators=(',', ':')).encode('utf-8'))
+        if len(record) > MAX_DELTA_RATIO * self.entries[keyframe_index]['length']:
+            return None
+        return record
+
+    def append(self, name, raw):
+        """
+        Add a snapshot - raw being the bytes of the JSON file - returning its
+        index.  Snapshots with a name that's already in the archive are
+        ignored.
+        """
+        if name in self._name_index:
+            return self._name_index[name]
+        record = self._make_delta(raw)
+        index = len(self.entries)
+        if record is None:
+            record = zlib.compress(raw)
+            keyframe_index = index
+        else:
+            keyframe_index = self._latest_keyframe()
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(self._path(DATA_FILE), 'ab') as outputstream:
+            # A previous append might have died after writing its record but
+            # before indexing it, so don't trust the end of the file
+            offset = self.entries[-1]['offset'] + self.entries[-1]['length'] \
+                     if self.entries else 0
+            outputstream.truncate(offset)
+            outputstream.write(record)
+        entry = {'name': name, 'offset': offset, 'length': len(record),
+                 'keyframe': keyframe_index}
+        line = (json.dumps(entry, sort_keys=True) + '\n').encode('utf-8')
+        with open(self._path(INDEX_FILE), 'ab') as outputstream:
+            outputstream.truncate(self._index_size)
+            outputstream.write(line)
+        self._add_entry(entry)
+        self._index_size += len(line)
+        return index
+
+    def append_file(self, filename):
+        with open(filename, 'rb') as inputstream:
+            return self.append(os.path.basename(filename), inputstream.read())
+
+    ### Retiring the original files
+
+    def prune(self, directory, keep=()):
+        """
+        Delete the files in directory that are in the archive - having
+        checked that the archive gives back exactly the same bytes - other
+        than those named in keep (e.g. the latest snapshot, which the front
+        ends read).  Returns a list of the deleted filenames.
+        """
+        keep = set(os.path.basename(z) for z in keep)
+        pruned = []
+        for name in self.names():
+            if name in keep:
+                continue
+            filename = os.path.join(directory, name)
+            try:
+                with open(filename, 'rb') as inputstream:
+                    raw = inputstream.read()
+            except (IOError, OSError):
+                continue # Already pruned
+            if self.get_by_name(name) != raw:
+                logging.warning('Not pruning %s as it differs from the archived copy' %
+                                (filename))
+                continue
+            os.remove(filename)
+            pruned.append(filename)
+        return pruned
+
+
+if __name__ == '__main__':
+    archive = PetitionArchive()
+    if len(sys.argv) > 2 and sys.argv[1] == 'add':
+        original_size = 0
+        for fn in sorted(sys.argv[2:]):
+            archive.append_file(fn)
+            original_size += os.path.getsize(fn)
+        print('%d bytes of JSON archived in %d bytes' %
+              (original_size, os.path.getsize(archive._path(DATA_FILE))))
+    elif len(sys.argv) > 2 and sys.argv[1] == 'export':
+        for i in range(len(archive)):
+            print(archive.export(i, sys.argv[2]))
+    elif len(sys.argv) > 2 and sys.argv[1] == 'prune':
+        # Keeping the latest, as that's what the front ends read
+        pruned = archive.prune(sys.argv[2], keep=archive.names()[-1:])
+        print('%d archived files deleted' % (len(pruned)))
+    else:
+        keyframes = sum(1 for i, z in enumerate(archive.entries) if z['keyframe'] == i)
+        print('%d snapshots (%d keyframes)' % (len(archive), keyframes))
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Append-only manifest of the downloaded petition data files, so that finding
+the freshest one - or iterating over all of them in order - doesn't require
+stat()ing or parsing every file in the download directory.
+
+The manifest is a JSON-lines file, one entry per downloaded file, in the
+order they were downloaded.  Each entry records:
+* filename - relative to the manifest's directory
+* epoch - when the file was fetched
+* updated_at (and updated_epoch) - the petition's own timestamp
+* size and sha1 of the file
+* signature_count and constituency_total
+* freshest_filename and freshest_updated_epoch - the file with the latest
+  updated_at of this and all the earlier entries, so that the last line of
+  the manifest answers both "what was downloaded last?" and "what is the
+  freshest data?"
+
+Entries are appended with a single O_APPEND write, so readers never see a
+half-written manifest - other than possibly a truncated last line, if the
+writer died or the write was short (e.g. disk full).  Such a line is
+ignored by readers, and the next append starts on a new line rather than
+being tacked on to it.  If the manifest is missing it can be rebuilt from
+the files with rebuild_manifest().
+
+Has to be usable as a Python 2 library.
+"""
+
+from datetime import datetime
+from glob import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from petition_stream import extract_petition_data
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), 'source_data')
+MANIFEST_FILENAME = 'petition_manifest.jsonl'
+DEFAULT_MANIFEST = os.path.join(DEFAULT_DIR, MANIFEST_FILENAME)
+
+# How much of the end of the manifest to read when looking for the last line -
+# entries are ~300 bytes
+TAIL_BLOCK_SIZE = 4096
+
+
+def timestamp_to_epoch(ts):
+    dt = datetime.strptime(ts, '%Y-%m-%dT%H:%M:%S.%fZ')
+    # Python 3 supports .timestamp() - although beware it returns float -
+    # but we have to support Python 2
+    return int((dt - datetime(1970,1,1)).total_seconds())
+
+
+def make_entry(filename, epoch=None):
+    """
+    Return a manifest entry (dict) for filename.  epoch is when the file was
+    downloaded, defaulting to the file's ctime.
+    """
+    hasher = hashlib.sha1()
+    with open(filename, 'rb') as inputstream:
+        data = inputstream.read()
+    hasher.update(data)
+    if epoch is None:
+        epoch = os.stat(filename).st_ctime
+    signature_count, updated_at, ons2signatures = extract_petition_data(data)
+    return {
+        'filename': os.path.basename(filename),
+        'epoch': int(epoch),
+        'updated_at': updated_at,
+        'updated_epoch': timestamp_to_epoch(updated_at),
+        'size': len(data),
+        'sha1': hasher.hexdigest(),
+        'signature_count': signature_count,
+        'constituency_total': sum(ons2signatures.values())
+    }
+
+
+def _carry_forward_freshest(entry, previous):
+    """
+    Set the freshest_* fields of entry, given the previous entry (or None)
+    """
+    if previous and previous['freshest_updated_epoch'] > entry['updated_epoch']:
+        entry['freshest_filename'] = previous['freshest_filename']
+        entry['freshest_updated_epoch'] = previous['freshest_updated_epoch']
+    else:
+        entry['freshest_filename'] = entry['filename']
+        entry['freshest_updated_epoch'] = entry['updated_epoch']
+    return entry
+
+
+def _entry_line(entry):
+    return (json.dumps(entry, sort_keys=True) + '\n').encode('utf-8')
+
+
+def append_entry(entry, manifest_file=DEFAULT_MANIFEST):
+    """
+    Append entry - as returned by make_entry() - to the manifest
+    """
+    _carry_forward_freshest(entry, latest_entry(manifest_file))
+    line = _entry_line(entry)
+    fd = os.open(manifest_file, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size:
+            os.lseek(fd, -1, os.SEEK_END)
+            if os.read(fd, 1) != b'\n':
+                # A previous append was truncated - don't join on to it
+                line = b'\n' + line
+        written = os.write(fd, line)
+    finally:
+        os.close(fd)
+    if written != len(line):
+        raise IOError('Short write to %s (%d of %d bytes)' %
+                      (manifest_file, written, len(line)))
+    return entry
+
+
+def add_file(filename, epoch=None, manifest_file=DEFAULT_MANIFEST):
+    """
+    Record a newly downloaded file in the manifest
+    """
+    return append_entry(make_entry(filename, epoch), manifest_file)
+
+
+def _parse_line(line):
+    """
+    Return the entry on line, or None if it isn't a complete one (most
+    likely a truncated line)
+    """
+    try:
+        entry = json.loads(line.decode('utf-8'))
+    except ValueError:
+        return None
+    if not isinstance(entry, dict) or 'freshest_filename' not in entry:
+        return None
+    return entry
+
+
+def read_entries(manifest_file=DEFAULT_MANIFEST):
+    """
+    Generator of all the entries in the manifest, oldest first
+    """
+    with open(manifest_file, 'rb') as inputstream:
+        for line in inputstream:
+            entry = _parse_line(line)
+            if entry is not None:
+                yield entry
+
+
+def latest_entry(manifest_file=DEFAULT_MANIFEST):
+    """
+    Return the most recently appended entry, or None if there isn't one.
+    This only reads the end of the manifest.
+    """
+    try:
+        inputstream = open(manifest_file, 'rb')
+    except (IOError, OSError):
+        return None
+    with inputstream:
+        inputstream.seek(0, os.SEEK_END)
+        end = inputstream.tell()
+        block_size = TAIL_BLOCK_SIZE
+        while True:
+            start = max(0, end - block_size)
+            inputstream.seek(start)
+            lines = inputstream.read(end - start).splitlines()
+            # The first line is only known to be complete if we read from
+            # the start of the file
+            candidates = lines if start == 0 else lines[1:]
+            for line in reversed(candidates):
+                entry = _parse_line(line)
+                if entry is not None:
+                    return entry
+            if start == 0:
+                return None
+            block_size *= 2
+
+
+def rebuild_manifest(directory=DEFAULT_DIR, pattern='241584*.json',
+                     manifest_file=None):
+    """
+    (Re)create the manifest from the files in directory, ordered by ctime -
+    for when it doesn't exist yet or has been lost.  Returns the number of
+    entries written.
+    """
+    manifest_file = manifest_file or os.path.join(directory, MANIFEST_FILENAME)
+    filenames = sorted(glob(os.path.join(directory, pattern)),
+                       key=lambda z: (os.stat(z).st_ctime, z))
+    lines = []
+    previous = None
+    for fn in filenames:
+        try:
+            entry = make_entry(fn)
+        except (ValueError, KeyError) as err:
+            logging.warning('Skipping unparseable petition file %s: %s' % (fn, err))
+            continue
+        previous = _carry_forward_freshest(entry, previous)
+        lines.append(_entry_line(entry))
+
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(manifest_file),
+                                        suffix='.tmp')
+    with os.fdopen(fd, 'wb') as outputstream:
+        outputstream.write(b''.join(lines))
+    # Not os.replace() as that doesn't exist in Python 2
+    os.rename(tmp_filename, manifest_file)
+    return len(lines)
+
+
+def latest_or_rebuild(directory=DEFAULT_DIR, manifest_file=None):
+    """
+    Return the latest entry in the manifest, rebuilding it first if need be.
+    Returns None if there are no petition files at all.
+    """
+    manifest_file = manifest_file or os.path.join(directory, MANIFEST_FILENAME)
+    entry = latest_entry(manifest_file)
+    if entry is None:
+        logging.warning('No petition manifest entries found - rebuilding %s' %
+                        (manifest_file))
+        try:
+            rebuild_manifest(directory, manifest_file=manifest_file)
+        except (IOError, OSError) as err:
+            # e.g. read-only filesystem on GAE
+            logging.warning('Unable to rebuild %s: %s' % (manifest_file, err))
+            return None
+        entry = latest_entry(manifest_file)
+    return entry
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--rebuild':
+        print('%d entries written' % (rebuild_manifest()))
+    else:
+        print(latest_or_rebuild())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+The petition comparison page as served by both front ends - py2_main.py
+(Python 2, webapp2, which main.py is a symlink to for app.yaml's main.app)
+and py3_main.py (Python 3, Flask) - so they share the same cache (see
+cache_backends.get_cache()), page caching and rendering, only differing in
+how they download the petition data and send the response.
+
+Has to be usable under Python 2.
+"""
+
+import logging
+
+from cache_backends import get_cache
+from grab_latest_petition_data import DOWNLOAD_KEY
+from page_cache import PageCache
+from revoke_comparison import iter_process
+
+PAGE_KEY = 'main_page'
+PAGE_CACHE_TIME = 60
+# How long past PAGE_CACHE_TIME we'll serve the old page while it's being
+# regenerated
+PAGE_STALE_TIME = 5 * 60
+
+# GAE memcache on GAE, otherwise as per the CACHE_BACKEND environment variable -
+# with multiple workers something like file or memcached:host:port is needed
+# for them to share it
+cache = get_cache()
+page_cache = PageCache(cache, PAGE_KEY, max_age=PAGE_CACHE_TIME,
+                       stale_time=PAGE_STALE_TIME)
+
+
+def get_content(stuff):
+    return """<!DOCTYPE html><html><head>
+<link rel="stylesheet" type="text/css" href="/static/table_colours.css" />
+<script src="/static/sortable.js">
+</script>
+</head>
+<body>%s</body></html>\n""" % (stuff)
+
+
+def load_from_file(filename):
+    with open(filename, mode='rb') as inputstream:
+        data = inputstream.read()
+    return data
+
+
+def get_petition_data(fetch_latest):
+    """
+    Return the latest petition JSON from the cache, or if it's not there,
+    from fetch_latest() - which should also put it in the cache under
+    DOWNLOAD_KEY e.g. offline.get_latest()
+    """
+    raw_data = cache.get(DOWNLOAD_KEY)
+    if raw_data:
+        logging.warning("loaded %s (%d bytes) from cache" % (DOWNLOAD_KEY,
+                                                             len(raw_data)))
+        return raw_data
+    logging.warning('Unable to get data %s from cache - getting it manually' %
+                    (DOWNLOAD_KEY))
+    return fetch_latest()
+
+
+def iter_render_page(raw_data):
+    logging.warning('Rendering page content %s' % (PAGE_KEY))
+    for chunk in iter_process(petition_json=raw_data, html_output=True,
+                              include_all=True, embed=False):
+        if isinstance(chunk, bytes): # Python 2
+            chunk = chunk.decode('iso-8859-1')
+        yield chunk + '\n'
+
+
+def iter_page(fetch_latest):
+    """
+    Generator of the page - only re-rendered when the petition data has
+    changed, and only by one request at a time.  If it is being re-rendered,
+    each chunk is yielded as soon as it's ready, so a front end that can
+    stream the response doesn't make the browser wait for the whole table.
+    """
+    return page_cache.iter_get(lambda: get_petition_data(fetch_latest),
+                               iter_render_page)
+
+
+def page(fetch_latest):
+    """
+    The whole page, for front ends that can't stream
+    """
+    return ''.join(iter_page(fetch_latest))
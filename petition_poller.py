@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Conditional polling of the petition JSON: a persistent (keep-alive) session,
+with If-None-Match/If-Modified-Since headers from the previous response, so
+that when nothing has changed the server can just reply 304 Not Modified.
+Even if the server does send the full document, it is only treated as a new
+snapshot if its content hash differs from the last one.
+
+The validators and hash are persisted in a small JSON state file, so this
+works across separate (e.g. cron) invocations, not just within a
+long-running process.  They are only updated when the caller calls
+commit() - i.e. once it has safely stored the new snapshot - so that a
+snapshot that fails to be saved will be fetched again next time.
+
+To try it out locally, run petition_test_server.py and point this at it:
+
+  ./petition_poller.py --url http://127.0.0.1:8241/petitions/241584.json
+"""
+
+from collections import namedtuple
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+
+try:
+    import requests
+except ImportError:
+    requests = None # e.g. on GAE, which uses offline.py instead
+
+DEFAULT_URL = os.environ.get('PETITION_URL',
+                             'https://petition.parliament.uk/petitions/241584.json')
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(__file__), 'source_data',
+                                  'poller_state.json')
+DEFAULT_POLL_INTERVAL = 10 * 60 # seconds
+
+NEW = 'new'
+NOT_MODIFIED = 'not-modified' # Server said 304
+UNCHANGED = 'unchanged' # Server sent the same content again
+
+# state is what to pass to commit() to record this response's validators
+PollResult = namedtuple('PollResult', ['status', 'content', 'sha1', 'state'])
+
+
+class PollError(Exception):
+    pass
+
+
+class PetitionPoller(object):
+    def __init__(self, url=DEFAULT_URL, state_file=DEFAULT_STATE_FILE,
+                 session=None, timeout=60):
+        self.url = url
+        self.state_file = state_file
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.state = self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_file) as inputstream:
+                state = json.load(inputstream)
+        except (IOError, OSError, ValueError):
+            return {}
+        # Validators are only meaningful for the URL they came from
+        if state.get('url') != self.url:
+            return {}
+        return state
+
+    def save_state(self):
+        if not self.state_file:
+            return
+        tmp_filename = self.state_file + '.tmp'
+        try:
+            with open(tmp_filename, 'w') as outputstream:
+                json.dump(self.state, outputstream)
+            os.rename(tmp_filename, self.state_file)
+        except (IOError, OSError) as err:
+            logging.warning('Unable to save poller state %s: %s' % (self.state_file, err))
+
+    def conditional_headers(self):
+        headers = {}
+        if self.state.get('etag'):
+            headers['If-None-Match'] = self.state['etag']
+        if self.state.get('last_modified'):
+            headers['If-Modified-Since'] = self.state['last_modified']
+        return headers
+
+    def poll(self):
+        """
+        Return a PollResult, content being the response body (bytes) if it's
+        a new snapshot, otherwise None.  Raises PollError for anything other
+        than a 2xx or 304 response.  Call commit() with the result once it
+        has been dealt with.
+        """
+        response = self.session.get(self.url, headers=self.conditional_headers(),
+                                    timeout=self.timeout)
+        if response.status_code == 304:
+            return PollResult(NOT_MODIFIED, None, self.state.get('sha1'), self.state)
+        if not 200 <= response.status_code < 300:
+            raise PollError('HTTP response %s from %s' % (response.status_code, self.url))
+
+        content = response.content
+        sha1 = hashlib.sha1(content).hexdigest()
+        status = UNCHANGED if sha1 == self.state.get('sha1') else NEW
+        state = {
+            'url': self.url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'sha1': sha1
+        }
+        return PollResult(status, content if status == NEW else None, sha1, state)
+
+    def commit(self, result):
+        """
+        Record the validators from result - as returned by poll() - so that
+        the next poll is conditional on them
+        """
+        if result.state != self.state:
+            self.state = result.state
+            self.save_state()
+
+    def poll_forever(self, on_new, interval=DEFAULT_POLL_INTERVAL):
+        """
+        Poll every interval seconds, calling on_new(content) whenever there's
+        a new snapshot
+        """
+        while True:
+            try:
+                result = self.poll()
+                logging.info('%s: %s' % (self.url, result.status))
+            except (PollError, requests.RequestException) as err:
+                logging.warning('Poll failed: %s' % (err))
+            else:
+                try:
+                    if result.status == NEW:
+                        on_new(result.content)
+                    self.commit(result)
+                except Exception as err:
+                    # Not committed, so it will be fetched again next time
+                    logging.exception('Unable to handle new snapshot: %s' % (err))
+            time.sleep(interval)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Poll for new petition data')
+    parser.add_argument('--url', default=DEFAULT_URL)
+    parser.add_argument('--interval', type=int, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument('--once', action='store_true',
+                        help='Just poll once and report the result')
+    args = parser.parse_args()
+
+    poller = PetitionPoller(args.url)
+    if args.once:
+        # Just reporting, so this doesn't commit the result
+        result = poller.poll()
+        print('%s %s' % (result.status, result.sha1))
+    else:
+        logging.basicConfig(level=logging.INFO)
+        from grab_latest_petition_data import save_new_snapshot
+        poller.poll_forever(lambda content: save_new_snapshot(content, time.time()),
+                            args.interval)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Pull just the fields we care about - signature_count, updated_at and
+signatures_by_constituency - out of petition JSON, without building the
+whole document in memory.  The rest of the document (most notably the
+signatures_by_country array, which keeps growing) is skipped over, and
+reading stops as soon as all the requested fields have been found.
+
+If ijson is installed it is used, otherwise there is a pure stdlib fallback
+that scans the structure with a regex and only decodes the values of the
+requested fields.
+
+Has to be usable as a Python 2 library.
+"""
+
+import codecs
+import io
+import json
+import re
+import sys
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+CHUNK_SIZE = 64 * 1024
+
+# The petition fields all live in the {"data": {"attributes": {...}}} object
+ATTRIBUTES_PATH = ('data', 'attributes')
+
+PETITION_FIELDS = ('signature_count', 'updated_at', 'signatures_by_constituency')
+
+# Matches the next token: a string, a structural character, or a scalar
+# (number/true/false/null), after any whitespace
+TOKEN_REGEX = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|([{}\[\]:,])|([^\s{}\[\]:,"]+))')
+WHITESPACE_REGEX = re.compile(r'\s*')
+
+
+class PetitionFormatError(ValueError):
+    pass
+
+
+def open_source(source):
+    """
+    Return a tuple of (binary or text stream, whether we opened it) for
+    source, which can be a filename, a string/bytes of JSON, or a file-like
+    object
+    """
+    if hasattr(source, 'read'):
+        return source, False
+    if isinstance(source, bytes) and source.lstrip()[:1] in (b'{', b'['):
+        return io.BytesIO(source), False
+    if not isinstance(source, bytes) and source.lstrip()[:1] in (u'{', u'['):
+        return io.StringIO(source), False
+    return open(source, 'rb'), True
+
+
+def text_chunks(stream, chunk_size=None):
+    """
+    Generator of text chunks from stream, decoding it as UTF-8 if it's binary
+    """
+    chunk_size = chunk_size or CHUNK_SIZE
+    decoder = None
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder('utf-8')()
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+
+
+def _decode_key(token):
+    if '\\' in token:
+        return json.loads(token)
+    return token[1:-1]
+
+
+def _scan_for_fields(stream, fields, path=ATTRIBUTES_PATH):
+    """
+    Stdlib implementation of extract_fields()
+    """
+    decoder = json.JSONDecoder()
+    chunks = text_chunks(stream)
+    buf = u''
+    pos = 0
+    eof = False
+    found = {}
+    # Each entry is [is_object, key] - key being the most recent key seen in
+    # that object
+    stack = []
+    expect_key = False
+
+    def read_more():
+        try:
+            return next(chunks)
+        except StopIteration:
+            return None
+
+    while len(found) < len(fields):
+        match = TOKEN_REGEX.match(buf, pos)
+        if not match or (match.end() == len(buf) and not eof):
+            # Either we've run out of data, or the token might continue in
+            # the next chunk
+            chunk = None if eof else read_more()
+            if chunk is None:
+                if eof or not match:
+                    if buf[pos:].strip():
+                        raise PetitionFormatError('Truncated or invalid JSON')
+                    break
+                eof = True
+            else:
+                buf = buf[pos:] + chunk
+                pos = 0
+            continue
+
+        string_token, structural, _ = match.groups()
+        pos = match.end()
+        if structural == '{':
+            stack.append([True, None])
+            expect_key = True
+        elif structural == '[':
+            stack.append([False, None])
+            expect_key = False
+        elif structural in ('}', ']'):
+            if not stack:
+                raise PetitionFormatError('Unbalanced JSON')
+            stack.pop()
+            expect_key = False
+        elif structural == ',':
+            expect_key = bool(stack) and stack[-1][0]
+        elif structural == ':':
+            # If this is a field we want, decode its value in one go
+            keys = tuple(z[1] for z in stack)
+            key = keys[-1] if keys else None
+            if keys[:-1] == path and key in fields and key not in found:
+                value_start = pos
+                while True:
+                    value_pos = WHITESPACE_REGEX.match(buf, value_start).end()
+                    try:
+                        value, end = decoder.raw_decode(buf, value_pos)
+                        # A number at the end of the buffer might continue
+                        # in the next chunk
+                        if end < len(buf) or eof:
+                            break
+                    except ValueError:
+                        if eof:
+                            raise PetitionFormatError('Unable to decode %s' % (key))
+                    chunk = read_more()
+                    if chunk is None:
+                        eof = True
+                    else:
+                        buf = buf[value_start:] + chunk
+                        value_start = 0
+                found[key] = value
+                pos = end
+        elif string_token is not None and expect_key:
+            stack[-1][1] = _decode_key(string_token)
+            expect_key = False
+    return found
+
+
+def _ijson_for_fields(stream, fields, path=ATTRIBUTES_PATH):
+    """
+    ijson implementation of extract_fields()
+    """
+    prefixes = dict(('.'.join(path + (z,)), z) for z in fields)
+    found = {}
+    builder = None
+    building = None
+    for prefix, event, value in ijson.parse(stream):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == building and event in ('end_map', 'end_array'):
+                found[prefixes[prefix]] = builder.value
+                builder = None
+        elif prefix in prefixes:
+            if event in ('start_map', 'start_array'):
+                builder = ObjectBuilder()
+                builder.event(event, value)
+                building = prefix
+            else:
+                found[prefixes[prefix]] = value
+        else:
+            continue
+        if builder is None and len(found) == len(fields):
+            break
+    return found
+
+
+def extract_fields(source, fields=PETITION_FIELDS):
+    """
+    Return a dict of field name->value, for each of fields that is present in
+    the petition's attributes.  source can be a filename, a string or bytes
+    of JSON, or a (text or binary) file-like object.
+    """
+    stream, opened = open_source(source)
+    try:
+        if ijson is not None and not isinstance(stream, io.TextIOBase):
+            return _ijson_for_fields(stream, tuple(fields))
+        return _scan_for_fields(stream, tuple(fields))
+    finally:
+        if opened:
+            stream.close()
+
+
+def extract_petition_data(source):
+    """
+    Return the same tuple as revoke_comparison.process_petition_data() i.e.
+    (signature count, updated_at, dict of ONS code->signature count)
+    """
+    found = extract_fields(source, PETITION_FIELDS)
+    try:
+        ons2signatures = dict((z['ons_code'], z['signature_count'])
+                              for z in found['signatures_by_constituency'])
+        return (found['signature_count'], found['updated_at'], ons2signatures)
+    except KeyError as err:
+        raise PetitionFormatError('Petition data has no %s' % (err))
+
+
+if __name__ == '__main__':
+    for filename in sys.argv[1:]:
+        signature_count, updated_at, ons2signatures = extract_petition_data(filename)
+        print('%s: %d signatures at %s, %d constituencies' % (
+            filename, signature_count, updated_at, len(ons2signatures)))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the petitions site, for trying out petition_poller.py (or
+anything else that fetches the petition JSON) without hitting the real
+thing.  It serves the newest file matching a glob pattern at any path, with
+an ETag and Last-Modified, honours If-None-Match/If-Modified-Since, and
+supports keep-alive.  Copy a new file into place to simulate the petition
+being updated.
+
+  ./petition_test_server.py [port] ['source_data/241584*.json']
+"""
+
+from email.utils import formatdate, parsedate_tz, mktime_tz
+from glob import glob
+import hashlib
+import os
+import sys
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError: # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+DEFAULT_PORT = 8241
+DEFAULT_PATTERN = os.path.join(os.path.dirname(__file__), 'source_data', '241584*.json')
+
+
+class PetitionRequestHandler(BaseHTTPRequestHandler):
+    # Needed for keep-alive
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def do_GET(self):
+        filenames = glob(self.server.pattern)
+        if not filenames:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        filename = max(filenames, key=os.path.getmtime)
+        with open(filename, 'rb') as inputstream:
+            content = inputstream.read()
+        etag = '"%s"' % (hashlib.sha1(content).hexdigest())
+        mtime = int(os.path.getmtime(filename))
+        self.server.requests_served += 1
+
+        if_none_match = self.headers.get('If-None-Match')
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_none_match:
+            not_modified = etag in [z.strip() for z in if_none_match.split(',')]
+        elif if_modified_since:
+            since = parsedate_tz(if_modified_since)
+            not_modified = since is not None and mtime <= mktime_tz(since)
+        else:
+            not_modified = False
+
+        self.send_response(304 if not_modified else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', formatdate(mtime, usegmt=True))
+        if not_modified:
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+
+class PetitionServer(ThreadingMixIn, HTTPServer):
+    # A thread per connection, otherwise one keep-alive client would block
+    # all the others
+    daemon_threads = True
+
+
+def make_server(port=DEFAULT_PORT, pattern=DEFAULT_PATTERN, quiet=False):
+    """
+    Return an HTTPServer (port 0 picks a free port - see server.server_port)
+    """
+    server = PetitionServer(('127.0.0.1', port), PetitionRequestHandler)
+    server.pattern = pattern
+    server.quiet = quiet
+    server.requests_served = 0
+    return server
+
+
+def start_in_thread(port=0, pattern=DEFAULT_PATTERN):
+    """
+    Start a quiet server in a daemon thread, returning the server - call
+    server.shutdown() when done
+    """
+    server = make_server(port, pattern, quiet=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PORT
+    pattern = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_PATTERN
+    print('Serving %s on http://127.0.0.1:%d/' % (pattern, port))
+    make_server(port, pattern).serve_forever()
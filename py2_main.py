@@ -17,7 +17,6 @@ import json
 
 # Python2
 import webapp2
-from google.appengine.api import memcache
 
 # Python3
 # [START gae_python37_app]
@@ -26,62 +25,19 @@ from google.appengine.api import memcache
 
 import logging
 
-from revoke_comparison import process
-from grab_latest_petition_data import check_latest_petition_data
+from offline import get_latest
+from petition_page import PAGE_CACHE_TIME, page
 
-from offline import DOWNLOAD_KEY, get_latest
-
-
-PAGE_KEY = 'main_page'
-PAGE_CACHE_TIME = 60
 
 # app = Flask(__name__)
 
 
 
 
-def get_content(stuff):
-    return """<!DOCTYPE html><html><head>
-<link rel="stylesheet" type="text/css" href="/static/table_colours.css" />
-<script src="/static/sortable.js">
-</script>
-</head>
-<body>%s</body></html>\n""" % (stuff)
-
-
-def load_from_file(filename):
-    with open(filename, mode='rb') as inputstream:
-        data = inputstream.read()
-    return data
-
-
-def generate_content(separator='\n'):
-    content = memcache.get(PAGE_KEY)
-    if content:
-        return content
-    logging.warning('Did not find page content %s in memcache - regenerating' % (PAGE_KEY))
-
-    buf = []
-    def add_to_buffer(txt):
-        buf.append(txt.decode('iso-8859-1'))
-
-    raw_string_data = memcache.get(DOWNLOAD_KEY)
-    if raw_string_data:
-        logging.warning("loaded %s (%d bytes) from memcache" % (DOWNLOAD_KEY,
-                                                                len(raw_string_data)))
-        petition_data = json.loads(raw_string_data)
-    else:
-        logging.warning('Unable to get data %s from memcache - getting it manually' %
-                        (DOWNLOAD_KEY))
-        petition_data = json.loads(get_latest())
-        # petition_file, _ = check_latest_petition_data(use_file_timestamps=False)
-
-    process(petition_data=petition_data, html_output=True, include_all=True,
-            output_function=add_to_buffer, embed=False)
-
-    content =  separator.join(buf)
-    memcache.set(PAGE_KEY, content, time=PAGE_CACHE_TIME)
-    return content
+def generate_content():
+    # The Python 2 runtime can't stream the response, so this is rendered in
+    # full before being sent
+    return page(get_latest)
 
 
 
@@ -22,29 +22,14 @@ from flask import Flask, request, Response
 
 import logging
 
+import requests
 
-from revoke_comparison import process
+from grab_latest_petition_data import DOWNLOAD_URL, DOWNLOAD_KEY, DOWNLOAD_CACHE_TIME
+from petition_page import PAGE_CACHE_TIME, cache, iter_page
 
 app = Flask(__name__)
 
 
-
-
-def get_content(stuff):
-    return """<!DOCTYPE html><html><head>
-<link rel="stylesheet" type="text/css" href="/static/table_colours.css" />
-<script src="/static/sortable.js">
-</script>
-</head>
-<body>%s</body></html>\n""" % (stuff)
-
-
-def load_from_file(filename):
-    with open(filename, mode='rb') as inputstream:
-        data = inputstream.read()
-    return data
-
-
 PYTHON2 = """
 class MainPage(webapp2.RequestHandler):
     def get(self):
@@ -58,12 +43,35 @@ app = webapp2.WSGIApplication([
 ], debug=True)
 """
 
+def download_latest():
+    """
+    Download the latest petition JSON, caching it for other requests - the
+    equivalent of offline.get_latest()
+    """
+    response = requests.get(DOWNLOAD_URL, timeout=30)
+    if response.status_code != 200:
+        logging.error('Received %s response when getting %s' %
+                      (response.status_code, DOWNLOAD_URL))
+        return None
+    cache.set(DOWNLOAD_KEY, response.content, time=DOWNLOAD_CACHE_TIME)
+    return response.content
+
+
+def generate_content():
+    """
+    Generator of the page - if it's being re-rendered, each chunk is sent as
+    soon as it's ready, rather than making the browser wait for the whole
+    table
+    """
+    return iter_page(download_latest)
+
+
 @app.route('/')
-def hello():
-    """Return a friendly HTTP greeting."""
-    # return 'Hello World! (Python3/Flask)'
-    test_text = load_from_file('html_output/test.html')
-    return Response(test_text)
+def main_page():
+    # Flask sends a generator as a chunked response
+    response = Response(generate_content(), mimetype='text/html')
+    response.headers['Cache-Control'] = 'max-age=%d, public' % (PAGE_CACHE_TIME)
+    return response
 
 
 
@@ -6,12 +6,19 @@ Probably this should be merged in with extract_regions.py
 
 """
 
+from collections import namedtuple
+try:
+    from collections.abc import Mapping
+except ImportError: # Python 2
+    from collections import Mapping
 import json
 import os
+import threading
 
 from ge_config import SOURCE_DIR, GENERAL_ELECTIONS
-from misc import slugify
+from misc import slugify, slugify_many
 from constituency import load_constituencies_from_admin_csv
+from dataset_cache import cached
 
 INTERMEDIATE_DIR = os.path.join(os.path.dirname(__file__), 'intermediate_data')
 
@@ -27,24 +34,149 @@ COUNTRY_CODE_PREFIXES = {
     }
 
 
+# Countries that don't have regions, so are their own "region".  Note that
+# these values are strings rather than lists of constituencies, which is why
+# code that iterates over the values of the region data is a bit weird.
+COUNTRIES_WITHOUT_REGIONS = ('Scotland', 'Wales', 'Northern Ireland')
+
+
+class RegionView(Mapping):
+    """
+    Read-only version of the dict that load_region_data() returns, as handed
+    out by RegionService, so that one copy can be shared by everything.
+    The region->constituencies values are tuples rather than lists.
+    """
+    def __init__(self, data):
+        self._data = data
+        self._name_to_region = None
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def name_to_region(self):
+        """
+        Return the (read-only) equivalent of constituency_name_to_region(self)
+        """
+        if self._name_to_region is None:
+            self._name_to_region = ReadOnlyDict(
+                constituency_name_to_region(self._data))
+        return self._name_to_region
+
+    def copy(self):
+        """
+        Return a mutable copy, in the same form as load_region_data() used to
+        """
+        return dict((k, list(v) if isinstance(v, tuple) else v)
+                    for k, v in self._data.items())
+
+
+class ReadOnlyDict(Mapping):
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RegionService(object):
+    """
+    Single in-memory copy of the region data from a regions.json file, which
+    is reloaded if the file's modification time changes.  All the views it
+    returns are read-only, so can be shared.
+    """
+    def __init__(self, fn=DEFAULT_REGION_FILE):
+        self.filename = fn
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._views = None
+        self._alias_maps = {}
+
+    def _current_views(self):
+        mtime = os.path.getmtime(self.filename)
+        views = self._views
+        if views is not None and mtime == self._mtime:
+            return views
+        with self._lock:
+            if self._views is None or mtime != self._mtime:
+                with open(self.filename) as regionstream:
+                    raw = json.load(regionstream)
+                regions = dict((k, tuple(v)) for k, v in raw.items())
+                with_countries = dict(regions)
+                for country in COUNTRIES_WITHOUT_REGIONS:
+                    with_countries[country] = country
+                self._views = (RegionView(regions), RegionView(with_countries))
+                self._alias_maps = {}
+                _identity_indexes.pop(self.filename, None)
+                self._mtime = mtime
+            return self._views
+
+    def region_data(self, add_on_countries=False):
+        """
+        Return a read-only mapping of region to constituency names, plus the
+        countries without regions if add_on_countries is True
+        """
+        return self._current_views()[1 if add_on_countries else 0]
+
+    def name_to_region(self, add_on_countries=False):
+        """
+        Return a read-only mapping of slugified constituency name to region -
+        see constituency_name_to_region()
+        """
+        return self.region_data(add_on_countries).name_to_region()
+
+    def alias_to_region(self, constituency_csv=None):
+        """
+        Return a read-only mapping of every alias (name, slug, ONS code, PA
+        number) of every constituency to its region - see
+        ConstituencyIdentityIndex
+        """
+        constituency_csv = constituency_csv or DEFAULT_CONSTITUENCY_CSV
+        self._current_views()
+        alias_map = self._alias_maps.get(constituency_csv)
+        if alias_map is None:
+            alias_map = ReadOnlyDict(load_identity_index(
+                constituency_csv, self.filename).region_map())
+            self._alias_maps[constituency_csv] = alias_map
+        return alias_map
+
+
+_region_services = {}
+
+def region_service(fn=DEFAULT_REGION_FILE):
+    """
+    Return the shared RegionService for fn
+    """
+    try:
+        return _region_services[fn]
+    except KeyError:
+        return _region_services.setdefault(fn, RegionService(fn))
+
+
 def load_region_data(fn=DEFAULT_REGION_FILE, add_on_countries=False):
     """
     Return a dictionary mapping region to a list of constituency names
-    """
-    with open(fn) as regionstream:
-        regions = json.load(regionstream)
 
+    This is a copy that the caller is free to modify - if you don't need to
+    do that, use region_service(fn).region_data() instead.
+    """
     # Eh??? How did/does stuff uusing this return value ever work???
-    # The above values are lists of consituencies.
-    # The below values are strings of regions/countries
+    # The values are lists of consituencies, except for the countries that
+    # add_on_countries adds, which are strings of regions/countries
     # Update: I can see why the other code works now, but I'm still unconvinced
     # by this next bit...
-    if add_on_countries:
-        regions['Scotland'] = 'Scotland'
-        regions['Wales'] = 'Wales'
-        regions['Northern Ireland'] = 'Northern Ireland'
-
-    return regions
+    return region_service(fn).region_data(add_on_countries).copy()
 
 
 def constituency_name_to_region(region_data, slugify_constituency_name=True,
@@ -62,6 +194,11 @@ def constituency_name_to_region(region_data, slugify_constituency_name=True,
     be set up with constituency_id_mappings
 
     """
+    if not key_mappings and slugify_constituency_name and \
+       isinstance(region_data, RegionView):
+        # Precomputed by the RegionService
+        return region_data.name_to_region()
+
     con_to_region = {} # reverse map constituency name
     for reg, con_list in region_data.items():
         for con in con_list:
@@ -84,22 +221,112 @@ def constituency_id_mappings(constituency_csv=DEFAULT_CONSTITUENCY_CSV):
     """
     Return a dict mapping various unique identifiers for a constituency to the
     set (well a list) of all those Ids)
+
+    This is now derived from the (persisted) ConstituencyIdentityIndex - use
+    load_identity_index() directly if you can.
+    """
+    return load_identity_index(constituency_csv).id_mappings()
+
+
+ConstituencyIdentity = namedtuple('ConstituencyIdentity',
+                                  ['ons_code', 'pa_number', 'name', 'slug', 'region'])
+
+def identity_aliases(ident):
+    """
+    Return the list of all the IDs that ident is known by, in the same order
+    as the lists returned by constituency_id_mappings()
+    """
+    ids = [ident.name, ident.slug, ident.ons_code]
+    if ident.pa_number:
+        # Keep consistent with other values' type to allow for sorting
+        ids.append(str(ident.pa_number))
+    return ids
+
+
+class ConstituencyIdentityIndex(object):
+    """
+    Lookup of any of the IDs for a constituency - name, slugified name, ONS
+    code, PA number (as a string) - to a ConstituencyIdentity
+    """
+    def __init__(self, identities):
+        self.identities = identities
+        self._by_alias = {}
+        for ident in identities:
+            # c2ids_map[con.name] = ids # Blows up on Weston-[Ss]uper-Mare, so use all IDs
+            for alias in identity_aliases(ident):
+                self._by_alias[alias] = ident
+        self._region_map = None
+
+    def lookup(self, alias):
+        """
+        Raises KeyError if alias isn't known
+        """
+        return self._by_alias[alias]
+
+    def get(self, alias, default=None):
+        return self._by_alias.get(alias, default)
+
+    def __contains__(self, alias):
+        return alias in self._by_alias
+
+    def __len__(self):
+        return len(self.identities)
+
+    def id_mappings(self):
+        """
+        Return the same structure as constituency_id_mappings() used to build
+        """
+        return dict((alias, identity_aliases(ident))
+                    for alias, ident in self._by_alias.items())
+
+    def region_map(self):
+        """
+        Return a dict of every alias to the constituency's region, which is
+        the same as constituency_name_to_region(regions,
+        key_mappings=constituency_id_mappings()) would give.
+        """
+        if self._region_map is None:
+            self._region_map = dict((alias, ident.region)
+                                    for alias, ident in self._by_alias.items())
+        return self._region_map
+
+
+def build_identity_index(constituency_csv=DEFAULT_CONSTITUENCY_CSV,
+                         region_file=DEFAULT_REGION_FILE):
+    """
+    Create a ConstituencyIdentityIndex from scratch - this parses
+    constituency_csv, so you probably want load_identity_index() instead.
     """
     # basic_regions = load_region_data(add_on_countries=True)
-    basic_regions = load_region_data()
-    con_to_region = constituency_name_to_region(basic_regions)
+    con_to_region = region_service(region_file).name_to_region()
 
     ge2017_data = load_constituencies_from_admin_csv(constituency_csv,
                                                      con_to_region,
                                                      quiet=True)
-    c2ids_map = {}
-    for con in ge2017_data:
-        ids = [con.name, slugify(con.name),
-                               con.ons_code]
-        if con.pa_number:
-             # Keep consistent with other values' type to allow for sorting
-            ids.append(str(con.pa_number))
-        # c2ids_map[con.name] = ids # Blows up on Weston-[Ss]uper-Mare, so use all IDs
-        for id in ids:
-            c2ids_map[id] = ids
-    return c2ids_map
+    return ConstituencyIdentityIndex([
+        ConstituencyIdentity(con.ons_code, con.pa_number, con.name,
+                             slug, con.region)
+        for con, slug in zip(ge2017_data,
+                             slugify_many(z.name for z in ge2017_data))])
+
+
+_identity_indexes = {} # region file -> constituency CSV -> index
+
+def load_identity_index(constituency_csv=DEFAULT_CONSTITUENCY_CSV,
+                        region_file=DEFAULT_REGION_FILE):
+    """
+    Return a ConstituencyIdentityIndex, from memory if it's already been
+    loaded in this process, otherwise from a snapshot that is rebuilt whenever
+    constituency_csv or region_file change
+    """
+    # Any reload of region_file forgets the indexes built from it, so do that
+    # first rather than part way through building one
+    region_service(region_file).region_data()
+    try:
+        return _identity_indexes[region_file][constituency_csv]
+    except KeyError:
+        pass
+    index = cached('constituency-ids', [constituency_csv, region_file],
+                   lambda: build_identity_index(constituency_csv, region_file))
+    return _identity_indexes.setdefault(region_file, {}).setdefault(
+        constituency_csv, index)
@@ -7,12 +7,23 @@ import pdb
 import os
 import re
 import sys
+import threading
 
 from ec_data_reader import load_and_process_data, ADMIN_CSV, RESULTS_CSV
+from election_loaders import load_election
 from euref_data_reader import load_and_process_euref_data
 from misc import slugify,  output_file
 from grab_latest_petition_data import check_latest_petition_data
-from revoke_web import html_header, sub_header
+from petition_stream import extract_petition_data
+from revoke_web import iter_html_header, iter_sub_header
+
+try:
+    from petition_analytics import PetitionAnalytics
+    from election_table import np
+    if np is None:
+        PetitionAnalytics = None
+except ImportError: # e.g. Python 2
+    PetitionAnalytics = None
 
 try:
     from colorama import Fore, Back, Style
@@ -48,6 +59,198 @@ EUREF_VOTES_BY_CONSTITUENCY_URL = 'https://commonslibrary.parliament.uk/' + \
                                   'parliament-and-elections/elections-elections/' + \
                                   'brexit-votes-by-constituency/'
 EUREF_VOTES_BY_CONSTITUENCY_SHORT_URL = 'http://tinyurl.com/ybnmmzz9'
+# The General Election that signatures are compared against
+GE_YEAR = 2017
+
+# The election and EU Referendum data never change during the lifetime of an
+# instance, so they are loaded on first use and then kept for every
+# subsequent call of process() - only the petition data needs to be parsed
+# per request.
+_static_datasets = None
+_static_datasets_lock = threading.Lock()
+
+
+def get_static_datasets():
+    """
+    Return a tuple of (list of ConstituencyResult objects,
+    dict of ONS code->EUReferendumResult), loading them if this is the first
+    call in this process.  Safe to call from multiple threads.
+    """
+    global _static_datasets
+    datasets = _static_datasets
+    if datasets is None:
+        with _static_datasets_lock:
+            if _static_datasets is None:
+                election_data = load_election(GE_YEAR)
+                euref_data = dict((z.constituency.ons_code, z.constituency.euref)
+                                  for z in election_data)
+                _static_datasets = (election_data, euref_data)
+            datasets = _static_datasets
+    return datasets
+
+
+class RowRenderer(object):
+    """
+    Renders the rows of the HTML table.  Only the cells derived from the
+    signature count change from one petition snapshot to the next, so the
+    rest of each row (region, name, leave %, GE2017 votes and margin) is
+    rendered once and kept, as is each complete row along with the
+    signature count it was rendered for - so regenerating the page only
+    costs anything for the constituencies whose count has changed.
+    """
+    def __init__(self, euref_data):
+        self.euref_data = euref_data
+        self._prefixes = {} # ONS code -> HTML up to the signature cells
+        self._rows = {} # ONS code -> (signatures, HTML of row)
+        # For monitoring/testing - how many rows have been (re)rendered
+        self.rendered = 0
+
+    def _cells_html(self, cells):
+        return ''.join(['<td class="%s">%s</td>' % z for z in cells])
+
+    def _prefix(self, conres):
+        ons_code = conres.constituency.ons_code
+        euref = self.euref_data[ons_code]
+        margin = conres.winning_margin
+        leave_pc = '%2d%%%s'  % (euref.leave_pc,
+                                 '&nbsp;' if euref.known_result else '*')
+        slug_party = conres.winning_result.party_slug
+
+        cells = []
+        classes = ['small centred']
+        if conres.constituency.country:
+            classes.append('country-%s' % slugify(conres.constituency.country))
+        if conres.constituency.region:
+            classes.append('region-%s' % slugify(conres.constituency.region))
+        cells.append((' '.join(classes),
+                      conres.constituency.country_and_region))
+        con_name = conres.constituency.name
+        cells.append(('', '<a class="plain" href="#%s">%s</a>' %
+                      (slugify(con_name), con_name)))
+
+        if euref.leave_pc >= 55.0:
+            kls = 'voted-leave-55'
+        elif euref.leave_pc >= 50.0:
+            kls = 'voted-leave-50'
+        elif euref.leave_pc >= 45.0:
+            kls = 'voted-leave-45'
+        else:
+            kls = ''
+        cells.append(('numeric ' + kls, leave_pc))
+
+        cells.append(('party-%s numeric' % slug_party, '%d' %
+                      (conres.winning_result.valid_votes)))
+
+        cells.append(('party-%s numeric' % slug_party, '%d' % margin))
+
+        return '<tr id="%s">%s' % (slugify(con_name), self._cells_html(cells))
+
+    def _signature_cells(self, conres, sigs):
+        margin = conres.winning_margin
+        cells = []
+        cells.append(('numeric', '%s' % sigs))
+
+        sig_pc = 100 * sigs / conres.constituency.electorate
+        sig_cls = 'signed-%d' % (min(50, int(sig_pc / 5) * 5))
+        cells.append(('numeric %s' % (sig_cls), '%.1f%%' % sig_pc))
+
+        # NB: valid_votes is probably slightly less than turnout
+        sig_vs_turnout_pc = 100 * sigs / conres.constituency.valid_votes
+        ratio_class = 'signed-%d' % (min(50, int(sig_vs_turnout_pc / 5) * 5))
+        cells.append(('numeric %s' % (ratio_class), '%d%%' % (sig_vs_turnout_pc)))
+
+        sig_vs_winner_pc = 100 * sigs /conres.winning_result.valid_votes
+        ratio_range = int(sig_vs_winner_pc / 10) * 10
+        ratio_class = 'threshold-%d' % (min(100, ratio_range))
+        cells.append(('numeric %s' % (ratio_class), '%d%%' % (sig_vs_winner_pc)))
+
+        ratio = (100 * sigs / margin)
+        ratio_range = int(ratio / 10) * 10
+        ratio_class = 'threshold-%d' % (min(100, ratio_range))
+        cells.append(('numeric %s' % (ratio_class), '%d%%' % ratio))
+        return self._cells_html(cells)
+
+    def render(self, conres, sigs):
+        """
+        Return the HTML of the row for conres with sigs signatures
+        """
+        ons_code = conres.constituency.ons_code
+        cached = self._rows.get(ons_code)
+        if cached is not None and cached[0] == sigs:
+            return cached[1]
+        prefix = self._prefixes.get(ons_code)
+        if prefix is None:
+            prefix = self._prefix(conres)
+            self._prefixes[ons_code] = prefix
+        row = '%s%s</tr>' % (prefix, self._signature_cells(conres, sigs))
+        # Other threads may be rendering the same row, but as they'd produce
+        # the same HTML it doesn't matter which of them gets stored
+        self._rows[ons_code] = (sigs, row)
+        self.rendered += 1
+        return row
+
+
+_row_renderer = None
+
+
+def get_row_renderer():
+    """
+    Return the RowRenderer for the static datasets, which - like them - is
+    kept for the lifetime of the instance, so that its cached rows carry
+    over from one call of process() to the next
+    """
+    global _row_renderer
+    renderer = _row_renderer
+    if renderer is None:
+        _, euref_data = get_static_datasets()
+        with _static_datasets_lock:
+            if _row_renderer is None:
+                _row_renderer = RowRenderer(euref_data)
+            renderer = _row_renderer
+    return renderer
+
+
+_petition_analytics = None
+
+
+def get_petition_analytics():
+    """
+    Return a PetitionAnalytics for the static datasets, or None if NumPy
+    isn't available
+    """
+    global _petition_analytics
+    if PetitionAnalytics is None:
+        return None
+    analytics = _petition_analytics
+    if analytics is None:
+        election_data, _ = get_static_datasets()
+        with _static_datasets_lock:
+            if _petition_analytics is None:
+                _petition_analytics = PetitionAnalytics(election_data)
+            analytics = _petition_analytics
+    return analytics
+
+
+def count_above_margin(election_data, euref_data, constituency_data):
+    """
+    Return a tuple of (number of constituencies with more signatures than
+    their winning margin, how many of those voted leave)
+    """
+    analytics = get_petition_analytics()
+    if analytics is not None:
+        return analytics.summary(analytics.signatures(constituency_data))
+
+    sig_above_margin = 0
+    pro_leave_sig_above_margin = 0
+    for conres in election_data:
+        ons_code = conres.constituency.ons_code
+        if constituency_data[ons_code] > conres.winning_margin:
+            sig_above_margin += 1
+            if euref_data[ons_code].leave_pc > 50.0:
+                pro_leave_sig_above_margin += 1
+    return sig_above_margin, pro_leave_sig_above_margin
+
+
 def load_petition_data(petition_file):
     with open(petition_file) as petition_stream:
         petition_data = json.load(petition_stream)
@@ -69,113 +272,55 @@ def py2print(txt):
     print(txt)
 
 
-def process(petition_file=None, html_output=True, include_all=True, output_function=py2print,
-            embed=True, petition_data=None):
-
-    with open(os.path.join('intermediate_data', 'regions.json')) as regionstream:
-        regions = json.load(regionstream)
-    euref_data = load_and_process_euref_data()
+def iter_process(petition_file=None, html_output=True, include_all=True,
+                 embed=True, petition_data=None, petition_json=None):
+    """
+    Generator of the chunks of output (HTML, or lines of text) - see process()
+    for the arguments.  In HTML mode the header is yielded before any data is
+    loaded or parsed, so that it can be sent to the browser straight away.
+    """
+    if html_output:
+        for chunk in iter_html_header(embed):
+            yield chunk
 
-    election_data = load_and_process_data(ADMIN_CSV, RESULTS_CSV, regions,
-                                          euref_data)
+    election_data, euref_data = get_static_datasets()
 
     if petition_file:
-        petition_data = load_petition_data(petition_file)
-    signature_count, petition_timestamp, constituency_data = process_petition_data(petition_data)
+        petition_details = extract_petition_data(petition_file)
+    elif petition_json is not None:
+        petition_details = extract_petition_data(petition_json)
+    else:
+        petition_details = process_petition_data(petition_data)
+    signature_count, petition_timestamp, constituency_data = petition_details
 
     constituency_total = sum([z for z in constituency_data.values()])
     counter = 0
     include_all = True
 
-    sig_above_margin = 0
-    pro_leave_sig_above_margin = 0
-    for conres in election_data:
-        ons_code = conres.constituency.ons_code
-        if constituency_data[ons_code] > conres.winning_margin:
-            sig_above_margin += 1
-            if euref_data[ons_code].leave_pc > 50.0:
-                pro_leave_sig_above_margin += 1
+    sig_above_margin, pro_leave_sig_above_margin = count_above_margin(
+        election_data, euref_data, constituency_data)
 
     if html_output:
-        html_header(output_function, embed)
-        sub_header(output_function, petition_timestamp, signature_count,
-                   constituency_total, sig_above_margin, pro_leave_sig_above_margin)
+        for chunk in iter_sub_header(petition_timestamp, signature_count,
+                                     constituency_total, sig_above_margin,
+                                     pro_leave_sig_above_margin):
+            yield chunk
 
-        for i, conres in enumerate(election_data, 1):
+        row_renderer = get_row_renderer()
+        for conres in election_data:
             margin = conres.winning_margin
-            ons_code = conres.constituency.ons_code
-            sigs = constituency_data[ons_code]
-            leave_pc = '%2d%%%s'  % (
-                euref_data[ons_code].leave_pc,
-                '&nbsp;' if euref_data[ons_code].known_result else '*')
-            slug_party = slugify(conres.winning_party)
-            # output_function(slug_party)
-            #margin_text = '%sGE2017 Winning margin: %5d votes%s   ' % \
-            #              (PARTY_COLOURS[slug_party], margin, COLORAMA_RESET)
-
+            sigs = constituency_data[conres.constituency.ons_code]
             if sigs > margin or include_all:
-                cells = []
                 counter += 1
-                # cells.append(('numeric', '%s' % (counter))) Now done with CSS magic
-                classes = ['small centred']
-                if conres.constituency.country:
-                    classes.append('country-%s' % slugify(conres.constituency.country))
-                if conres.constituency.region:
-                    classes.append('region-%s' % slugify(conres.constituency.region))
-                cells.append((' '.join(classes),
-                              conres.constituency.country_and_region))
-                con_name = conres.constituency.name
-                cells.append(('', '<a class="plain" href="#%s">%s</a>' %
-                              (slugify(con_name), con_name)))
-
-                if euref_data[ons_code].leave_pc >= 55.0:
-                    kls = 'voted-leave-55'
-                elif euref_data[ons_code].leave_pc >= 50.0:
-                    kls = 'voted-leave-50'
-                elif euref_data[ons_code].leave_pc >= 45.0:
-                    kls = 'voted-leave-45'
-                else:
-                    kls = ''
-                cells.append(('numeric ' + kls, leave_pc))
-
-                cells.append(('party-%s numeric' % slug_party, '%d' %
-                              (conres.winning_result.valid_votes)))
-
-                cells.append(('party-%s numeric' % slug_party, '%d' % margin))
-
-                cells.append(('numeric', '%s' % sigs))
-
-                sig_pc = 100 * sigs / conres.constituency.electorate
-                sig_cls = 'signed-%d' % (min(50, int(sig_pc / 5) * 5))
-                cells.append(('numeric %s' % (sig_cls), '%.1f%%' % sig_pc))
-
-                # NB: valid_votes is probably slightly less than turnout
-                sig_vs_turnout_pc = 100 * sigs / conres.constituency.valid_votes
-                ratio_class = 'signed-%d' % (min(50, int(sig_vs_turnout_pc / 5) * 5))
-                cells.append(('numeric %s' % (ratio_class), '%d%%' % (sig_vs_turnout_pc)))
-
-                sig_vs_winner_pc = 100 * sigs /conres.winning_result.valid_votes
-                ratio_range = int(sig_vs_winner_pc / 10) * 10
-                ratio_class = 'threshold-%d' % (min(100, ratio_range))
-                cells.append(('numeric %s' % (ratio_class), '%d%%' % (sig_vs_winner_pc)))
-
-
-                ratio = (100 * sigs / margin)
-                ratio_range = int(ratio / 10) * 10
-                ratio_class = 'threshold-%d' % (min(100, ratio_range))
-                cells.append(('numeric %s' % (ratio_class), '%d%%' % ratio))
-
-                cell_str =''.join(['<td class="%s">%s</td>' % z for z in cells])
-                output_function('<tr id="%s">%s</tr>' % (slugify(con_name),
-                                                         cell_str))
-
-        output_function('''</table></body>\n</html>\n''')
+                yield row_renderer.render(conres, sigs)
+
+        yield '''</table></body>\n</html>\n'''
 
     else:
-        output_function('Based on petition data at %s (%d signatures)' % (petition_timestamp,
-                                                                signature_count))
-        output_function('Asterisked vote leave percentages are estimates - see %s' %
-              EUREF_VOTES_BY_CONSTITUENCY_SHORT_URL)
+        yield 'Based on petition data at %s (%d signatures)' % (petition_timestamp,
+                                                                signature_count)
+        yield ('Asterisked vote leave percentages are estimates - see %s' %
+               EUREF_VOTES_BY_CONSTITUENCY_SHORT_URL)
 
         for i, conres in enumerate(election_data, 1):
             margin = conres.winning_margin
@@ -186,14 +331,27 @@ def process(petition_file=None, html_output=True, include_all=True, output_funct
                 euref_data[ons_code].leave_pc,
                 ' ' if euref_data[ons_code].known_result else '*',
                 COLORAMA_RESET)
-            slug_party = slugify(conres.winning_party)
+            slug_party = conres.winning_result.party_slug
             # output_function(slug_party)
             margin_text = '%sGE2017 Winning margin: %5d votes%s   ' % \
                           (PARTY_COLOURS[slug_party], margin, COLORAMA_RESET)
             if sigs > margin or include_all:
                 counter += 1
-                output_function('%3d. %-45s : Voted leave: %s    %s    Current signatures: %5d' %
-                      (counter, conres.constituency.name, leave_pc, margin_text, sigs))
+                yield ('%3d. %-45s : Voted leave: %s    %s    Current signatures: %5d' %
+                       (counter, conres.constituency.name, leave_pc, margin_text, sigs))
+
+
+
+def process(petition_file=None, html_output=True, include_all=True, output_function=py2print,
+            embed=True, petition_data=None, petition_json=None):
+    """
+    The petition data can be supplied as a filename, as raw JSON (a string,
+    bytes or a stream) via petition_json, or as already decoded petition_data.
+    The first two are preferred, as they only extract the fields we need.
+    """
+    for chunk in iter_process(petition_file, html_output, include_all, embed,
+                              petition_data, petition_json):
+        output_function(chunk)
 
 
 if __name__ == '__main__':
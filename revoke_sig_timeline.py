@@ -6,8 +6,14 @@ import glob
 import sys
 
 from revoke_comparison import load_petition_data, process_petition_data
+import petition_manifest
+from signature_store import SignatureStore, ms_to_timestamp
 
 
+def output_line(ts, sig_count, constituency_total):
+    print('Data at %s: Total sigs: %9d   Constituency-associated sigs: %9d   Percentage: %d%%' %
+          (ts, sig_count, constituency_total, (100 * constituency_total / sig_count)))
+
 
 def process_files(files):
     names_and_timestamps = sorted([(z, os.stat(z).st_ctime) for z in files],
@@ -17,10 +23,39 @@ def process_files(files):
         data = load_petition_data(fn)
         sig_count, ts, constituency_data = process_petition_data(data)
         constituency_total = sum([z for z in constituency_data.values()])
-        print('Data at %s: Total sigs: %9d   Constituency-associated sigs: %9d   Percentage: %d%%' %
-              (ts, sig_count, constituency_total, (100 * constituency_total / sig_count)))
+        output_line(ts, sig_count, constituency_total)
+
+
+def process_manifest(manifest_file=petition_manifest.DEFAULT_MANIFEST):
+    """
+    As process_files(), but for every file in the manifest, which already
+    has the totals, so no files need to be opened
+    """
+    if petition_manifest.latest_or_rebuild(
+            os.path.dirname(manifest_file), manifest_file) is None:
+        return
+    for entry in petition_manifest.read_entries(manifest_file):
+        output_line(entry['updated_at'], entry['signature_count'],
+                    entry['constituency_total'])
+
 
+def process_store(store):
+    """
+    As process_files(), but reading the signature store
+    """
+    times = store.times()
+    totals = store.totals()
+    for i in range(len(store)):
+        output_line(ms_to_timestamp(times[i]), totals[i],
+                    store.constituency_total(i))
 
 
 if __name__ == '__main__':
-    process_files(sys.argv[1:])
+    if len(sys.argv) > 1:
+        process_files(sys.argv[1:])
+    else:
+        store = SignatureStore()
+        if len(store):
+            process_store(store)
+        else:
+            process_manifest()
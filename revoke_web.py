@@ -8,11 +8,8 @@ to:
 * Be able to generate a single standalone HTML file
 """
 
+import io
 import os
-import sys
-
-
-from misc import output_file
 
 
 EUREF_VOTES_BY_CONSTITUENCY_URL = 'https://commonslibrary.parliament.uk/' + \
@@ -20,27 +17,35 @@ EUREF_VOTES_BY_CONSTITUENCY_URL = 'https://commonslibrary.parliament.uk/' + \
                                   'brexit-votes-by-constituency/'
 EUREF_VOTES_BY_CONSTITUENCY_SHORT_URL = 'http://tinyurl.com/ybnmmzz9'
 
-def html_header(output_function, embed):
+def static_file_contents(filename):
+    # sorttable.js isn't UTF-8
+    with io.open(os.path.join('static', filename), encoding='iso-8859-1') as inputstream:
+        return inputstream.read()
+
+def iter_html_header(embed):
+        """
+        Generator of the chunks of HTML up to and including the <h1>
+        """
         title = '''Analysis of Revoke Article 50 petition vs General Election 2017
                      and EU Referendum results'''
 
-        output_function('''<!DOCTYPE html>\n<html lang="en-GB">\n<head>''')
+        yield ('''<!DOCTYPE html>\n<html lang="en-GB">\n<head>''')
 
         # Not sure if this is right, but FF whinges otherwise
-        output_function('<meta charset="utf-8" />\n')
+        yield ('<meta charset="utf-8" />\n')
         # output_file(sys.stdout, 'table_colours.css')
         # output_function('.voted-leave { background: purple; color: white; }</style>')
         if embed:
-            output_function('<style>\n')
-            output_file(sys.stdout, os.path.join('static', 'table_colours.css'))
-            output_function('</style>\n')
+            yield '<style>\n'
+            yield static_file_contents('table_colours.css')
+            yield '</style>\n'
         else:
-            output_function('''<link rel="stylesheet" type="text/css"
+            yield ('''<link rel="stylesheet" type="text/css"
                   href="/static/table_colours.css" />\n''')
 
-        output_function('<title>%s</title>\n' % (title))
+        yield ('<title>%s</title>\n' % (title))
         # Do we need both twitter: and og: metatags?  Fuck knows
-        output_function('''<meta name="twitter:card" content="summary_large_image"></meta>
+        yield ('''<meta name="twitter:card" content="summary_large_image"></meta>
            <meta name="twitter:site" content="@JohnMMIX"></meta>
            <meta name="twitter:creator" content="@JohnMMIX"></meta>
            <meta name="twitter:url" content="https://john-smith-test.appspot.com/"></meta>
@@ -55,19 +60,23 @@ def html_header(output_function, embed):
         ''')
 
 
-        output_function('</head><body>\n')
+        yield ('</head><body>\n')
         if embed:
-            output_function('<script>\n')
-            output_file(sys.stdout, os.path.join('static', 'sorttable.js'))
-            output_function('</script>\n')
+            yield '<script>\n'
+            yield static_file_contents('sorttable.js')
+            yield '</script>\n'
         else:
-            output_function('''<script src="/static/sorttable.js"></script>\n''')
+            yield ('''<script src="/static/sorttable.js"></script>\n''')
 
-        output_function('<h1>%s</h1>\n' % (title))
+        yield ('<h1>%s</h1>\n' % (title))
 
-def sub_header(output_function, petition_timestamp, signature_count,
-               constituency_total, sig_above_margin, pro_leave_sig_above_margin):
-        output_function('''<p>Based on
+def iter_sub_header(petition_timestamp, signature_count, constituency_total,
+                    sig_above_margin, pro_leave_sig_above_margin):
+        """
+        Generator of the chunks of HTML from the end of the header up to the
+        table column headings
+        """
+        yield ('''<p>Based on
 <a href="https://petition.parliament.uk/petitions/241584" rel="nofollow">petition</a>
 <a href="https://petition.parliament.uk/petitions/241584.json" rel="nofollow">data</a>
         at %s - <b>%d signatures</b> of which <b>%d (%d%%)</b> are associated with a
@@ -75,11 +84,11 @@ parliamentary constituency</p>''' % (petition_timestamp, signature_count,
                                       constituency_total,
                                       100 * constituency_total / signature_count))
 
-        output_function('''<p>Asterisked vote leave percentages are estimates -
+        yield ('''<p>Asterisked vote leave percentages are estimates -
          see <a href="%s">this link</a>.  2017 General Election data
         from the <a href="https://www.electoralcommission.org.uk/our-work/our-research/electoral-data/electoral-data-files-and-reports">Electoral Commission</a>.''' %  EUREF_VOTES_BY_CONSTITUENCY_URL)
 
-        output_function('''Party colours via
+        yield ('''Party colours via
 <a href="https://en.wikipedia.org/wiki/2017_United_Kingdom_general_election#Full_results">Wikipedia</a>.
         Regions also via Wikipedia
 (e.g. <a href="https://en.wikipedia.org/wiki/List_of_Parliamentary_constituencies_in_London">London</a>),
@@ -87,7 +96,7 @@ parliamentary constituency</p>''' % (petition_timestamp, signature_count,
        <span id="turnout-caveat">** Turnout calculations are based on valid votes
         i.e. ignoring spoiled ballot papers etc.</span>
 </p>''')
-        output_function('''<p><a href="https://github.com/JohnSmithDev/UKElections">Code</a>
+        yield ('''<p><a href="https://github.com/JohnSmithDev/UKElections">Code</a>
                by <a href="https://twitter.com/JohnMMIX">John Smith</a>.
 Table sorting (click on the headers) via
 <a href="https://www.kryogenix.org/code/browser/sorttable/">sorttable</a>.
@@ -101,14 +110,14 @@ This page does not (currently) automatically refresh - use your browser's refres
 or press F5 to get the latest data.
 </p>''')
 
-        output_function('''<h2>%d constituencies have more petition signatures
+        yield ('''<h2>%d constituencies have more petition signatures
         than their GE2017 winning margin, of which %d voted in favour of leaving in
         the 2016 EU Referendum</h2>''' %
               (sig_above_margin, pro_leave_sig_above_margin))
 
 
-        output_function('<table class="sortable">\n<tr>\n')
-        output_function('''<th>Region</th><th>Constituency</th>
+        yield ('<table class="sortable">\n<tr>\n')
+        yield ('''<th>Region</th><th>Constituency</th>
         <th>Voted leave percentage</th>
         <th>GE2017 winning # votes</th>
         <th>GE2017 winning margin (# votes)</th>
@@ -118,3 +127,15 @@ or press F5 to get the latest data.
 <th>Percentage of GE2017 turnout <a href="#turnout-caveat" class="plain">**</a></th>
 <th>Percentage of GE2017 winning party's vote</th>
 <th>Percentage of GE2017 winning margin</th>''')
+
+
+def html_header(output_function, embed):
+    for chunk in iter_html_header(embed):
+        output_function(chunk)
+
+def sub_header(output_function, petition_timestamp, signature_count,
+               constituency_total, sig_above_margin, pro_leave_sig_above_margin):
+    for chunk in iter_sub_header(petition_timestamp, signature_count,
+                                 constituency_total, sig_above_margin,
+                                 pro_leave_sig_above_margin):
+        output_function(chunk)
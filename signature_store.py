@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Append-only columnar store of petition signature counts, so that timelines
+and history charts can be produced without re-reading every downloaded JSON
+file.
+
+The store is a directory containing:
+* constituencies.json - the ONS codes, in column order
+* times.bin - int64 (millisecond) epoch of each snapshot's updated_at
+* totals.bin - int64 total signature count of each snapshot
+* counts.bin - int32 matrix of signatures, one row per snapshot and one
+  column per constituency
+
+All are native-endian, and are memory-mapped for reading.  Rows are appended
+counts/totals first and times last, so a reader never sees a row that
+hasn't been completely written.
+
+Python 3 only (it uses memoryview.cast()).
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+import json
+import logging
+import mmap
+import os
+import sys
+
+from petition_stream import extract_petition_data
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(__file__), 'intermediate_data',
+                                 'signature_store')
+
+CONSTITUENCIES_FILE = 'constituencies.json'
+TIMES_FILE = 'times.bin'
+TOTALS_FILE = 'totals.bin'
+COUNTS_FILE = 'counts.bin'
+
+TIME_FORMAT = 'q'
+TOTAL_FORMAT = 'q'
+COUNT_FORMAT = 'i'
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def timestamp_to_ms(ts):
+    """
+    Convert an updated_at value e.g. '2019-03-21T10:44:12.028Z' to
+    milliseconds since the epoch
+    """
+    delta = datetime.strptime(ts, '%Y-%m-%dT%H:%M:%S.%fZ') - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+
+def ms_to_timestamp(ms):
+    """
+    Inverse of timestamp_to_ms()
+    """
+    dt = datetime.utcfromtimestamp(ms // 1000)
+    return '%s.%03dZ' % (dt.strftime('%Y-%m-%dT%H:%M:%S'), ms % 1000)
+
+
+def all_ons_codes():
+    """
+    Return the ONS codes of every constituency, as per
+    regions.load_identity_index()
+    """
+    from regions import load_identity_index
+    return [z.ons_code for z in load_identity_index().identities]
+
+
+class SignatureStore(object):
+    """
+    If directory doesn't contain a store yet, one is created the first time
+    append() is called, with its columns being ons_codes - by default every
+    constituency (see all_ons_codes()) - plus any others in that snapshot.
+    """
+    def __init__(self, directory=DEFAULT_STORE_DIR, ons_codes=None):
+        self.directory = directory
+        self.initial_ons_codes = ons_codes
+        self.ons_codes = None
+        self.column_index = None
+        self._maps = None
+        self._num_rows = 0
+        constituencies_file = self._path(CONSTITUENCIES_FILE)
+        if os.path.exists(constituencies_file):
+            with open(constituencies_file) as inputstream:
+                self._set_columns(json.load(inputstream))
+
+    def _path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _set_columns(self, ons_codes):
+        self.ons_codes = list(ons_codes)
+        self.column_index = dict((ons, i) for i, ons in enumerate(self.ons_codes))
+
+    def _create(self, ons_codes):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        tmp_filename = self._path(CONSTITUENCIES_FILE + '.tmp')
+        with open(tmp_filename, 'w') as outputstream:
+            json.dump(sorted(ons_codes), outputstream)
+        os.rename(tmp_filename, self._path(CONSTITUENCIES_FILE))
+        with open(self._path(CONSTITUENCIES_FILE)) as inputstream:
+            self._set_columns(json.load(inputstream))
+
+    ### Reading
+
+    def _close_maps(self):
+        if self._maps:
+            for view, mapped in self._maps.values():
+                try:
+                    view.release()
+                    mapped.close()
+                except BufferError:
+                    # The caller still has a slice of it, so leave it for
+                    # the garbage collector
+                    pass
+        self._maps = None
+
+    def refresh(self):
+        """
+        Pick up any rows that have been appended since the store was last
+        read - this is done automatically by append() in this process, but
+        not if another process is the writer
+        """
+        self._close_maps()
+
+    def _complete_rows(self):
+        """
+        Return the number of rows that have been completely written to all
+        the files - if an append died part way through, there might be more
+        bytes than that in some of them
+        """
+        sizes = []
+        for filename, row_size in ((TIMES_FILE, 8), (TOTALS_FILE, 8),
+                                   (COUNTS_FILE, 4 * len(self.ons_codes))):
+            try:
+                sizes.append(os.path.getsize(self._path(filename)) // row_size)
+            except OSError:
+                return 0
+        return min(sizes)
+
+    def _views(self):
+        """
+        Return a dict of filename->memoryview, mapping the files if need be
+        """
+        if self._maps is None:
+            self._maps = {}
+            if self.ons_codes is None:
+                self._num_rows = 0
+                return {}
+            self._num_rows = self._complete_rows()
+            if not self._num_rows:
+                return {}
+            for filename, fmt, row_size in ((TIMES_FILE, TIME_FORMAT, 8),
+                                            (TOTALS_FILE, TOTAL_FORMAT, 8),
+                                            (COUNTS_FILE, COUNT_FORMAT,
+                                             4 * len(self.ons_codes))):
+                with open(self._path(filename), 'rb') as inputstream:
+                    mapped = mmap.mmap(inputstream.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+                # Only the complete rows, as cast() refuses a partial item at
+                # the end - the writer truncates any partial row (see
+                # append()), as that may be another process mid-append
+                view = memoryview(mapped)[:self._num_rows * row_size].cast(fmt)
+                self._maps[filename] = (view, mapped)
+        return dict((k, v[0]) for k, v in self._maps.items())
+
+    def __len__(self):
+        self._views()
+        return self._num_rows
+
+    def times(self):
+        """
+        Return a sequence of the snapshot times, in milliseconds since the
+        epoch (ascending)
+        """
+        if not len(self):
+            return []
+        return self._views()[TIMES_FILE][:self._num_rows]
+
+    def totals(self):
+        """
+        Return a sequence of the total signature count for each snapshot
+        """
+        if not len(self):
+            return []
+        return self._views()[TOTALS_FILE][:self._num_rows]
+
+    def counts(self):
+        """
+        Return a flat sequence of all the signature counts, row by row - i.e.
+        snapshot i's counts are at [i * len(self.ons_codes):(i + 1) * len(self.ons_codes)]
+        """
+        if not len(self):
+            return []
+        return self._views()[COUNTS_FILE][:self._num_rows * len(self.ons_codes)]
+
+    def row(self, i):
+        """
+        Return a sequence of the signature count for each constituency (in the
+        order of self.ons_codes) in snapshot i
+        """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('No snapshot %d' % (i))
+        width = len(self.ons_codes)
+        return self._views()[COUNTS_FILE][i * width:(i + 1) * width]
+
+    def snapshot(self, i):
+        """
+        Return a dict of ONS code->signatures for snapshot i
+        """
+        return dict(zip(self.ons_codes, self.row(i)))
+
+    def constituency_total(self, i):
+        return sum(self.row(i))
+
+    def index_at(self, time_ms):
+        """
+        Return the index of the latest snapshot at or before time_ms, or -1
+        if there isn't one
+        """
+        return bisect_right(self.times(), time_ms) - 1
+
+    def _index_range(self, start_ms=None, end_ms=None):
+        times = self.times()
+        start = 0 if start_ms is None else bisect_left(times, start_ms)
+        end = len(times) if end_ms is None else bisect_right(times, end_ms)
+        return range(start, end)
+
+    def series(self, ons_code=None, start_ms=None, end_ms=None):
+        """
+        Return a list of (time, signatures) tuples for ons_code - or the
+        overall total if ons_code is None - for all the snapshots between
+        start_ms and end_ms inclusive
+        """
+        times = self.times()
+        indexes = self._index_range(start_ms, end_ms)
+        if ons_code is None:
+            totals = self.totals()
+            return [(times[i], totals[i]) for i in indexes]
+        col = self.column_index[ons_code]
+        width = len(self.ons_codes)
+        counts = self._views()[COUNTS_FILE]
+        return [(times[i], counts[i * width + col]) for i in indexes]
+
+    def delta(self, from_ms, to_ms):
+        """
+        Return a tuple of (change in total signatures, dict of ONS
+        code->change in signatures) between the snapshots in effect at
+        from_ms and to_ms.  Anything before the first snapshot is treated as
+        zero.
+        """
+        from_index = self.index_at(from_ms)
+        to_index = self.index_at(to_ms)
+        totals = self.totals()
+        zeros = [0] * len(self.ons_codes or [])
+        before = self.row(from_index) if from_index >= 0 else zeros
+        after = self.row(to_index) if to_index >= 0 else zeros
+        total_delta = ((totals[to_index] if to_index >= 0 else 0) -
+                       (totals[from_index] if from_index >= 0 else 0))
+        return total_delta, dict((ons, a - b) for ons, a, b in
+                                 zip(self.ons_codes, after, before))
+
+    def resample(self, interval_ms, ons_code=None, start_ms=None, end_ms=None):
+        """
+        Return a list of (time, signatures) tuples at regular intervals from
+        start_ms to end_ms (defaulting to the first and last snapshot), each
+        value being from the latest snapshot at or before that time, or 0 if
+        there isn't one
+        """
+        times = self.times()
+        if not len(times):
+            return []
+        start_ms = times[0] if start_ms is None else start_ms
+        end_ms = times[-1] if end_ms is None else end_ms
+        if ons_code is None:
+            values = self.totals()
+            get = lambda i: values[i]
+        else:
+            col = self.column_index[ons_code]
+            width = len(self.ons_codes)
+            counts = self._views()[COUNTS_FILE]
+            get = lambda i: counts[i * width + col]
+        ret = []
+        t = start_ms
+        while t <= end_ms:
+            i = bisect_right(times, t) - 1
+            ret.append((t, get(i) if i >= 0 else 0))
+            t += interval_ms
+        return ret
+
+    ### Writing
+
+    def append(self, time_ms, total, ons2signatures):
+        """
+        Add a snapshot, returning False (and doing nothing) if it isn't later
+        than the latest snapshot already in the store
+        """
+        if self.ons_codes is None:
+            ons_codes = self.initial_ons_codes
+            if ons_codes is None:
+                ons_codes = all_ons_codes()
+            self._create(set(ons_codes).union(ons2signatures))
+        num_rows = len(self)
+        if num_rows and time_ms <= self.times()[-1]:
+            return False
+        unknown = [z for z in ons2signatures if z not in self.column_index]
+        if unknown:
+            logging.warning('Ignoring signatures for unknown constituencies %s' %
+                            (', '.join(sorted(unknown))))
+        row = memoryview(bytearray(len(self.ons_codes) * 4)).cast(COUNT_FORMAT)
+        for ons, count in ons2signatures.items():
+            col = self.column_index.get(ons)
+            if col is not None:
+                row[col] = count
+
+        self._close_maps()
+        # If an earlier append died part way through, the files might have
+        # extra bytes at the end - including partial rows - that need
+        # discarding
+        for filename, size in ((COUNTS_FILE, num_rows * len(row) * 4),
+                               (TOTALS_FILE, num_rows * 8),
+                               (TIMES_FILE, num_rows * 8)):
+            with open(self._path(filename), 'ab') as outputstream:
+                outputstream.truncate(size)
+                if filename == COUNTS_FILE:
+                    outputstream.write(row.tobytes())
+                elif filename == TOTALS_FILE:
+                    outputstream.write(_pack_int64(total))
+                else:
+                    outputstream.write(_pack_int64(time_ms))
+        return True
+
+    def append_petition(self, source):
+        """
+        Add a snapshot from petition JSON - see petition_stream.extract_petition_data()
+        """
+        signature_count, updated_at, ons2signatures = extract_petition_data(source)
+        return self.append(timestamp_to_ms(updated_at), signature_count,
+                           ons2signatures)
+
+    def close(self):
+        self._close_maps()
+
+
+def _pack_int64(val):
+    packed = memoryview(bytearray(8)).cast(TIME_FORMAT)
+    packed[0] = val
+    return packed.tobytes()
+
+
+def import_files(filenames, directory=DEFAULT_STORE_DIR):
+    """
+    Add the snapshots in filenames to the store, in the order of their
+    updated_at timestamps, returning the number added
+    """
+    store = SignatureStore(directory)
+    snapshots = sorted((extract_petition_data(fn) for fn in filenames),
+                       key=lambda z: timestamp_to_ms(z[1]))
+    added = 0
+    for signature_count, updated_at, ons2signatures in snapshots:
+        if store.append(timestamp_to_ms(updated_at), signature_count, ons2signatures):
+            added += 1
+    store.close()
+    return added
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == 'import':
+        print('%d snapshots added' % (import_files(sys.argv[2:])))
+    else:
+        store = SignatureStore()
+        ons_code = sys.argv[1] if len(sys.argv) > 1 else None
+        for time_ms, val in store.series(ons_code):
+            print('%s %9d' % (ms_to_timestamp(time_ms), val))
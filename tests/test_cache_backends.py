@@ -0,0 +1,191 @@
+import socket
+
+import pytest
+
+import cache_backends
+from cache_backends import (LRUCache, SharedFileCache, MemcachedClient,
+                            make_cache, get_cache, expiry_epoch,
+                            DELETE_FAILED, DELETE_MISSING, DELETE_SUCCESSFUL)
+import memcache_test_server
+
+
+class Clock(object):
+    """
+    Stands in for the time module, so that entries can be expired without
+    waiting
+    """
+    def __init__(self):
+        self.now = 1000000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_backends, 'time', clock)
+    return clock
+
+
+@pytest.fixture(scope='module')
+def memcached_server():
+    server = memcache_test_server.start_in_thread()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=['lru', 'file', 'memcached'])
+def cache(request, tmp_path):
+    if request.param == 'lru':
+        yield LRUCache()
+    elif request.param == 'file':
+        yield SharedFileCache(str(tmp_path / 'cache'))
+    else:
+        server = request.getfixturevalue('memcached_server')
+        client = MemcachedClient(*server.server_address)
+        client.flush_all()
+        yield client
+        client.close()
+
+
+def test_get_set_delete(cache):
+    value = {'content': u'<p>caf\xe9</p>', 'hash': 'abc'}
+    assert cache.get('page') is None
+    assert cache.set('page', value)
+    got = cache.get('page')
+    assert got == value
+    # A copy, not the stored object
+    got['content'] = 'changed'
+    assert cache.get('page') == value
+    assert cache.set('page', [1, 2])
+    assert cache.get('page') == [1, 2]
+    assert cache.delete('page') == DELETE_SUCCESSFUL
+    assert cache.delete('page') == DELETE_MISSING
+    assert cache.get('page') is None
+
+
+def test_add(cache):
+    assert cache.add('lock', 1)
+    assert not cache.add('lock', 2)
+    assert cache.get('lock') == 1
+    cache.delete('lock')
+    assert cache.add('lock', 3)
+    assert cache.get('lock') == 3
+
+
+def test_awkward_keys(cache):
+    keys = ['with space', 'x' * 300, u'caf\xe9', 'new\nline']
+    for n, key in enumerate(keys):
+        cache.set(key, n)
+    assert [cache.get(z) for z in keys] == list(range(len(keys)))
+
+
+def test_flush_all(cache):
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.flush_all()
+    assert cache.get('a') is None and cache.get('b') is None
+    assert cache.add('a', 3)
+
+
+def test_expiry(cache, clock):
+    cache.set('forever', 1)
+    cache.set('relative', 2, time=60)
+    cache.set('absolute', 3, time=clock.now + 120)
+    assert cache.add('lock', 4, time=30)
+    clock.now += 59
+    assert [cache.get(z) for z in ('forever', 'relative', 'absolute', 'lock')] == \
+        [1, 2, 3, None]
+    # An expired entry doesn't block add()
+    assert cache.add('lock', 5, time=30)
+    clock.now += 2
+    assert cache.get('relative') is None
+    assert cache.delete('relative') == DELETE_MISSING
+    clock.now += 60
+    assert cache.get('absolute') is None
+    assert cache.get('forever') == 1
+
+
+def test_expiry_epoch():
+    assert expiry_epoch(0, now=100) is None
+    assert expiry_epoch(60, now=100) == 160
+    assert expiry_epoch(2000000000, now=100) == 2000000000
+
+
+def test_lru_eviction():
+    cache = LRUCache(max_items=3)
+    for key in 'abc':
+        cache.set(key, key)
+    cache.get('a')
+    cache.set('d', 'd')
+    assert len(cache) == 3
+    assert cache.get('b') is None
+    assert [cache.get(z) for z in 'acd'] == ['a', 'c', 'd']
+
+    cache = LRUCache(max_bytes=1000)
+    cache.set('small', 'x')
+    cache.set('big', 'x' * 600)
+    cache.set('bigger', 'x' * 600)
+    assert cache.get('small') is None and cache.get('big') is None
+    assert cache.get('bigger') == 'x' * 600
+    # Too big for the cache at all
+    cache.set('huge', 'x' * 2000)
+    assert len(cache) == 0
+
+
+def test_shared_file_cache_between_instances(tmp_path):
+    directory = str(tmp_path / 'cache')
+    first, second = SharedFileCache(directory), SharedFileCache(directory)
+    first.set('page', 'content')
+    assert second.get('page') == 'content'
+    assert second.add('lock', 1)
+    assert not first.add('lock', 2)
+    # A spoilt file is treated as missing
+    with open(first._filename('page'), 'wb') as outputstream:
+        outputstream.write(b'abc')
+    assert second.get('page') is None
+    assert [z for z in tmp_path.joinpath('cache').iterdir()
+            if z.name.endswith('.tmp')] == []
+
+
+def test_memcached_unavailable():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    client = MemcachedClient('127.0.0.1', port, timeout=1)
+    assert client.get('page') is None
+    assert client.set('page', 1) is False
+    assert client.add('page', 1) is False
+    assert client.delete('page') == DELETE_FAILED
+
+
+def test_memcached_reconnects(memcached_server):
+    client = MemcachedClient(*memcached_server.server_address)
+    client.set('page', 1)
+    # Dropped by the client, rather than the server
+    client.close()
+    assert client.get('page') == 1
+
+
+def test_make_and_get_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_backends, '_caches', {})
+    assert isinstance(make_cache('lru'), LRUCache)
+    file_cache = make_cache('file:%s' % (tmp_path))
+    assert isinstance(file_cache, SharedFileCache)
+    assert file_cache.directory == str(tmp_path)
+    client = make_cache('memcached:example.com:1234')
+    assert (client.host, client.port) == ('example.com', 1234)
+    client = make_cache('memcached')
+    assert (client.host, client.port) == (cache_backends.DEFAULT_MEMCACHED_HOST,
+                                          cache_backends.DEFAULT_MEMCACHED_PORT)
+    with pytest.raises(ValueError):
+        make_cache('carrier-pigeon')
+
+    assert get_cache('lru') is get_cache('lru')
+    monkeypatch.setenv('CACHE_BACKEND', 'file:%s' % (tmp_path))
+    assert get_cache() is get_cache('file:%s' % (tmp_path))
+    monkeypatch.delenv('CACHE_BACKEND')
+    assert get_cache() is get_cache('lru')
@@ -0,0 +1,105 @@
+import io
+
+import pytest
+
+from constituency import (ColumnSchema, Constituency, MissingColumnError,
+                          CONSTITUENCY_FIELDS, HeaderSniffingReader,
+                          sniff_admin_csv_for_ignorable_lines)
+
+ADMIN_HEADER = ['Press association number', 'ONS Code', 'Constituency',
+                'Electorate ', 'Total number of valid votes counted']
+ADMIN_ROW = ['1', 'E14000001', ' London Seat A ', '205,279', '102,636']
+
+
+def test_schema_finds_columns_by_any_heading():
+    schema = ColumnSchema(ADMIN_HEADER, CONSTITUENCY_FIELDS)
+    assert schema.has_column('pa_number')
+    assert not schema.has_column('region')
+    extract = schema.row_extractor()
+    assert extract(ADMIN_ROW) == ('E14000001', '1', 'London Seat A', '205,279',
+                                  '102,636', None)
+
+
+def test_schema_prefers_earlier_headings():
+    fields = [('ons_code', ['ONS Code', 'code'], True)]
+    assert ColumnSchema(['code', 'ONS Code'], fields).row_extractor()(['x', 'y']) == ('y',)
+    # Duplicated headings - last one wins, as with csv.DictReader
+    assert ColumnSchema(['code', 'code'], fields).row_extractor()(['x', 'y']) == ('y',)
+
+
+def test_schema_missing_required_column():
+    with pytest.raises(MissingColumnError):
+        ColumnSchema(ADMIN_HEADER[:2], CONSTITUENCY_FIELDS)
+
+
+def test_short_rows_are_padded():
+    extract = ColumnSchema(ADMIN_HEADER, CONSTITUENCY_FIELDS).row_extractor()
+    assert extract(ADMIN_ROW[:3]) == ('E14000001', '1', 'London Seat A', '', '', None)
+
+
+def test_values_and_dict_constructors_agree():
+    row = ADMIN_ROW
+    from_dict = Constituency(dict(zip(ADMIN_HEADER, row)))
+    values = ColumnSchema(ADMIN_HEADER, CONSTITUENCY_FIELDS).row_extractor()(row)
+    from_values = Constituency.from_csv_values(values)
+    for attr in ('ons_code', 'pa_number', 'name', 'electorate', 'valid_votes',
+                 'region', 'country'):
+        assert getattr(from_values, attr) == getattr(from_dict, attr)
+    assert from_values.electorate == 205279
+
+
+ADMIN_CSV = ('Junk title line,,,\n'
+             ',,,\n'
+             'Press association number,ONS Code,Constituency,Electorate \n'
+             '1,E14000001,London Seat A,"205,279"\n'
+             '2,E14000002,London Seat B,"1,000"\n')
+
+
+class UnseekableStream(io.RawIOBase):
+    """
+    e.g. sys.stdin or an HTTP response
+    """
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._data.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def test_header_sniffing_reader_skips_title_lines():
+    with HeaderSniffingReader(io.StringIO(ADMIN_CSV)) as reader:
+        assert reader.skipped_lines == 2
+        assert reader.header[:3] == ['Press association number', 'ONS Code', 'Constituency']
+        rows = list(reader)
+    assert [z[1] for z in rows] == ['E14000001', 'E14000002']
+    assert rows[0][3] == '205,279'
+
+
+def test_header_sniffing_reader_reads_unseekable_binary_streams():
+    stream = io.BufferedReader(UnseekableStream(ADMIN_CSV.encode('utf-8')))
+    assert not stream.seekable()
+    with HeaderSniffingReader(stream) as reader:
+        assert [z[1] for z in reader] == ['E14000001', 'E14000002']
+    # Left for the caller to close
+    assert not stream.closed
+
+
+def test_header_sniffing_reader_files(tmp_path):
+    filename = str(tmp_path / 'admin.csv')
+    with open(filename, 'w') as outputstream:
+        outputstream.write(ADMIN_CSV)
+    assert sniff_admin_csv_for_ignorable_lines(filename) == 2
+    with HeaderSniffingReader(filename) as reader:
+        stream = reader.stream
+        assert len(list(reader)) == 2
+    assert stream.closed
+
+    with open(filename, 'w') as outputstream:
+        outputstream.write('no,header,here\n1,2,3\n')
+    with pytest.raises(IOError):
+        HeaderSniffingReader(filename)
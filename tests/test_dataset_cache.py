@@ -0,0 +1,69 @@
+import glob
+import os
+
+from dataset_cache import cached, find_snapshot
+
+
+def write(filename, content):
+    with open(filename, 'w') as outputstream:
+        outputstream.write(content)
+
+
+class Builder(object):
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return {'built': self.calls}
+
+
+def test_snapshot_reused_until_inputs_change(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    source = str(tmp_path / 'source.csv')
+    write(source, 'a,b\n1,2\n')
+    builder = Builder()
+
+    assert cached('test', [source], builder, cache_dir=cache_dir) == {'built': 1}
+    assert cached('test', [source], builder, cache_dir=cache_dir) == {'built': 1}
+    assert builder.calls == 1
+
+    write(source, 'a,b\n1,3\n')
+    assert cached('test', [source], builder, cache_dir=cache_dir) == {'built': 2}
+    # The snapshot for the old contents is tidied up
+    assert len(glob.glob(os.path.join(cache_dir, 'test-*.pickle'))) == 1
+
+
+def test_extra_values_are_part_of_the_key(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    source = str(tmp_path / 'source.csv')
+    write(source, 'a\n')
+    builder = Builder()
+    cached('test', [source], builder, extra=['x'], cache_dir=cache_dir)
+    cached('test', [source], builder, extra=['y'], cache_dir=cache_dir)
+    assert builder.calls == 2
+
+
+def test_unreadable_snapshot_is_rebuilt(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    source = str(tmp_path / 'source.csv')
+    write(source, 'a\n')
+    builder = Builder()
+    cached('test', [source], builder, cache_dir=cache_dir)
+    filename, _ = find_snapshot('test', [source], cache_dir=cache_dir)
+    with open(filename, 'r+b') as outputstream:
+        outputstream.truncate(5)
+
+    assert cached('test', [source], builder, cache_dir=cache_dir) == {'built': 2}
+    assert find_snapshot('test', [source], cache_dir=cache_dir)[1] == {'built': 2}
+
+
+def test_unwritable_cache_dir_still_builds(tmp_path):
+    source = str(tmp_path / 'source.csv')
+    write(source, 'a\n')
+    # A file where the directory should be
+    cache_dir = str(tmp_path / 'cache')
+    write(cache_dir, '')
+    builder = Builder()
+    assert cached('test', [source], builder, cache_dir=cache_dir) == {'built': 1}
+    assert cached('test', [source], builder, cache_dir=cache_dir) == {'built': 2}
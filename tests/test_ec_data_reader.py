@@ -0,0 +1,74 @@
+from collections import namedtuple
+import io
+
+import pytest
+
+from ec_data_reader import (iter_wide_format_results, iter_constituency_results,
+                            OutOfOrderResultsError)
+
+HEADER = 'code,constituency,electorate,turnout,all,brx,con,dup,grn,ind,lab,lib,oth,plc,sdl,snf,snp,spk,ukp,uup\n'
+FULL_ROW = 'E14000001,London Seat A,60440,30220,0,503,5624,0,0,0,16557,7536,0,0,0,0,0,0,0,0\n'
+
+
+def results(csv_text):
+    return list(iter_wide_format_results(io.StringIO(HEADER + csv_text)))
+
+
+def votes(result):
+    return [(z.party, z.valid_votes) for z in result.results]
+
+
+def test_wide_format_row():
+    cr, = results(FULL_ROW)
+    assert cr.constituency.ons_code == 'E14000001'
+    # Zero-vote parties are omitted
+    assert [z[1] for z in votes(cr)] == [16557, 7536, 5624, 503]
+
+
+def test_short_row_is_padded():
+    # Trailing party columns missing altogether, and one that's empty
+    cr, = results('E14000001,London Seat A,60440,30220,0,503,5624,0,,0,16557,7536\n')
+    expected, = results(FULL_ROW)
+    assert votes(cr) == votes(expected)
+
+
+Con = namedtuple('Con', ['ons_code'])
+ONS_TO_CON = dict((z, Con(z)) for z in ('E1', 'E2', 'E3'))
+RESULTS_HEADER = 'ONS Code,Constituency Name,Party Identifier,Valid votes\n'
+
+
+def constituency_results(rows, buffer_size=1):
+    csv_text = RESULTS_HEADER + ''.join('%s,Name %s,%s,%d\n' % z for z in rows)
+    return iter_constituency_results(io.StringIO(csv_text), ONS_TO_CON,
+                                     buffer_size=buffer_size)
+
+
+def summary(results):
+    return [(z.constituency.ons_code, z.winning_margin) for z in results]
+
+
+GROUPED = [('E1', 'E1', 'Lab', 10), ('E1', 'E1', 'Con', 4),
+           ('E2', 'E2', 'Lab', 3), ('E2', 'E2', 'Con', 5),
+           ('E3', 'E3', 'Lab', 7)]
+INTERLEAVED = [('E1', 'E1', 'Lab', 10), ('E2', 'E2', 'Lab', 3),
+               ('E1', 'E1', 'Con', 4), ('E2', 'E2', 'Con', 5),
+               ('E3', 'E3', 'Lab', 7)]
+
+
+def test_grouped_results():
+    assert summary(constituency_results(GROUPED)) == [('E1', 6), ('E2', 2), ('E3', 7)]
+
+
+def test_interleaved_results_need_a_bigger_buffer():
+    with pytest.raises(OutOfOrderResultsError):
+        list(constituency_results(INTERLEAVED))
+    assert summary(constituency_results(INTERLEAVED, buffer_size=2)) == \
+        [('E1', 6), ('E2', 2), ('E3', 7)]
+    assert sorted(summary(constituency_results(INTERLEAVED, buffer_size=None))) == \
+        [('E1', 6), ('E2', 2), ('E3', 7)]
+
+
+def test_buffer_size_must_be_positive():
+    for buffer_size in (0, -1):
+        with pytest.raises(ValueError):
+            constituency_results(GROUPED, buffer_size=buffer_size)
@@ -0,0 +1,131 @@
+import pytest
+
+import dataset_cache
+import election_loaders
+from election_loaders import (load_election, parse_election, register_format,
+                              UnknownElectionError, ELECTION_FORMATS)
+from ge_config import GENERAL_ELECTIONS
+
+YEARS = sorted(GENERAL_ELECTIONS.keys())
+
+
+def summary(election_data):
+    """
+    Everything we care about in a list of ConstituencyResult objects, in a
+    form that can be compared
+    """
+    return [(z.constituency.ons_code, z.constituency.name, z.constituency.region,
+             z.constituency.electorate, z.constituency.valid_votes,
+             z.constituency.euref.leave_pc if z.constituency.euref else None,
+             [(r.party, r.valid_votes) for r in z.results])
+            for z in election_data]
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """
+    Snapshots go in tmp_path rather than intermediate_data/cache, and nothing
+    is already loaded
+    """
+    cache_dir = str(tmp_path / 'cache')
+    monkeypatch.setattr(election_loaders, '_loaded_elections', {})
+    monkeypatch.setattr(
+        election_loaders, 'cached',
+        lambda label, input_files, builder, extra=None:
+        dataset_cache.cached(label, input_files, builder, extra, cache_dir))
+    monkeypatch.setattr(
+        election_loaders, 'find_snapshot',
+        lambda label, input_files, extra=None:
+        dataset_cache.find_snapshot(label, input_files, extra, cache_dir))
+    monkeypatch.setattr(
+        election_loaders, 'store_snapshot',
+        lambda label, filename, data:
+        dataset_cache.store_snapshot(label, filename, data, cache_dir))
+    return cache_dir
+
+
+@pytest.mark.parametrize('year', YEARS)
+def test_load_election_matches_parse(cache_dir, year):
+    loaded = load_election(year)
+    assert len(loaded) > 0
+    assert summary(loaded) == summary(parse_election(year))
+    # Shared within the process
+    assert load_election(year) is loaded
+
+    # And from the snapshot in a "new process"
+    election_loaders.forget_loaded_elections()
+    reloaded = load_election(year)
+    assert reloaded is not loaded
+    assert summary(reloaded) == summary(loaded)
+
+
+def test_without_euref(cache_dir):
+    assert all(z.constituency.euref is None
+               for z in load_election(2017, include_euref=False))
+    assert all(z.constituency.euref is not None for z in load_election(2017))
+
+
+def test_unknown_elections(monkeypatch):
+    with pytest.raises(UnknownElectionError):
+        load_election(1066)
+    monkeypatch.setitem(GENERAL_ELECTIONS, 2099, {'format': 'carrier_pigeon'})
+    with pytest.raises(UnknownElectionError):
+        load_election(2099)
+
+
+def test_registered_format(cache_dir, tmp_path, monkeypatch):
+    source = str(tmp_path / 'results.txt')
+    with open(source, 'w') as outputstream:
+        outputstream.write('first')
+    calls = []
+    monkeypatch.setitem(GENERAL_ELECTIONS, 2099, {'format': 'test_format',
+                                                  'results_csv': source})
+    monkeypatch.setattr(election_loaders, 'ELECTION_FORMATS', dict(ELECTION_FORMATS))
+
+    @register_format('test_format', input_files=lambda cfg: [cfg['results_csv']])
+    def parse_test_format(ge_cfg, regions, euref_data):
+        calls.append(ge_cfg)
+        with open(ge_cfg['results_csv']) as inputstream:
+            return [inputstream.read()]
+
+    assert load_election(2099, include_euref=False) == ['first']
+    assert calls == [GENERAL_ELECTIONS[2099]]
+
+    # Changing the input file invalidates the snapshot
+    with open(source, 'w') as outputstream:
+        outputstream.write('second')
+    election_loaders.forget_loaded_elections()
+    assert load_election(2099, include_euref=False) == ['second']
+    assert len(calls) == 2
+
+
+def test_load_all_elections_in_workers(cache_dir):
+    loaded = election_loaders.load_all_elections(workers=2)
+    assert sorted(loaded) == YEARS
+    for year in YEARS:
+        assert summary(loaded[year]) == summary(parse_election(year))
+        # Shared with load_election()
+        assert load_election(year) is loaded[year]
+    assert election_loaders.load_all_elections() == loaded
+
+    # The workers left snapshots for the next process
+    election_loaders.forget_loaded_elections()
+    snapshots = {}
+    for year in YEARS:
+        snapshots[year] = load_election(year)
+    assert election_loaders.load_all_elections(workers=2) == snapshots
+
+
+def test_load_all_elections_read_only_cache(cache_dir, monkeypatch):
+    monkeypatch.setattr(election_loaders, 'store_snapshot',
+                        lambda label, filename, data: False)
+    loaded = election_loaders.load_all_elections(workers=2)
+    for year in YEARS:
+        assert summary(loaded[year]) == summary(parse_election(year))
+        assert load_election(year) is loaded[year]
+
+
+def test_load_all_elections_keeps_existing(cache_dir):
+    first = load_election(YEARS[0])
+    loaded = election_loaders.load_all_elections(workers=2)
+    assert loaded[YEARS[0]] is first
@@ -0,0 +1,74 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from election_loaders import load_election
+from election_table import ElectionTable
+
+
+@pytest.fixture(scope='module', params=[2015, 2017, 2019])
+def election(request):
+    results = load_election(request.param)
+    return results, ElectionTable(results)
+
+
+def test_constituency_columns_match_objects(election):
+    results, table = election
+    assert len(table) == len(results)
+    for i, conres in enumerate(results):
+        con = conres.constituency
+        assert table[i] is conres
+        assert table.result_for(con.ons_code) is conres
+        assert table.electorate[i] == con.electorate
+        assert table.valid_votes[i] == con.valid_votes
+        assert table.parties[table.winner[i]] == conres.winning_party
+        assert table.winner_votes[i] == conres.winning_result.valid_votes
+        assert table.margin[i] == conres.winning_margin
+        assert table.turnout_pc[i] == pytest.approx(float(conres.turnout_pc))
+        assert table.margin_pc[i] == pytest.approx(float(conres.margin_pc))
+        if con.euref:
+            assert table.leave_pc[i] == pytest.approx(float(con.euref.leave_pc))
+        else:
+            assert np.isnan(table.leave_pc[i])
+
+
+def test_candidate_columns_match_objects(election):
+    results, table = election
+    for i, conres in enumerate(results):
+        start, end = table.candidate_offsets[i], table.candidate_offsets[i + 1]
+        assert list(table.candidate_votes[start:end]) == \
+            [z.valid_votes for z in conres.results]
+        assert [table.parties[z] for z in table.candidate_party[start:end]] == \
+            [z.party for z in conres.results]
+        assert (table.candidate_constituency[start:end] == i).all()
+
+
+def test_seats_and_votes_by_party(election):
+    results, table = election
+    assert table.seats_by_party() == dict(Counter(z.winning_party for z in results))
+    party = results[0].winning_party
+    votes = table.party_votes(party)
+    for i, conres in enumerate(results):
+        assert votes[i] == sum(z.valid_votes for z in conres.results if z.party == party)
+    assert (table.party_votes('No Such Party') == 0).all()
+
+
+def test_winners_from_votes_reproduces_result(election):
+    _, table = election
+    matrix = table.vote_matrix()
+    assert (matrix.sum(axis=1) ==
+            np.bincount(table.candidate_constituency, weights=table.candidate_votes)).all()
+    winner, margin = table.winners_from_votes(matrix)
+    assert (margin == table.margin).all()
+    # Ties aside, the winner is the same
+    untied = margin > 0
+    assert (winner[untied] == table.winner[untied]).all()
+
+
+def test_select(election):
+    results, table = election
+    mask = table.margin < np.median(table.margin)
+    assert table.select(mask) == [z for z in results
+                                  if z.winning_margin < np.median(table.margin)]
+    assert table.select(np.array([2, 0])) == [results[2], results[0]]
@@ -0,0 +1,52 @@
+from collections import namedtuple
+
+from ge_data_comparison import join_elections
+
+Con = namedtuple('Con', ['ons_code', 'pa_number', 'name'])
+
+
+def ons_codes(items):
+    return sorted(z.ons_code for z in items)
+
+
+def test_exact_match_beats_earlier_alias_match():
+    ge2017 = [Con('E1', 1, 'Alpha'), Con('E2', 2, 'Beta')]
+    ge2024 = [Con('E9', 1, 'Gamma'), Con('E1', 3, 'Alpha')]
+    joined = join_elections({2017: ge2017, 2024: ge2024})
+    assert [(a.ons_code, b.ons_code) for a, b in joined.matched(2017, 2024)] == \
+        [('E1', 'E1')]
+    assert ons_codes(joined.inserted(2017, 2024)) == ['E9']
+    assert ons_codes(joined.removed(2017, 2024)) == ['E2']
+
+
+def test_pa_number_is_not_a_default_alias():
+    joined = join_elections({2017: [Con('E1', 1, 'Alpha')],
+                             2024: [Con('E9', 1, 'Gamma')]})
+    assert joined.matched(2017, 2024) == []
+    joined = join_elections({2017: [Con('E1', 1, 'Alpha')],
+                             2024: [Con('E9', 1, 'Gamma')]},
+                            aliases=('pa_number',))
+    assert len(joined.matched(2017, 2024)) == 1
+
+
+def test_falls_back_to_slug_when_ons_code_changes():
+    joined = join_elections({2015: [Con('E1', 1, 'Weston-Super-Mare')],
+                             2017: [Con('E5', 1, 'Weston-super-Mare')],
+                             2019: [Con('E5', 1, 'Weston-super-Mare')]})
+    assert len(joined.rows) == 1
+    assert [z.ons_code for z in joined.rows[0]] == ['E1', 'E5', 'E5']
+
+
+def test_rows_never_matched_twice_in_a_year():
+    joined = join_elections({2017: [Con('E1', 1, 'Alpha')],
+                             2019: [Con('E1', 1, 'Alpha'), Con('E1', 2, 'Alpha')]})
+    assert len(joined.matched(2017, 2019)) == 1
+    assert len(joined.inserted(2017, 2019)) == 1
+
+
+def test_get_constituency():
+    Result = namedtuple('Result', ['constituency', 'votes'])
+    joined = join_elections({2017: [Result(Con('E1', 1, 'Alpha'), 10)],
+                             2019: [Result(Con('E1', 1, 'Alpha'), 20)]},
+                            get_constituency=lambda z: z.constituency)
+    assert [(a.votes, b.votes) for a, b in joined.matched(2017, 2019)] == [(10, 20)]
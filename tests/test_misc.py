@@ -0,0 +1,66 @@
+from decimal import Decimal, ROUND_HALF_UP
+import pickle
+import random
+
+from misc import basis_points, basis_pointify, percentify, lazy_property
+from election_loaders import load_election
+from euref_data_reader import load_and_process_euref_data
+
+
+def decimal_bp(value):
+    return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def test_basis_points_match_decimal():
+    rng = random.Random(1)
+    pairs = [(1, 8), (1, 3), (2, 3), (5, 10000 * 2), (0, 7), (7, 7)]
+    pairs += [(rng.randint(0, 10 ** 6), rng.randint(1, 10 ** 6)) for _ in range(1000)]
+    for numerator, denominator in pairs:
+        assert basis_points(numerator, denominator) == \
+            decimal_bp(Decimal(100 * numerator) / Decimal(denominator))
+
+
+def test_basis_pointify_matches_percentify():
+    for txt in ('52.34%', '52.345', '52.3449', '-1.005', '50', '.5', '0.004',
+                '-0.005%', ' 61.9 '):
+        assert basis_pointify(txt) == decimal_bp(percentify(txt.strip())), txt
+
+
+class Counted(object):
+    calls = 0
+
+    @lazy_property
+    def value(self):
+        Counted.calls += 1
+        return Decimal('1.5')
+
+
+def test_lazy_property_is_calculated_once_and_pickled():
+    Counted.calls = 0
+    obj = Counted()
+    assert 'value' not in obj.__dict__
+    assert obj.value == Decimal('1.5')
+    assert obj.value == Decimal('1.5')
+    assert Counted.calls == 1
+    copy = pickle.loads(pickle.dumps(obj))
+    assert copy.value == Decimal('1.5')
+    assert Counted.calls == 1
+    assert Counted.value.__name__ == 'value'
+
+
+def test_result_percentages():
+    for conres in load_election(2017):
+        con = conres.constituency
+        assert conres.turnout_pc == Decimal(100 * con.valid_votes / con.electorate)
+        assert conres.margin_pc == Decimal(100 * conres.winning_margin / con.valid_votes)
+        assert conres.turnout_bp == decimal_bp(Decimal(100 * con.valid_votes) /
+                                               Decimal(con.electorate))
+        assert conres.margin_bp == decimal_bp(Decimal(100 * conres.winning_margin) /
+                                              Decimal(con.valid_votes))
+
+
+def test_euref_percentages():
+    for result in load_and_process_euref_data().values():
+        assert result.leave_pc == percentify(result.leave_pc_text)
+        assert result.leave_bp == decimal_bp(result.leave_pc)
+        assert result.voted_to_leave == (result.leave_pc > 50)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import misc
+import constituency
+from normalisation import (memoized, slugify, slugify_many,
+                           clean_constituency_name, _old_slugify,
+                           _old_clean_constituency_name)
+from regions import region_service
+
+NAMES = [u'Sinn F\xe9in', 'Sinn Fein', 'Labour and Co-operative',
+         "Liberal Democrats", 'UKIP', 'Brecon and Radnorshire 5',
+         'Swansea East6', ' Cardiff South & Penarth 5 ', 'Ynys M\xf4n',
+         'Weston-Super-Mare', '', '123', 'A  --  B']
+
+
+def test_same_as_old_implementations():
+    names = NAMES + [name for names in region_service().region_data().values()
+                     for name in names]
+    for name in names:
+        assert slugify(name) == _old_slugify(name)
+        assert slugify(name) == slugify.uncached(name)
+        assert clean_constituency_name(name) == _old_clean_constituency_name(name)
+    assert slugify_many(names) == [_old_slugify(z) for z in names]
+    assert slugify(u'Sinn F\xe9in') == 'sinn-fein'
+    assert clean_constituency_name(' Cardiff South & Penarth 5 ') == \
+        'Cardiff South and Penarth'
+
+
+def test_shared_with_legacy_modules():
+    assert misc.slugify is slugify
+    assert constituency.clean_constituency_name is clean_constituency_name
+
+
+def test_memoized():
+    calls = []
+
+    @memoized(maxsize=3)
+    def double(x):
+        """Twice x"""
+        calls.append(x)
+        return x * 2
+
+    assert double.__name__ == 'double'
+    assert double.__doc__ == 'Twice x'
+    assert [double(z) for z in [1, 2, 1, 2, 3]] == [2, 4, 2, 4, 6]
+    assert calls == [1, 2, 3]
+    assert double.cache == {1: 2, 2: 4, 3: 6}
+    # Full, so emptied before the next one goes in
+    assert double(4) == 8
+    assert double.cache == {4: 8}
+    assert double(1) == 2
+    assert calls == [1, 2, 3, 4, 1]
+    double.cache_clear()
+    assert double.cache == {}
+    assert double.uncached(5) == 10
+    assert double.cache == {}
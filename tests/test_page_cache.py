@@ -0,0 +1,212 @@
+import threading
+import time
+
+import pytest
+
+from cache_backends import LRUCache, SharedFileCache
+from page_cache import PageCache
+
+KEY = 'page'
+
+
+@pytest.fixture(params=['lru', 'file'])
+def cache(request, tmp_path):
+    if request.param == 'lru':
+        return LRUCache()
+    return SharedFileCache(str(tmp_path / 'cache'))
+
+
+def make_page_cache(cache, **kwargs):
+    return PageCache(cache, KEY, max_age=60, stale_time=300, lock_time=1, **kwargs)
+
+
+def iter_render(data):
+    for chunk in data.decode('ascii').split():
+        yield chunk
+
+
+def locked(cache):
+    return cache.get(KEY + '-lock') is not None
+
+
+def test_streamed_page_is_stored(cache):
+    page_cache = make_page_cache(cache)
+    assert list(page_cache.iter_get(lambda: b'a b c', iter_render)) == ['a', 'b', 'c']
+    assert cache.get(KEY)['content'] == 'abc'
+    assert page_cache.renders == 1
+    assert not locked(cache)
+
+
+def test_lock_released_once_last_chunk_is_rendered(cache):
+    page_cache = make_page_cache(cache)
+    chunks = page_cache.iter_get(lambda: b'a b c', iter_render)
+    assert next(chunks) == 'a'
+    assert locked(cache)
+    assert next(chunks) == 'b'
+    assert locked(cache)
+    # The caller hasn't finished with the last chunk, but it's rendered
+    assert next(chunks) == 'c'
+    assert not locked(cache)
+    assert cache.get(KEY)['content'] == 'abc'
+
+
+def test_abandoned_render_is_not_stored(cache):
+    page_cache = make_page_cache(cache)
+    chunks = page_cache.iter_get(lambda: b'a b c', iter_render)
+    assert next(chunks) == 'a'
+    chunks.close()
+    assert cache.get(KEY) is None
+    assert not locked(cache)
+    assert page_cache.renders == 0
+
+
+class Source(object):
+    """
+    get_data and iter_render functions that count how often they're called
+    """
+    def __init__(self, data=b'a b c', render_delay=0):
+        self.data = data
+        self.render_delay = render_delay
+        self.fetches = 0
+        self.renders = 0
+
+    def get_data(self):
+        self.fetches += 1
+        return self.data
+
+    def iter_render(self, data):
+        self.renders += 1
+        if self.render_delay:
+            time.sleep(self.render_delay)
+        return iter_render(data)
+
+
+def age_record(cache, seconds):
+    record = cache.get(KEY)
+    record['validated'] -= seconds
+    cache.set(KEY, record)
+
+
+def hold_lock(cache):
+    assert cache.add(KEY + '-lock', 1, time=60)
+
+
+def get(page_cache, source):
+    return ''.join(page_cache.iter_get(source.get_data, source.iter_render))
+
+
+def test_fresh_page_is_not_revalidated(cache):
+    page_cache = make_page_cache(cache)
+    source = Source()
+    assert get(page_cache, source) == 'abc'
+    assert get(page_cache, source) == 'abc'
+    assert (source.fetches, source.renders) == (1, 1)
+
+
+def test_unchanged_data_is_not_rendered_again(cache):
+    page_cache = make_page_cache(cache)
+    source = Source()
+    get(page_cache, source)
+    age_record(cache, 61)
+    assert get(page_cache, source) == 'abc'
+    assert (source.fetches, source.renders) == (2, 1)
+    # Revalidated, so fresh again
+    get(page_cache, source)
+    assert source.fetches == 2
+
+
+def test_changed_data_is_rendered(cache):
+    page_cache = make_page_cache(cache)
+    source = Source()
+    get(page_cache, source)
+    age_record(cache, 61)
+    source.data = b'x y'
+    assert get(page_cache, source) == 'xy'
+    assert source.renders == 2
+
+
+def test_stale_page_served_while_someone_else_revalidates(cache):
+    page_cache = make_page_cache(cache)
+    source = Source()
+    get(page_cache, source)
+    age_record(cache, 61 + 200)
+    hold_lock(cache)
+    source.data = b'x y'
+    assert get(page_cache, source) == 'abc'
+    assert source.fetches == 1
+
+
+def test_waits_beyond_stale_time_for_the_new_page(cache):
+    page_cache = make_page_cache(cache)
+    source = Source()
+    get(page_cache, source)
+    age_record(cache, 61 + 301)
+    hold_lock(cache)
+
+    def other_request():
+        time.sleep(0.3)
+        other_cache = make_page_cache(cache)
+        record = cache.get(KEY)
+        other_cache._store(record['data_key'], 'new')
+        cache.delete(KEY + '-lock')
+    thread = threading.Thread(target=other_request)
+    thread.start()
+    started = time.time()
+    assert get(page_cache, source) == 'new'
+    thread.join()
+    assert 0.2 < time.time() - started < 1
+    assert source.fetches == 1
+
+
+def test_falls_back_to_old_page_if_lock_times_out(cache):
+    page_cache = make_page_cache(cache)
+    source = Source()
+    get(page_cache, source)
+    age_record(cache, 61 + 301)
+    hold_lock(cache)
+    started = time.time()
+    assert get(page_cache, source) == 'abc'
+    assert time.time() - started >= page_cache.lock_time
+    assert source.fetches == 1
+
+
+def test_renders_anyway_if_lock_times_out_with_no_page(cache):
+    page_cache = make_page_cache(cache)
+    source = Source()
+    hold_lock(cache)
+    assert get(page_cache, source) == 'abc'
+    assert source.renders == 1
+
+
+def test_no_data(cache):
+    page_cache = make_page_cache(cache)
+    with pytest.raises(ValueError):
+        get(page_cache, Source(data=None))
+    assert not locked(cache)
+
+    source = Source()
+    get(page_cache, source)
+    age_record(cache, 61)
+    source.data = None
+    assert get(page_cache, source) == 'abc'
+    assert not locked(cache)
+
+
+def test_only_one_concurrent_render(cache, tmp_path):
+    source = Source(render_delay=0.3)
+    results = []
+
+    def request():
+        if isinstance(cache, SharedFileCache):
+            # As if in another process
+            request_cache = SharedFileCache(cache.directory)
+        else:
+            request_cache = cache
+        results.append(get(make_page_cache(request_cache), source))
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ['abc'] * 8
+    assert source.renders == 1
@@ -0,0 +1,80 @@
+import pickle
+import threading
+
+from party_registry import PartyRegistry, PARTY_REGISTRY, load_party_colours
+from canonical_party_names import CANONICAL_PARTY_NAMES
+from ec_data_reader import CandidateResult
+from misc import slugify
+
+
+def test_canonical_names_share_ids():
+    registry = PartyRegistry()
+    canonical = sorted(set(CANONICAL_PARTY_NAMES.values()))
+    # Registered up front, in a fixed order
+    assert registry.names() == canonical
+    for raw_name, name in CANONICAL_PARTY_NAMES.items():
+        party_id = registry.intern(raw_name)
+        assert party_id == registry.intern(name) == canonical.index(name)
+        assert registry.name(party_id) == name
+    assert len(registry) == len(canonical)
+
+
+def test_new_parties():
+    registry = PartyRegistry({'lab': 'Labour'})
+    assert registry.names() == ['Labour']
+    party_id = registry.intern('Monster Raving Loony')
+    assert party_id == 1
+    assert registry.intern('Monster Raving Loony') == party_id
+    party = registry[party_id]
+    assert party.name == registry.name(party_id) == 'Monster Raving Loony'
+    assert party.slug == registry.slug(party_id) == slugify('Monster Raving Loony')
+    assert party.css_class == registry.css_class(party_id) == 'party-' + party.slug
+    assert [z.id for z in registry] == [0, 1]
+
+
+def test_concurrent_intern():
+    registry = PartyRegistry({})
+    names = ['Party %d' % z for z in range(200)]
+    results = {}
+
+    def worker(n):
+        results[n] = [registry.intern(z) for z in names]
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(registry) == len(names)
+    for ids in results.values():
+        assert ids == results[0]
+        assert sorted(ids) == list(range(len(names)))
+    assert [registry.name(z) for z in results[0]] == names
+
+
+def test_colours(tmp_path):
+    css_file = str(tmp_path / 'colours.css')
+    with open(css_file, 'w') as outputstream:
+        outputstream.write(':root {\n  --labour: #dc241f;\n'
+                           '  --green-party: #6ab023 ;\n}\n'
+                           '.party-labour { --ignored: #000; }\n')
+    assert load_party_colours(css_file) == {'labour': '#dc241f',
+                                            'green-party': '#6ab023'}
+    registry = PartyRegistry({}, css_file=css_file)
+    assert registry.colour(registry.intern('Labour')) == '#dc241f'
+    assert registry.colour(registry.intern('Independent'), 'grey') == 'grey'
+    missing = PartyRegistry({}, css_file=str(tmp_path / 'missing.css'))
+    assert missing.colour(missing.intern('Labour')) is None
+
+
+def test_candidate_result_pickles_party_name():
+    result = CandidateResult.from_values(
+        None, PARTY_REGISTRY.intern('Monster Raving Loony Party'), 1234)
+    state = result.__getstate__()
+    assert 'party_id' not in state
+    assert state['party'] == 'Monster Raving Loony Party'
+    copy = pickle.loads(pickle.dumps(result))
+    assert copy.party_id == result.party_id
+    assert copy.party == result.party
+    assert copy.valid_votes == 1234
+    assert PARTY_REGISTRY.name(copy.party_id) == 'Monster Raving Loony Party'
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from petition_analytics import PetitionAnalytics, load_petition_analytics, MEASURES
+from signature_store import SignatureStore
+
+THRESHOLDS = (150, 25, 100, 37.5, 0, 200)
+
+
+@pytest.fixture(scope='module')
+def analytics():
+    return load_petition_analytics(2017)
+
+
+def random_sigs(analytics, num_snapshots, seed=1):
+    rng = np.random.RandomState(seed)
+    margins = analytics.table.margin
+    return rng.randint(0, 3 * margins.max(), size=(num_snapshots, len(margins)))
+
+
+def denominator(conres, measure):
+    if measure == 'electorate':
+        return conres.constituency.electorate
+    if measure == 'turnout':
+        return conres.constituency.valid_votes
+    if measure == 'winner':
+        return conres.winning_result.valid_votes
+    return conres.winning_margin
+
+
+def group_of(analytics, conres, by):
+    if by == 'region':
+        return analytics.regions.index(conres.constituency.country_and_region)
+    return analytics.table.parties.index(conres.winning_party)
+
+
+def loop_sweep(analytics, sigs, thresholds, measure, by=None):
+    """
+    The straightforward version of PetitionAnalytics.sweep() for one
+    snapshot, straight from the ConstituencyResult objects
+    """
+    num_groups = len(analytics.group_labels[by]) if by else 1
+    ret = [[0] * num_groups for _ in thresholds]
+    for conres, s in zip(analytics.table, sigs):
+        ratio = 100.0 * s / denominator(conres, measure)
+        group = group_of(analytics, conres, by) if by else 0
+        for j, threshold in enumerate(thresholds):
+            if ratio > threshold:
+                ret[j][group] += 1
+    return np.array(ret) if by else np.array([z[0] for z in ret])
+
+
+@pytest.mark.parametrize('measure', MEASURES)
+@pytest.mark.parametrize('by', [None, 'region', 'party'])
+def test_sweep_matches_loop(analytics, measure, by):
+    sigs = random_sigs(analytics, 4)
+    swept = analytics.sweep(sigs, THRESHOLDS, measure, by)
+    expected = np.array([loop_sweep(analytics, z, THRESHOLDS, measure, by)
+                         for z in sigs])
+    assert swept.shape == expected.shape
+    assert (swept == expected).all()
+    # One snapshot at a time gives the same
+    assert (analytics.sweep(sigs[1], THRESHOLDS, measure, by) == expected[1]).all()
+
+
+def test_exactly_the_margin_is_not_past_it(analytics):
+    sigs = analytics.table.margin.copy()
+    assert analytics.sweep(sigs, [100])[0] == 0
+    assert not analytics.past_threshold(sigs, 100).any()
+    assert analytics.past_threshold(sigs + 1, 100).all()
+    assert analytics.summary(sigs)[0] == 0
+
+
+def test_count_by_and_summary_match_loop(analytics):
+    sigs = random_sigs(analytics, 1)[0]
+    expected = loop_sweep(analytics, sigs, [100], 'margin', 'region')[0]
+    assert analytics.count_by(sigs, 'region') == \
+        dict((r, int(n)) for r, n in zip(analytics.regions, expected) if n)
+
+    above = leave = 0
+    for conres, s in zip(analytics.table, sigs):
+        if s > conres.winning_margin:
+            above += 1
+            if conres.constituency.euref and conres.constituency.euref.leave_pc > 50.0:
+                leave += 1
+    assert analytics.summary(sigs) == (above, leave)
+
+
+def test_snapshot_sweep_aligns_store_columns(analytics, tmp_path):
+    ons_codes = analytics.table.ons_codes
+    # The store doesn't know about the first constituency, and its columns
+    # are in a different order to the table's
+    store = SignatureStore(str(tmp_path), ons_codes=ons_codes[1:][::-1])
+    sigs = random_sigs(analytics, 3)
+    for i, row in enumerate(sigs):
+        store.append(1000 * (i + 1), int(row.sum()),
+                     dict((ons, int(s)) for ons, s in zip(ons_codes[1:], row[1:])))
+    expected = sigs.copy()
+    expected[:, 0] = 0
+
+    times, store_sigs = analytics.snapshot_signatures(store)
+    assert list(times) == [1000, 2000, 3000]
+    assert (store_sigs == expected).all()
+    _, swept = analytics.snapshot_sweep(store, THRESHOLDS, by='party')
+    assert (swept == analytics.sweep(expected, THRESHOLDS, by='party')).all()
+
+
+def test_signatures_from_dict(analytics):
+    ons_codes = analytics.table.ons_codes
+    sigs = analytics.signatures({ons_codes[2]: 7, 'X99999999': 5})
+    assert sigs[2] == 7
+    assert sigs.sum() == 7
@@ -0,0 +1,87 @@
+import glob
+import json
+import os
+import shutil
+
+from petition_archive import PetitionArchive, diff, apply_diff
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'source_data')
+SAMPLE_FILES = sorted(glob.glob(os.path.join(SOURCE_DIR, '241584_AsAt*.json')))
+
+
+def copy_samples(directory):
+    for fn in SAMPLE_FILES:
+        shutil.copy(fn, str(directory))
+    return sorted(glob.glob(os.path.join(str(directory), '*.json')))
+
+
+def read(filename):
+    with open(filename, 'rb') as inputstream:
+        return inputstream.read()
+
+
+def keyframes(archive):
+    return [i for i, z in enumerate(archive.entries) if z['keyframe'] == i]
+
+
+def test_diff_round_trip():
+    old = json.loads(read(SAMPLE_FILES[0]).decode('utf-8'))
+    new = json.loads(read(SAMPLE_FILES[-1]).decode('utf-8'))
+    countries = new['data']['attributes']['signatures_by_country']
+    countries.insert(3, {'name': 'New', 'code': 'NW', 'signature_count': 1})
+    countries[10]['name'] = 'Renamed'
+    for a, b in ((old, new), (new, old)):
+        assert apply_diff(a, diff(a, b)) == b
+    assert diff(old, old) is None
+
+
+def test_only_first_snapshot_is_a_keyframe(tmp_path):
+    archive = PetitionArchive(str(tmp_path / 'archive'))
+    for fn in SAMPLE_FILES:
+        archive.append_file(fn)
+    assert keyframes(archive) == [0]
+    for i in range(1, len(archive)):
+        assert archive.entries[i]['length'] < 0.25 * archive.entries[0]['length']
+
+
+def test_export_and_prune_round_trip(tmp_path):
+    download_dir = tmp_path / 'downloads'
+    download_dir.mkdir()
+    files = copy_samples(download_dir)
+    originals = dict((os.path.basename(z), read(z)) for z in files)
+
+    archive = PetitionArchive(str(tmp_path / 'archive'), keyframe_interval=3)
+    for fn in files:
+        archive.append_file(fn)
+    assert keyframes(archive) == [0, 3]
+
+    pruned = archive.prune(str(download_dir), keep=[files[-1]])
+    assert sorted(pruned) == files[:-1]
+    assert os.listdir(str(download_dir)) == [os.path.basename(files[-1])]
+    # Nothing left to prune
+    assert archive.prune(str(download_dir), keep=[files[-1]]) == []
+
+    # A fresh instance reads the same archive back
+    archive = PetitionArchive(str(tmp_path / 'archive'), keyframe_interval=3)
+    export_dir = tmp_path / 'export'
+    export_dir.mkdir()
+    for i in range(len(archive)):
+        exported = archive.export(i, str(export_dir))
+        assert read(exported) == originals[os.path.basename(exported)]
+    assert len(os.listdir(str(export_dir))) == len(files)
+
+
+def test_prune_keeps_files_that_differ(tmp_path):
+    download_dir = tmp_path / 'downloads'
+    download_dir.mkdir()
+    files = copy_samples(download_dir)
+    archive = PetitionArchive(str(tmp_path / 'archive'))
+    for fn in files:
+        archive.append_file(fn)
+    with open(files[1], 'ab') as outputstream:
+        outputstream.write(b' ')
+    pruned = archive.prune(str(download_dir))
+    assert files[1] not in pruned
+    assert os.path.exists(files[1])
+    assert len(pruned) == len(files) - 1
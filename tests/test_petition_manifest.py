@@ -0,0 +1,113 @@
+import glob
+import os
+import shutil
+
+import pytest
+
+import petition_manifest
+from petition_manifest import (add_file, make_entry, read_entries, latest_entry,
+                               rebuild_manifest, latest_or_rebuild,
+                               MANIFEST_FILENAME)
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'source_data')
+SAMPLE_FILES = sorted(glob.glob(os.path.join(SOURCE_DIR, '241584_AsAt*.json')))
+
+
+@pytest.fixture
+def petition_dir(tmp_path):
+    for filename in SAMPLE_FILES:
+        shutil.copy(filename, str(tmp_path))
+    return str(tmp_path)
+
+
+def sample_paths(petition_dir):
+    return [os.path.join(petition_dir, os.path.basename(z)) for z in SAMPLE_FILES]
+
+
+def test_entries_and_freshest(petition_dir):
+    manifest_file = os.path.join(petition_dir, MANIFEST_FILENAME)
+    assert latest_entry(manifest_file) is None
+    paths = sample_paths(petition_dir)
+    entries = [make_entry(z, epoch=1000 + i) for i, z in enumerate(paths)]
+    by_freshness = sorted(entries, key=lambda z: z['updated_epoch'])
+    freshest, stalest = by_freshness[-1], by_freshness[0]
+
+    # Download the freshest, then an older one
+    add_file(os.path.join(petition_dir, freshest['filename']), 2000, manifest_file)
+    entry = add_file(os.path.join(petition_dir, stalest['filename']), 2001,
+                     manifest_file)
+    assert entry['filename'] == stalest['filename']
+    assert entry['freshest_filename'] == freshest['filename']
+    assert latest_entry(manifest_file) == entry
+    assert [z['filename'] for z in read_entries(manifest_file)] == \
+        [freshest['filename'], stalest['filename']]
+    assert entry['epoch'] == 2001
+    assert entry['size'] == os.path.getsize(os.path.join(petition_dir,
+                                                         stalest['filename']))
+    assert entry['signature_count'] == stalest['signature_count']
+
+
+def test_truncated_line_is_ignored(petition_dir, monkeypatch):
+    manifest_file = os.path.join(petition_dir, MANIFEST_FILENAME)
+    paths = sample_paths(petition_dir)
+    first = add_file(paths[0], 1000, manifest_file)
+    second = add_file(paths[1], 1001, manifest_file)
+    with open(manifest_file, 'rb') as inputstream:
+        data = inputstream.read()
+    # Chop the end off the last line, as if the writer had died part way
+    with open(manifest_file, 'wb') as outputstream:
+        outputstream.write(data[:-20])
+    assert latest_entry(manifest_file) == first
+    assert list(read_entries(manifest_file)) == [first]
+
+    # The next entry goes on its own line
+    third = add_file(paths[2], 1002, manifest_file)
+    assert list(read_entries(manifest_file)) == [first, third]
+    assert latest_entry(manifest_file) == third
+    assert second not in list(read_entries(manifest_file))
+
+    # Only the end of the manifest is read, even if that's less than a line
+    monkeypatch.setattr(petition_manifest, 'TAIL_BLOCK_SIZE', 16)
+    assert latest_entry(manifest_file) == third
+
+
+def test_short_write(petition_dir, monkeypatch):
+    manifest_file = os.path.join(petition_dir, MANIFEST_FILENAME)
+    paths = sample_paths(petition_dir)
+    first = add_file(paths[0], 1000, manifest_file)
+    real_write = os.write
+    with monkeypatch.context() as patch:
+        patch.setattr(petition_manifest.os, 'write',
+                      lambda fd, data: real_write(fd, data[:len(data) // 2]))
+        with pytest.raises(IOError):
+            add_file(paths[1], 1001, manifest_file)
+    assert latest_entry(manifest_file) == first
+    third = add_file(paths[2], 1002, manifest_file)
+    assert list(read_entries(manifest_file)) == [first, third]
+
+
+def test_rebuild(petition_dir):
+    manifest_file = os.path.join(petition_dir, MANIFEST_FILENAME)
+    with open(os.path.join(petition_dir, '241584_broken.json'), 'w') as outputstream:
+        outputstream.write('{"data": {"attributes": {}}}')
+    entry = latest_or_rebuild(petition_dir)
+    entries = list(read_entries(manifest_file))
+    assert len(entries) == len(SAMPLE_FILES)
+    assert entry == entries[-1]
+    assert set(z['filename'] for z in entries) == \
+        set(os.path.basename(z) for z in SAMPLE_FILES)
+    freshest = max(entries, key=lambda z: z['updated_epoch'])
+    assert entry['freshest_filename'] == freshest['filename']
+    assert not glob.glob(os.path.join(petition_dir, '*.tmp'))
+
+    # Rebuilding replaces rather than appends
+    assert rebuild_manifest(petition_dir) == len(SAMPLE_FILES)
+    assert [z['filename'] for z in read_entries(manifest_file)] == \
+        [z['filename'] for z in entries]
+
+    empty_dir = os.path.join(petition_dir, 'empty')
+    os.mkdir(empty_dir)
+    assert latest_or_rebuild(empty_dir) is None
+    # e.g. read-only filesystem
+    assert latest_or_rebuild(os.path.join(petition_dir, 'missing')) is None
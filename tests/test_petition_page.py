@@ -0,0 +1,75 @@
+import glob
+import os
+
+import pytest
+
+import petition_page
+from cache_backends import LRUCache, get_cache
+from grab_latest_petition_data import DOWNLOAD_KEY
+from page_cache import PageCache
+from revoke_comparison import iter_process
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'source_data')
+SAMPLE_FILES = sorted(glob.glob(os.path.join(SOURCE_DIR, '241584_AsAt*.json')))
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = LRUCache()
+    monkeypatch.setattr(petition_page, 'cache', cache)
+    monkeypatch.setattr(petition_page, 'page_cache',
+                        PageCache(cache, petition_page.PAGE_KEY, max_age=60,
+                                  stale_time=300))
+    return cache
+
+
+class Fetcher(object):
+    """
+    Stands in for offline.get_latest()
+    """
+    def __init__(self, cache, filename):
+        self.cache = cache
+        self.filename = filename
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        data = petition_page.load_from_file(self.filename)
+        self.cache.set(DOWNLOAD_KEY, data)
+        return data
+
+
+def expected_page(filename):
+    return ''.join(z + '\n' for z in iter_process(petition_file=filename,
+                                                  html_output=True,
+                                                  include_all=True, embed=False))
+
+
+def test_shares_the_default_cache():
+    assert petition_page.cache is get_cache()
+
+
+def test_page_is_rendered_and_cached(cache):
+    fetch_latest = Fetcher(cache, SAMPLE_FILES[0])
+    content = petition_page.page(fetch_latest)
+    assert content == expected_page(SAMPLE_FILES[0])
+    assert fetch_latest.calls == 1
+    assert petition_page.page_cache.renders == 1
+
+    # Streaming gives the same page, from the cache
+    assert ''.join(petition_page.iter_page(fetch_latest)) == content
+    assert fetch_latest.calls == 1
+    assert petition_page.page_cache.renders == 1
+
+
+def test_page_follows_downloaded_data(cache):
+    fetch_latest = Fetcher(cache, SAMPLE_FILES[0])
+    first = petition_page.page(fetch_latest)
+    # A new download, picked up from the cache without calling fetch_latest
+    cache.set(DOWNLOAD_KEY, petition_page.load_from_file(SAMPLE_FILES[-1]))
+    petition_page.page_cache.invalidate()
+    content = petition_page.page(fetch_latest)
+    assert content != first
+    assert content == expected_page(SAMPLE_FILES[-1])
+    assert fetch_latest.calls == 1
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+import petition_poller
+from petition_poller import (PetitionPoller, PollError, NEW, NOT_MODIFIED,
+                             UNCHANGED)
+import petition_test_server
+
+
+@pytest.fixture
+def server(tmp_path):
+    served_dir = tmp_path / 'served'
+    served_dir.mkdir()
+    server = petition_test_server.start_in_thread(
+        pattern=os.path.join(str(served_dir), '*.json'))
+    server.directory = str(served_dir)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def publish(server, content, mtime):
+    filename = os.path.join(server.directory, 'petition-%d.json' % (mtime))
+    with open(filename, 'wb') as outputstream:
+        outputstream.write(content)
+    os.utime(filename, (mtime, mtime))
+
+
+def make_poller(server, tmp_path, path='/petitions/241584.json'):
+    return PetitionPoller('http://127.0.0.1:%d%s' % (server.server_port, path),
+                          state_file=str(tmp_path / 'state.json'))
+
+
+def test_conditional_polling(server, tmp_path):
+    publish(server, b'{"v": 1}', 1000000000)
+    poller = make_poller(server, tmp_path)
+    result = poller.poll()
+    assert result.status == NEW
+    assert result.content == b'{"v": 1}'
+    poller.commit(result)
+
+    assert poller.conditional_headers()['If-None-Match'] == result.state['etag']
+    assert poller.poll().status == NOT_MODIFIED
+
+    publish(server, b'{"v": 2}', 1000000600)
+    result = poller.poll()
+    assert result.status == NEW
+    assert result.content == b'{"v": 2}'
+    assert server.requests_served == 3
+
+
+def test_uncommitted_snapshot_is_fetched_again(server, tmp_path):
+    publish(server, b'{"v": 1}', 1000000000)
+    poller = make_poller(server, tmp_path)
+    assert poller.poll().status == NEW
+    # e.g. saving it failed
+    assert poller.poll().status == NEW
+
+
+def test_state_persists_across_pollers(server, tmp_path):
+    publish(server, b'{"v": 1}', 1000000000)
+    poller = make_poller(server, tmp_path)
+    poller.commit(poller.poll())
+
+    # i.e. the next cron run
+    assert make_poller(server, tmp_path).poll().status == NOT_MODIFIED
+    # Validators from another URL aren't used
+    assert make_poller(server, tmp_path, path='/other.json').poll().status == NEW
+
+
+def test_same_content_without_validators_is_unchanged(server, tmp_path):
+    publish(server, b'{"v": 1}', 1000000000)
+    poller = make_poller(server, tmp_path)
+    poller.commit(poller.poll())
+    poller.state = dict(poller.state, etag=None, last_modified=None)
+    result = poller.poll()
+    assert result.status == UNCHANGED
+    assert result.content is None
+
+
+def test_error_response(server, tmp_path):
+    # Nothing to serve, so 404
+    with pytest.raises(PollError):
+        make_poller(server, tmp_path).poll()
+
+
+class StopPolling(Exception):
+    pass
+
+
+def test_poll_forever_survives_on_new_failing(server, tmp_path, monkeypatch):
+    publish(server, b'{"v": 1}', 1000000000)
+    poller = make_poller(server, tmp_path)
+    calls = []
+    def on_new(content):
+        calls.append(content)
+        if len(calls) == 1:
+            raise IOError('Disk full')
+    sleeps = []
+    def sleep(interval):
+        sleeps.append(interval)
+        if len(sleeps) == 3:
+            raise StopPolling()
+    monkeypatch.setattr(petition_poller.time, 'sleep', sleep)
+
+    with pytest.raises(StopPolling):
+        poller.poll_forever(on_new, interval=5)
+    # Not committed after the first failure, so handled again, then 304
+    assert calls == [b'{"v": 1}', b'{"v": 1}']
+    assert poller.poll().status == NOT_MODIFIED
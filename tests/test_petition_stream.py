@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import glob
+import io
+import json
+import os
+
+import pytest
+
+import petition_stream
+from petition_stream import (extract_fields, extract_petition_data,
+                             PetitionFormatError, PETITION_FIELDS)
+from revoke_comparison import process_petition_data
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'source_data')
+SAMPLE_FILES = sorted(glob.glob(os.path.join(SOURCE_DIR, '241584_AsAt*.json')))
+
+# Decoys with the same field names in other objects, escaped keys and strings
+# containing JSON punctuation
+TRICKY_JSON = u'''{"links": {"self": "x{[\\"]}"}, "data": {"type": "petition",
+ "signature_count": -1,
+ "attributes": {"action": "Revoke \\"Article\\" 50: [now], {please}",
+  "signatures_by_country": [{"name": "Fran\\u00e7e", "signature_count": 12}],
+  "sig\\u006eature_count": 6103056,
+  "updated_at" : "2019-04-01T12:00:00.000Z",
+  "signatures_by_constituency": [
+    {"name": "Ynys Môn", "ons_code": "W07000041", "signature_count": 10},
+    {"name": "Aberavon", "ons_code": "W07000049", "signature_count": 1e2}],
+  "other": {"signatures_by_constituency": []}}}}'''
+
+
+@pytest.fixture(params=['stdlib', 'ijson'])
+def implementation(request, monkeypatch):
+    if request.param == 'stdlib':
+        monkeypatch.setattr(petition_stream, 'ijson', None)
+    elif petition_stream.ijson is None:
+        pytest.skip('ijson not installed')
+    return request.param
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1, 7, 4096])
+def test_matches_json_module(implementation, monkeypatch, chunk_size):
+    if chunk_size:
+        monkeypatch.setattr(petition_stream, 'CHUNK_SIZE', chunk_size)
+    for filename in SAMPLE_FILES[:2] if chunk_size == 1 else SAMPLE_FILES:
+        with open(filename, 'rb') as inputstream:
+            raw = inputstream.read()
+        petition_data = json.loads(raw.decode('utf-8'))
+        attributes = petition_data['data']['attributes']
+        expected = dict((z, attributes[z]) for z in PETITION_FIELDS)
+        assert extract_fields(filename) == expected
+        assert extract_fields(raw) == expected
+        assert extract_fields(io.BytesIO(raw)) == expected
+        assert extract_fields(raw.decode('utf-8')) == expected
+        assert extract_petition_data(filename) == \
+            process_petition_data(petition_data)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 4096])
+def test_tricky_json(implementation, monkeypatch, chunk_size):
+    monkeypatch.setattr(petition_stream, 'CHUNK_SIZE', chunk_size)
+    attributes = json.loads(TRICKY_JSON)['data']['attributes']
+    for source in (TRICKY_JSON, TRICKY_JSON.encode('utf-8')):
+        found = extract_fields(source)
+        assert found == dict((z, attributes[z]) for z in PETITION_FIELDS)
+        assert found['signature_count'] == 6103056
+    assert extract_fields(TRICKY_JSON, ['action']) == \
+        {'action': attributes['action']}
+
+
+def test_stops_once_fields_found(monkeypatch):
+    monkeypatch.setattr(petition_stream, 'ijson', None)
+    # Rubbish after the fields isn't read
+    source = TRICKY_JSON[:TRICKY_JSON.index('"other"')] + '!!! not JSON'
+    assert extract_fields(source, ['updated_at']) == \
+        {'updated_at': '2019-04-01T12:00:00.000Z'}
+    assert extract_petition_data(source)[0] == 6103056
+
+
+def test_errors(implementation):
+    with pytest.raises(PetitionFormatError):
+        extract_petition_data('{"data": {"attributes": {"updated_at": "x"}}}')
+    if implementation == 'stdlib':
+        with pytest.raises(PetitionFormatError):
+            extract_fields(TRICKY_JSON[:TRICKY_JSON.index('"updated_at"') + 20])
+        with pytest.raises(PetitionFormatError):
+            extract_fields('{"data": {"attributes": {"updated_at": tru')
+    assert extract_fields('{"data": {"attributes": {}}}') == {}
@@ -0,0 +1,152 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import regions
+from regions import (build_identity_index, load_identity_index,
+                     constituency_name_to_region, identity_aliases,
+                     region_service, load_region_data, RegionService,
+                     DEFAULT_CONSTITUENCY_CSV, DEFAULT_REGION_FILE,
+                     COUNTRIES_WITHOUT_REGIONS)
+from constituency import load_constituencies_from_admin_csv
+
+
+@pytest.fixture(scope='module')
+def index():
+    return build_identity_index()
+
+
+def test_every_alias_finds_its_constituency(index):
+    cons = load_constituencies_from_admin_csv(
+        DEFAULT_CONSTITUENCY_CSV, region_service().name_to_region(), quiet=True)
+    assert len(index) == len(cons)
+    for con in cons:
+        ident = index.lookup(con.ons_code)
+        assert (ident.ons_code, ident.pa_number, ident.name, ident.region) == \
+            (con.ons_code, con.pa_number, con.name, con.region)
+        for alias in identity_aliases(ident):
+            assert alias in index
+            assert index.lookup(alias) is ident
+    assert index.get('No Such Place') is None
+    with pytest.raises(KeyError):
+        index.lookup('No Such Place')
+
+
+def test_region_map_matches_legacy_mapping(index):
+    region_map = index.region_map()
+    legacy = constituency_name_to_region(region_service().region_data(),
+                                         key_mappings=index.id_mappings())
+    for alias, region in legacy.items():
+        assert region_map[alias] == region
+    # The legacy mapping only has the countries that have regions, whereas
+    # the rest are their own region
+    for alias in set(region_map) - set(legacy):
+        assert region_map[alias] in COUNTRIES_WITHOUT_REGIONS
+
+
+def test_id_mappings(index):
+    mappings = index.id_mappings()
+    ident = index.identities[0]
+    assert mappings[ident.ons_code] == mappings[ident.slug] == \
+        [ident.name, ident.slug, ident.ons_code, str(ident.pa_number)]
+
+
+def test_load_identity_index_is_rebuilt_when_inputs_change(tmp_path, monkeypatch):
+    constituency_csv = str(tmp_path / 'constituencies.csv')
+    region_file = str(tmp_path / 'regions.json')
+    shutil.copy(DEFAULT_CONSTITUENCY_CSV, constituency_csv)
+    shutil.copy(DEFAULT_REGION_FILE, region_file)
+    cache_dir = str(tmp_path / 'cache')
+    builds = []
+    original_cached = regions.cached
+    def cached(label, input_files, builder):
+        def counting_builder():
+            builds.append(label)
+            return builder()
+        return original_cached(label, input_files, counting_builder,
+                               cache_dir=cache_dir)
+    monkeypatch.setattr(regions, 'cached', cached)
+    monkeypatch.setattr(regions, '_identity_indexes', {})
+
+    index = load_identity_index(constituency_csv, region_file)
+    assert load_identity_index(constituency_csv, region_file) is index
+    # From the snapshot in a "new process"
+    monkeypatch.setattr(regions, '_identity_indexes', {})
+    assert len(load_identity_index(constituency_csv, region_file)) == len(index)
+    assert len(builds) == 1
+
+    with open(constituency_csv) as inputstream:
+        lines = inputstream.readlines()
+    with open(constituency_csv, 'w') as outputstream:
+        # Drop the last constituency, keeping the blank line after it
+        outputstream.writelines(lines[:-2] + lines[-1:])
+    monkeypatch.setattr(regions, '_identity_indexes', {})
+    assert len(load_identity_index(constituency_csv, region_file)) == len(index) - 1
+    assert len(builds) == 2
+
+
+@pytest.fixture
+def region_file(tmp_path):
+    region_file = str(tmp_path / 'regions.json')
+    shutil.copy(DEFAULT_REGION_FILE, region_file)
+    return region_file
+
+
+def test_region_service_is_shared_and_read_only(region_file):
+    service = region_service(region_file)
+    assert region_service(region_file) is service
+    data = service.region_data()
+    assert service.region_data() is data
+    with open(region_file) as inputstream:
+        raw = json.load(inputstream)
+    assert dict((k, list(v)) for k, v in data.items()) == raw
+    with pytest.raises(TypeError):
+        data['Nowhere'] = ()
+    with pytest.raises(AttributeError):
+        data[next(iter(data))].append('Nowhere')
+
+    with_countries = service.region_data(add_on_countries=True)
+    assert set(with_countries) == set(data) | set(COUNTRIES_WITHOUT_REGIONS)
+    assert service.name_to_region() is service.name_to_region()
+    alias_map = service.alias_to_region()
+    assert service.alias_to_region() is alias_map
+    with pytest.raises(TypeError):
+        alias_map['nowhere'] = 'Nowhere'
+
+
+def test_load_region_data_is_a_copy(region_file):
+    copy = load_region_data(region_file, add_on_countries=True)
+    view = region_service(region_file).region_data(add_on_countries=True)
+    assert copy == dict((k, list(v) if isinstance(v, tuple) else v)
+                        for k, v in view.items())
+    region = sorted(region_service(region_file).region_data())[0]
+    copy[region].append('Somewhere')
+    copy[COUNTRIES_WITHOUT_REGIONS[0]] = 'Nowhere'
+    copy['Nowhere'] = ['Somewhere']
+    assert 'Somewhere' not in view[region]
+    assert view[COUNTRIES_WITHOUT_REGIONS[0]] == COUNTRIES_WITHOUT_REGIONS[0]
+    assert 'Nowhere' not in view
+    assert load_region_data(region_file, add_on_countries=True) != copy
+
+
+def test_region_service_reloads_changed_file(region_file):
+    service = RegionService(region_file)
+    data = service.region_data()
+    alias_map = service.alias_to_region()
+    with open(region_file) as inputstream:
+        raw = json.load(inputstream)
+    region = sorted(raw)[0]
+    moved = raw[region].pop()
+    raw.setdefault('Elsewhere', []).append(moved)
+    with open(region_file, 'w') as outputstream:
+        json.dump(raw, outputstream)
+    mtime = os.path.getmtime(region_file)
+    os.utime(region_file, (mtime + 10, mtime + 10))
+
+    reloaded = service.region_data()
+    assert reloaded is not data
+    assert moved not in reloaded[region]
+    assert reloaded['Elsewhere'] == tuple(raw['Elsewhere'])
+    assert service.alias_to_region() is not alias_map
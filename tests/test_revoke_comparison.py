@@ -0,0 +1,107 @@
+import glob
+import os
+import threading
+
+import pytest
+
+import revoke_comparison
+from revoke_comparison import RowRenderer, get_static_datasets, iter_process
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'source_data')
+SAMPLE_FILES = sorted(glob.glob(os.path.join(SOURCE_DIR, '241584_AsAt*.json')))
+
+
+@pytest.fixture
+def datasets():
+    return get_static_datasets()
+
+
+def render_all(renderer, election_data, sigs_by_ons):
+    return [renderer.render(z, sigs_by_ons[z.constituency.ons_code])
+            for z in election_data]
+
+
+def test_unchanged_rows_are_reused(datasets):
+    election_data, euref_data = datasets
+    renderer = RowRenderer(euref_data)
+    sigs = dict((z.constituency.ons_code, 1000 + i)
+                for i, z in enumerate(election_data))
+    first = render_all(renderer, election_data, sigs)
+    assert renderer.rendered == len(election_data)
+
+    second = render_all(renderer, election_data, sigs)
+    assert renderer.rendered == len(election_data)
+    assert all(a is b for a, b in zip(first, second))
+
+
+def test_only_changed_rows_are_rendered(datasets, monkeypatch):
+    election_data, euref_data = datasets
+    renderer = RowRenderer(euref_data)
+    prefixes = []
+    original_prefix = renderer._prefix
+    def counting_prefix(conres):
+        prefixes.append(conres.constituency.ons_code)
+        return original_prefix(conres)
+    monkeypatch.setattr(renderer, '_prefix', counting_prefix)
+
+    sigs = dict((z.constituency.ons_code, 1000) for z in election_data)
+    render_all(renderer, election_data, sigs)
+    changed = election_data[3].constituency.ons_code
+    sigs[changed] = 123456
+    rows = render_all(renderer, election_data, sigs)
+
+    assert renderer.rendered == len(election_data) + 1
+    # The parts that don't depend on the signatures are only rendered once
+    assert len(prefixes) == len(election_data)
+    # Same as rendering from scratch
+    assert rows == render_all(RowRenderer(euref_data), election_data, sigs)
+    assert '<td class="numeric">123456</td>' in rows[3]
+
+
+def page(petition_file):
+    return ''.join(iter_process(petition_file=petition_file, html_output=True,
+                                include_all=True, embed=False))
+
+
+def test_page_with_cached_rows_matches_a_fresh_render(monkeypatch):
+    monkeypatch.setattr(revoke_comparison, '_row_renderer', None)
+    page(SAMPLE_FILES[0])
+    renderer = revoke_comparison.get_row_renderer()
+    rendered = renderer.rendered
+    with_cached_rows = page(SAMPLE_FILES[-1])
+    assert renderer.rendered > rendered
+
+    monkeypatch.setattr(revoke_comparison, '_row_renderer', None)
+    assert page(SAMPLE_FILES[-1]) == with_cached_rows
+
+
+def test_static_datasets_are_loaded_once(monkeypatch):
+    calls = []
+    original_load_election = revoke_comparison.load_election
+    def load_election(year):
+        calls.append(year)
+        return original_load_election(year)
+    monkeypatch.setattr(revoke_comparison, 'load_election', load_election)
+    monkeypatch.setattr(revoke_comparison, '_static_datasets', None)
+    monkeypatch.setattr(revoke_comparison, '_row_renderer', None)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_static_datasets()))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == [revoke_comparison.GE_YEAR]
+    election_data, euref_data = results[0]
+    assert all(z is results[0] for z in results)
+    assert set(euref_data) == set(z.constituency.ons_code for z in election_data)
+    for conres in election_data:
+        assert euref_data[conres.constituency.ons_code] is conres.constituency.euref
+
+    # Rendering pages doesn't load them again
+    for petition_file in SAMPLE_FILES[:2]:
+        list(iter_process(petition_file=petition_file, html_output=True))
+    assert calls == [revoke_comparison.GE_YEAR]
+    assert revoke_comparison.get_row_renderer().euref_data is euref_data
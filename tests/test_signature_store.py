@@ -0,0 +1,69 @@
+import os
+
+from signature_store import SignatureStore, COUNTS_FILE, TIMES_FILE
+
+ONS_CODES = ['E14000001', 'E14000002', 'W07000041']
+
+
+def make_store(directory, rows=3):
+    store = SignatureStore(str(directory), ons_codes=ONS_CODES)
+    for i in range(rows):
+        assert store.append(1000 * (i + 1), 10 * (i + 1),
+                            {'E14000001': i, 'E14000002': 2 * i, 'W07000041': 3 * i})
+    store.close()
+    return store
+
+
+def chop(path, num_bytes):
+    with open(path, 'ab') as outputstream:
+        outputstream.truncate(os.path.getsize(path) - num_bytes)
+
+
+def test_append_and_read(tmp_path):
+    make_store(tmp_path)
+    store = SignatureStore(str(tmp_path))
+    assert len(store) == 3
+    assert list(store.times()) == [1000, 2000, 3000]
+    assert list(store.totals()) == [10, 20, 30]
+    assert store.snapshot(-1) == {'E14000001': 2, 'E14000002': 4, 'W07000041': 6}
+    assert store.series('W07000041') == [(1000, 0), (2000, 3), (3000, 6)]
+    assert not store.append(3000, 40, {})
+
+
+def test_recovers_from_partial_counts_row(tmp_path):
+    make_store(tmp_path)
+    # Part of the last row's counts, so no longer a multiple of the item size
+    chop(os.path.join(str(tmp_path), COUNTS_FILE), 5)
+
+    store = SignatureStore(str(tmp_path))
+    assert len(store) == 2
+    assert list(store.times()) == [1000, 2000]
+    assert store.append(5000, 50, {'E14000001': 7})
+    assert len(store) == 3
+
+    store = SignatureStore(str(tmp_path))
+    assert list(store.times()) == [1000, 2000, 5000]
+    assert list(store.totals()) == [10, 20, 50]
+    assert store.snapshot(1) == {'E14000001': 1, 'E14000002': 2, 'W07000041': 3}
+    assert store.snapshot(2) == {'E14000001': 7, 'E14000002': 0, 'W07000041': 0}
+    for filename, row_size in ((COUNTS_FILE, 4 * len(ONS_CODES)), (TIMES_FILE, 8)):
+        assert os.path.getsize(os.path.join(str(tmp_path), filename)) == 3 * row_size
+
+
+def test_recovers_from_partial_time(tmp_path):
+    make_store(tmp_path)
+    chop(os.path.join(str(tmp_path), TIMES_FILE), 3)
+
+    store = SignatureStore(str(tmp_path))
+    assert len(store) == 2
+    assert store.append(2500, 25, {'E14000002': 1})
+    assert list(SignatureStore(str(tmp_path)).times()) == [1000, 2000, 2500]
+
+
+def test_constituencies_first_seen_later_are_kept(tmp_path):
+    store = SignatureStore(str(tmp_path), ons_codes=ONS_CODES)
+    # First snapshot only has some of the constituencies
+    store.append(1000, 5, {'E14000001': 5})
+    store.append(2000, 9, {'E14000001': 6, 'W07000041': 3})
+    assert store.ons_codes == sorted(ONS_CODES)
+    assert store.snapshot(1) == {'E14000001': 6, 'E14000002': 0, 'W07000041': 3}